@@ -0,0 +1,210 @@
+"""
+Native async versions of the routing-bound trip endpoints.
+
+These run on the ASGI stack (trip_logger.asgi). Upstream routing calls are
+awaited on a shared async HTTP client and fuel-position probes are issued
+concurrently, so one process can hold many in-flight routing requests.
+Database work is delegated to sync_to_async.
+
+Requests are wrapped in a DRF Request with the configured parsers,
+authenticators and permission classes, and responses are built by
+api.responses, so these endpoints behave like their TripViewSet
+counterparts (?since= deltas, ETags and ?async= background planning).
+"""
+import traceback
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from rest_framework import exceptions
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from .fuel import async_find_best_fuel_stop
+from .jobs import enqueue_new_trip, planning_in_progress
+from .models import Trip
+from .planning import (
+    ROUTE_PARAMS,
+    PlanningError,
+    apply_route_plan,
+    candidate_coordinates,
+    coordinates_of,
+    create_planned_trip,
+    fuel_candidates_from_request,
+    place_fuel_stop,
+    resolve_locations,
+    route_waypoints,
+)
+from .responses import (
+    plan_job_payload,
+    requested_since,
+    trip_payload,
+    trip_response_data,
+    wants_async_planning,
+)
+from .routing import RoutingError, async_fetch_route
+from .serializers import FuelCandidatesSerializer, TripCreateSerializer
+from .versioning import etag_for
+
+
+def _drf_request(request):
+    """request wrapped as an APIView would, with the default parsers and authenticators"""
+    return Request(
+        request,
+        parsers=[parser() for parser in api_settings.DEFAULT_PARSER_CLASSES],
+        authenticators=[
+            authenticator() for authenticator in api_settings.DEFAULT_AUTHENTICATION_CLASSES
+        ],
+    )
+
+
+def _check_permissions(request):
+    """
+    Authenticate request and apply the default permission classes, like
+    APIView.initial(). Raises an APIException when access is refused.
+    """
+    for permission_class in api_settings.DEFAULT_PERMISSION_CLASSES:
+        permission = permission_class()
+        if not permission.has_permission(request, None):
+            if request.authenticators and not request.successful_authenticator:
+                raise exceptions.NotAuthenticated()
+            raise exceptions.PermissionDenied(getattr(permission, "message", None))
+
+
+def _get_trip(pk, user):
+    return (
+        Trip.objects.select_related(
+            "current_location", "pickup_location", "dropoff_location", "fuel_stop"
+        )
+        .filter(pk=pk, created_by=user)
+        .first()
+    )
+
+
+def _error(message, status):
+    return JsonResponse({"error": message}, status=status)
+
+
+async def _authenticated_json(request):
+    """Returns (DRF request, error_response) for a JSON POST"""
+    try:
+        if request.method != "POST":
+            raise exceptions.MethodNotAllowed(request.method)
+        request = _drf_request(request)
+        await sync_to_async(_check_permissions)(request)
+        # Parse the body now so a malformed one is reported here
+        request.data
+    except exceptions.APIException as e:
+        return None, JsonResponse({"detail": e.detail}, status=e.status_code)
+    return request, None
+
+
+def _trip_response(trip, request):
+    """Full or ?since= delta response for trip, as TripViewSet._trip_response"""
+    response_data = trip_response_data(trip, requested_since(request), {"request": request})
+    return JsonResponse(response_data, headers={"ETag": etag_for(response_data["version"])})
+
+
+async def create_trip(request):
+    """Async counterpart of TripViewSet.create"""
+    request, error = await _authenticated_json(request)
+    if error:
+        return error
+
+    serializer = TripCreateSerializer(data=request.data)
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=400)
+
+    try:
+        validated_data = serializer.validated_data
+        locations_data = validated_data["locations"]
+        current_cycle_hours = validated_data["current_cycle_hours"]
+        slugs = [location_data.get("slug", "") for location_data in locations_data]
+
+        try:
+            locations = await sync_to_async(resolve_locations)(locations_data)
+        except PlanningError as e:
+            return _error(str(e), 400)
+
+        if wants_async_planning(request):
+            # Route fetching and stop generation run in the worker pool
+            trip, job = await sync_to_async(enqueue_new_trip)(
+                request.user, locations, slugs, current_cycle_hours
+            )
+            return JsonResponse(plan_job_payload(trip, job, request), status=202)
+
+        try:
+            route_data = await async_fetch_route(coordinates_of(locations), ROUTE_PARAMS)
+            trip = await sync_to_async(create_planned_trip)(
+                request.user, locations, slugs, current_cycle_hours, route_data
+            )
+        except RoutingError as e:
+            return _error(str(e), 500)
+        except PlanningError as e:
+            return _error(str(e), 400)
+
+        payload = await sync_to_async(trip_payload)(trip)
+        return JsonResponse(payload, status=201)
+
+    except Exception as e:
+        print(f"Error in async create: {str(e)}")
+        print(f"Traceback: {traceback.format_exc()}")
+        return _error(f"Failed to create trip: {str(e)}", 500)
+
+
+async def plan_route(request, pk):
+    """Async counterpart of TripViewSet.plan_route"""
+    request, error = await _authenticated_json(request)
+    if error:
+        return error
+
+    try:
+        trip = await sync_to_async(_get_trip)(pk, request.user)
+        if trip is None:
+            return JsonResponse({"detail": "Not found."}, status=404)
+
+        # If route already exists, return it
+        if trip.route:
+            return await sync_to_async(_trip_response)(trip, request)
+
+        # Planning it here too would race the job's save_trip_plan()
+        if await sync_to_async(planning_in_progress)(trip):
+            return _error("Trip is being planned in the background", 409)
+
+        fuel_serializer = FuelCandidatesSerializer(data=request.data)
+        if not fuel_serializer.is_valid():
+            return JsonResponse(fuel_serializer.errors, status=400)
+
+        waypoints = route_waypoints(trip)
+
+        fuel_candidates = fuel_candidates_from_request(fuel_serializer.validated_data)
+        if fuel_candidates:
+            best = await async_find_best_fuel_stop(
+                coordinates_of(location for _, location in waypoints),
+                candidate_coordinates(fuel_candidates),
+            )
+            await sync_to_async(place_fuel_stop)(trip, waypoints, fuel_candidates, best)
+
+        try:
+            route_data = await async_fetch_route(
+                coordinates_of(location for _, location in waypoints), ROUTE_PARAMS
+            )
+            await sync_to_async(apply_route_plan)(trip, waypoints, route_data)
+        except RoutingError as e:
+            return _error(str(e), 500)
+        except PlanningError as e:
+            return _error(str(e), 400)
+
+        return await sync_to_async(_trip_response)(trip, request)
+
+    except Exception as e:
+        print(f"Error in async plan_route: {str(e)}")
+        print(f"Traceback: {traceback.format_exc()}")
+        return _error(f"Failed to plan route: {str(e)}", 500)
+
+
+# Like APIView, leave CSRF to the authenticators: SessionAuthentication
+# enforces it when configured, token authentication needs none. Django
+# 4.2's csrf_exempt decorator does not support coroutines, so mark the
+# views directly.
+create_trip.csrf_exempt = True
+plan_route.csrf_exempt = True
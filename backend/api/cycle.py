@@ -0,0 +1,221 @@
+"""
+Rolling 70-hour / 8-day cycle ledger.
+
+Duty status changes are folded into DutyDay rows: per log sheet and
+calendar day, the on-duty and driving hours of every closed interval (a
+status lasts until the next change on the same sheet). Saving or deleting
+one change adds its delta to the days of the intervals around it; bulk
+writes rebuild the sheet's rows. Cycle totals and the recap read at most
+CYCLE_DAYS rows per log sheet through the (driver, day) index.
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from django.db import transaction
+from django.db.models import ExpressionWrapper, F, FloatField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .hos import MAX_CYCLE_HOURS
+from .models import DutyDay, DutyStatusChange, LogSheet, Trip
+
+CYCLE_DAYS = 8  # Days in the rolling cycle window
+
+ON_DUTY_STATUSES = {"driving", "onDuty"}
+
+
+def hours_by_day(changes):
+    """
+    {date: (on-duty hours, driving hours)} for (time, status) pairs sorted
+    by time. Intervals crossing midnight are split in the current time zone.
+    """
+    days = defaultdict(lambda: [0.0, 0.0])
+    for (start, duty_status), (end, _) in zip(changes, changes[1:]):
+        if duty_status not in ON_DUTY_STATUSES:
+            continue
+        start = timezone.localtime(start)
+        end = timezone.localtime(end)
+        while start < end:
+            midnight = timezone.make_aware(
+                datetime.combine(start.date() + timedelta(days=1), datetime.min.time())
+            )
+            until = min(end, midnight)
+            hours = (until - start).total_seconds() / 3600
+            days[start.date()][0] += hours
+            if duty_status == "driving":
+                days[start.date()][1] += hours
+            start = until
+    return {day: tuple(values) for day, values in days.items()}
+
+
+def _driver_id(log_sheet_id):
+    return (
+        LogSheet.objects.filter(pk=log_sheet_id)
+        .values_list("trip__created_by_id", flat=True)
+        .first()
+    )
+
+
+def record_log_sheet(log_sheet_id):
+    """Rebuild the DutyDay rows of one log sheet from its duty status changes"""
+    driver_id = _driver_id(log_sheet_id)
+    if driver_id is None:
+        return
+
+    changes = list(
+        DutyStatusChange.objects.filter(log_sheet_id=log_sheet_id)
+        .order_by("time")
+        .values_list("time", "status")
+    )
+    with transaction.atomic():
+        DutyDay.objects.filter(log_sheet_id=log_sheet_id).delete()
+        DutyDay.objects.bulk_create(
+            DutyDay(
+                driver_id=driver_id,
+                log_sheet_id=log_sheet_id,
+                day=day,
+                on_duty_hours=on_duty,
+                driving_hours=driving,
+            )
+            for day, (on_duty, driving) in hours_by_day(changes).items()
+        )
+
+
+def _change_hours(log_sheet_id, time, duty_status, exclude_id=None):
+    """
+    {date: [on-duty hours, driving hours]} a change at time adds to its
+    sheet: the intervals it closes and opens, minus the one it splits.
+    exclude_id leaves the change's own row out of the neighbour lookup.
+    """
+    others = DutyStatusChange.objects.filter(log_sheet_id=log_sheet_id).exclude(pk=exclude_id)
+    before = others.filter(time__lte=time).order_by("-time").values_list("time", "status").first()
+    after = others.filter(time__gt=time).order_by("time").values_list("time", "status").first()
+
+    delta = defaultdict(lambda: [0.0, 0.0])
+    intervals = []
+    if before:
+        intervals.append(([before, (time, duty_status)], 1))
+    if after:
+        intervals.append(([(time, duty_status), after], 1))
+    if before and after:
+        intervals.append(([before, after], -1))
+    for changes, sign in intervals:
+        for day, (on_duty, driving) in hours_by_day(changes).items():
+            delta[day][0] += sign * on_duty
+            delta[day][1] += sign * driving
+    return delta
+
+
+def record_change(log_sheet_id, removed=None, added=None, exclude_id=None):
+    """
+    Apply one duty status change to its sheet's DutyDay rows.
+
+    removed and added are the (time, status) the change had before and has
+    now; removed is None for a new change and added None for a deleted one.
+    Only the days covered by the intervals next to the change are touched,
+    however long the sheet is.
+    """
+    delta = defaultdict(lambda: [0.0, 0.0])
+    for change, sign in ((removed, -1), (added, 1)):
+        if change is None:
+            continue
+        for day, (on_duty, driving) in _change_hours(log_sheet_id, *change, exclude_id).items():
+            delta[day][0] += sign * on_duty
+            delta[day][1] += sign * driving
+    delta = {day: values for day, values in delta.items() if any(values)}
+    if not delta:
+        return
+
+    driver_id = _driver_id(log_sheet_id)
+    if driver_id is None:
+        return
+
+    with transaction.atomic():
+        days = DutyDay.objects.filter(log_sheet_id=log_sheet_id, day__in=delta)
+        existing = set(days.values_list("day", flat=True))
+        for day in existing:
+            on_duty, driving = delta[day]
+            days.filter(day=day).update(
+                on_duty_hours=F("on_duty_hours") + on_duty,
+                driving_hours=F("driving_hours") + driving,
+                # Bulk updates bypass auto_now
+                updated_at=timezone.now(),
+            )
+        DutyDay.objects.bulk_create(
+            DutyDay(
+                driver_id=driver_id,
+                log_sheet_id=log_sheet_id,
+                day=day,
+                on_duty_hours=on_duty,
+                driving_hours=driving,
+            )
+            for day, (on_duty, driving) in delta.items()
+            if day not in existing
+        )
+
+
+def _window(driver, last_day, days):
+    return DutyDay.objects.filter(
+        driver=driver,
+        day__gt=last_day - timedelta(days=days),
+        day__lte=last_day,
+    )
+
+
+def cycle_hours(driver, on=None):
+    """On-duty hours in the CYCLE_DAYS days ending on the given date (default today)"""
+    on = on or timezone.localdate()
+    total = _window(driver, on, CYCLE_DAYS).aggregate(total=Sum("on_duty_hours"))["total"]
+    return total or 0.0
+
+
+def trip_cycle_hours(trip):
+    """
+    Cycle hours for log sheets of a trip: the hours the driver entered when
+    planning it plus what has been logged on the trip since.
+    """
+    logged = DutyDay.objects.filter(log_sheet__trip=trip).aggregate(
+        total=Sum("on_duty_hours")
+    )["total"]
+    return trip.current_cycle_hours + (logged or 0.0)
+
+
+def trip_cycle_hours_expression(trip_ref="trip_id"):
+    """trip_cycle_hours() as an SQL expression for the trip at OuterRef(trip_ref)"""
+    entered = Trip.objects.filter(pk=OuterRef(trip_ref)).values("current_cycle_hours")[:1]
+    logged = (
+        DutyDay.objects.filter(log_sheet__trip_id=OuterRef(trip_ref))
+        .order_by()
+        .values("log_sheet__trip_id")
+        .annotate(total=Sum("on_duty_hours"))
+        .values("total")[:1]
+    )
+    return ExpressionWrapper(
+        Subquery(entered) + Coalesce(Subquery(logged), Value(0.0)),
+        output_field=FloatField(),
+    )
+
+
+def recap(driver, on=None):
+    """
+    Per-day on-duty hours for the cycle window ending on the given date,
+    with the hours available today and tomorrow. One query.
+    """
+    on = on or timezone.localdate()
+    totals = dict(
+        _window(driver, on, CYCLE_DAYS)
+        .values("day")
+        .annotate(hours=Sum("on_duty_hours"))
+        .values_list("day", "hours")
+    )
+    days = [on - timedelta(days=offset) for offset in range(CYCLE_DAYS - 1, -1, -1)]
+    used = sum(totals.values())
+    # Tomorrow the oldest day drops out of the window
+    used_tomorrow = used - totals.get(days[0], 0.0)
+    return {
+        "date": on,
+        "days": [{"date": day, "on_duty_hours": totals.get(day, 0.0)} for day in days],
+        "cycle_hours": used,
+        "hours_available": max(MAX_CYCLE_HOURS - used, 0.0),
+        "hours_available_tomorrow": max(MAX_CYCLE_HOURS - used_tomorrow, 0.0),
+    }
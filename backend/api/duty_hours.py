@@ -0,0 +1,69 @@
+"""
+Duty hours for many log sheets at once.
+
+Every duty status lasts until the next change on the same log sheet; the
+last change of a sheet is still open and adds nothing. All changes are
+fetched in one query ordered by (log sheet, time), and the durations are
+summed per (sheet, status) with a NumPy diff and bincount.
+"""
+from datetime import timedelta
+
+import numpy as np
+
+from .models import DutyStatusChange
+from .versioning import EPOCH
+
+DUTY_STATUSES = [value for value, _ in DutyStatusChange.STATUS_CHOICES]
+
+MICROSECONDS_PER_HOUR = 3600 * 10 ** 6
+
+
+def empty_hours():
+    return {duty_status: 0 for duty_status in DUTY_STATUSES}
+
+
+def duty_hours(log_sheet_ids):
+    """
+    {log_sheet_id: {status: hours}} for the given log sheets, using one
+    query. Sheets without changes get zero hours for every status.
+    """
+    log_sheet_ids = list(log_sheet_ids)
+    hours = {log_sheet_id: empty_hours() for log_sheet_id in log_sheet_ids}
+    if not log_sheet_ids:
+        return hours
+
+    rows = list(
+        DutyStatusChange.objects.filter(log_sheet_id__in=log_sheet_ids)
+        .order_by("log_sheet_id", "time")
+        .values_list("log_sheet_id", "status", "time")
+    )
+    if len(rows) < 2:
+        return hours
+
+    sheet_ids, statuses, times = zip(*rows)
+    sheet_ids = np.asarray(sheet_ids)
+    status_codes = np.asarray([DUTY_STATUSES.index(value) for value in statuses])
+    micros = np.asarray([(time - EPOCH) // timedelta(microseconds=1) for time in times])
+
+    # A change is closed by the next one on the same sheet
+    closed = sheet_ids[:-1] == sheet_ids[1:]
+    durations = np.diff(micros)[closed] / MICROSECONDS_PER_HOUR
+
+    sheets, sheet_index = np.unique(sheet_ids[:-1][closed], return_inverse=True)
+    buckets = sheet_index * len(DUTY_STATUSES) + status_codes[:-1][closed]
+    totals = np.bincount(
+        buckets, weights=durations, minlength=len(sheets) * len(DUTY_STATUSES)
+    ).reshape(len(sheets), len(DUTY_STATUSES))
+
+    for log_sheet_id, row in zip(sheets.tolist(), totals.tolist()):
+        hours[log_sheet_id] = dict(zip(DUTY_STATUSES, row))
+    return hours
+
+
+def total_hours(hours_by_sheet):
+    """Per-status hours summed over the values of duty_hours()"""
+    totals = empty_hours()
+    for hours in hours_by_sheet.values():
+        for duty_status, value in hours.items():
+            totals[duty_status] += value
+    return totals
@@ -0,0 +1,244 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .routing import (
+    OSRM_TABLE_MAX_COORDINATES,
+    RoutingError,
+    async_fetch_distance_table,
+    async_fetch_route,
+    fetch_distance_table,
+    fetch_route,
+)
+
+METERS_PER_MILE = 1609.34
+
+# Assume average fuel consumption of 6 miles per gallon
+# and tank capacity of 100 gallons
+FUEL_EFFICIENCY = 6  # miles per gallon
+TANK_CAPACITY = 100  # gallons
+SAFETY_MARGIN = 0.2  # 20% safety margin
+
+# Upper bound on concurrent table/route requests issued for one plan
+MAX_ROUTE_PROBES = 8
+
+# Route probing is only a fallback; beyond this many candidate/position pairs
+# it would cost more than the plan is worth.
+MAX_FALLBACK_PROBES = 16
+
+
+def usable_range():
+    """Miles the truck can cover on a full tank while keeping the safety margin"""
+    return TANK_CAPACITY * FUEL_EFFICIENCY * (1 - SAFETY_MARGIN)
+
+
+def optimal_fuel_distance():
+    """Distance in miles at which the driver should ideally refuel"""
+    return usable_range() / 2
+
+
+def _candidate_chunks(route_coords, candidate_coords):
+    """Coordinate lists for table requests: the waypoints plus a chunk of candidates"""
+    chunk_size = max(1, OSRM_TABLE_MAX_COORDINATES - len(route_coords))
+    return [
+        list(route_coords) + list(candidate_coords[start:start + chunk_size])
+        for start in range(0, len(candidate_coords), chunk_size)
+    ]
+
+
+def _assemble_candidate_distances(tables, waypoint_count):
+    """
+    Combine per-chunk OSRM tables into (legs, to_candidate, from_candidate)
+    in meters, where legs[j] is waypoint j -> j + 1, to_candidate[j, c] is
+    waypoint j -> candidate c and from_candidate[c, j] is candidate c ->
+    waypoint j. Unroutable pairs are NaN.
+    """
+    matrices = [np.array(table["distances"], dtype=float) for table in tables]
+    first = matrices[0]
+    legs = first[np.arange(waypoint_count - 1), np.arange(1, waypoint_count)]
+    to_candidate = np.hstack([m[:waypoint_count, waypoint_count:] for m in matrices])
+    from_candidate = np.vstack([m[waypoint_count:, :waypoint_count] for m in matrices])
+    return legs, to_candidate, from_candidate
+
+
+def _fetch_candidate_distances(route_coords, candidate_coords):
+    """
+    Distance matrices between the route waypoints and every fuel candidate.
+
+    Candidates are split into chunks that fit in one OSRM table request
+    alongside the waypoints, and the chunks are fetched concurrently.
+    """
+    chunks = _candidate_chunks(route_coords, candidate_coords)
+    with ThreadPoolExecutor(max_workers=min(MAX_ROUTE_PROBES, len(chunks))) as pool:
+        tables = list(pool.map(fetch_distance_table, chunks))
+    return _assemble_candidate_distances(tables, len(route_coords))
+
+
+async def _async_fetch_candidate_distances(route_coords, candidate_coords):
+    """Async variant of _fetch_candidate_distances() using asyncio.gather"""
+    chunks = _candidate_chunks(route_coords, candidate_coords)
+    tables = await asyncio.gather(*(async_fetch_distance_table(chunk) for chunk in chunks))
+    return _assemble_candidate_distances(tables, len(route_coords))
+
+
+def score_fuel_insertions(legs, to_candidate, from_candidate):
+    """
+    Score every (candidate, insertion position) pair in one vectorized pass.
+
+    Position p means the fuel stop is inserted before waypoint p, so the
+    driver reaches it after the first p - 1 legs. The score is the distance
+    in miles from the ideal refuel point plus the detour the stop adds.
+    Pairs that exceed the usable tank range or cannot be routed score inf.
+    Returns an array of shape (candidates, positions) where column 0 is p = 1.
+    """
+    waypoint_count = len(legs) + 1
+    travelled = np.concatenate([[0.0], np.cumsum(legs)])[: waypoint_count - 1]
+
+    # Rows are candidates, columns are insertion positions 1..waypoint_count - 1
+    to_fuel = to_candidate[: waypoint_count - 1, :].T
+    from_fuel = from_candidate[:, 1:waypoint_count]
+
+    distance_to_fuel = (travelled[np.newaxis, :] + to_fuel) / METERS_PER_MILE
+    detour = (to_fuel + from_fuel - legs[np.newaxis, :]) / METERS_PER_MILE
+
+    scores = np.abs(distance_to_fuel - optimal_fuel_distance()) + np.maximum(detour, 0)
+    scores[distance_to_fuel > usable_range()] = np.inf
+    scores[np.isnan(scores)] = np.inf
+    return scores
+
+
+def _insertion_pairs(route_coords, candidate_coords):
+    return [
+        (candidate_index, position)
+        for candidate_index in range(len(candidate_coords))
+        for position in range(1, len(route_coords))
+    ]
+
+
+def _probe_coordinates(route_coords, candidate_coords, pair):
+    candidate_index, position = pair
+    test_coords = list(route_coords)
+    test_coords.insert(position, candidate_coords[candidate_index])
+    return test_coords
+
+
+def _route_legs(route_data):
+    if not route_data or not route_data.get("routes"):
+        return None
+    return route_data["routes"][0]["legs"]
+
+
+def _score_probes(candidate_coords, base_route, probes):
+    """
+    score_fuel_insertions() over distances read from probe routes.
+
+    base_route is the route without a fuel stop; probes are ((candidate_index,
+    position), route_data) pairs for the route with the candidate inserted at
+    position, whose legs on either side of it are the waypoint -> candidate
+    and candidate -> waypoint distances the tables would have given.
+    """
+    base_legs = _route_legs(base_route)
+    if base_legs is None:
+        return np.full((len(candidate_coords), 1), np.inf)
+
+    waypoint_count = len(base_legs) + 1
+    legs = np.array([leg["distance"] for leg in base_legs], dtype=float)
+    to_candidate = np.full((waypoint_count, len(candidate_coords)), np.nan)
+    from_candidate = np.full((len(candidate_coords), waypoint_count), np.nan)
+    for (candidate_index, position), route_data in probes:
+        probe_legs = _route_legs(route_data)
+        if probe_legs is None:
+            continue
+        to_candidate[position - 1, candidate_index] = probe_legs[position - 1]["distance"]
+        from_candidate[candidate_index, position] = probe_legs[position]["distance"]
+    return score_fuel_insertions(legs, to_candidate, from_candidate)
+
+
+def _score_positions_from_routes(route_coords, candidate_coords):
+    """Fallback: probe every insertion with concurrent route calls"""
+
+    def probe(coordinates):
+        try:
+            return fetch_route(coordinates, {"overview": "false"})
+        except RoutingError:
+            return None
+
+    pairs = _insertion_pairs(route_coords, candidate_coords)
+    lanes = [list(route_coords)] + [
+        _probe_coordinates(route_coords, candidate_coords, pair) for pair in pairs
+    ]
+    with ThreadPoolExecutor(max_workers=min(MAX_ROUTE_PROBES, len(lanes))) as pool:
+        base_route, *probes = pool.map(probe, lanes)
+    return _score_probes(candidate_coords, base_route, zip(pairs, probes))
+
+
+async def _async_score_positions_from_routes(route_coords, candidate_coords):
+    """Async fallback: probe every insertion concurrently with asyncio.gather"""
+    limit = asyncio.Semaphore(MAX_ROUTE_PROBES)
+
+    async def probe(coordinates):
+        async with limit:
+            try:
+                return await async_fetch_route(coordinates, {"overview": "false"})
+            except RoutingError:
+                return None
+
+    pairs = _insertion_pairs(route_coords, candidate_coords)
+    lanes = [list(route_coords)] + [
+        _probe_coordinates(route_coords, candidate_coords, pair) for pair in pairs
+    ]
+    base_route, *probes = await asyncio.gather(*map(probe, lanes))
+    return _score_probes(candidate_coords, base_route, zip(pairs, probes))
+
+
+def _best_insertion(scores):
+    if not np.isfinite(scores).any():
+        return None
+    candidate_index, column = np.unravel_index(np.argmin(scores), scores.shape)
+    return int(candidate_index), int(column) + 1
+
+
+def find_best_fuel_stop(route_coords, candidate_coords):
+    """
+    Pick the best fuel candidate and the index at which it should be inserted
+    into route_coords.
+
+    All candidates are scored from OSRM distance tables, so the number of
+    round-trips does not grow with the number of insertion positions. If the
+    table service fails and the search is small enough, insertions are
+    probed with concurrent route requests instead.
+    Returns (candidate_index, position), or None when nothing could be scored.
+    """
+    if not candidate_coords or len(route_coords) < 2:
+        return None
+
+    try:
+        scores = score_fuel_insertions(
+            *_fetch_candidate_distances(route_coords, candidate_coords)
+        )
+    except RoutingError as e:
+        print(f"Distance table unavailable: {e}")
+        if len(candidate_coords) * (len(route_coords) - 1) > MAX_FALLBACK_PROBES:
+            return None
+        scores = _score_positions_from_routes(route_coords, candidate_coords)
+
+    return _best_insertion(scores)
+
+
+async def async_find_best_fuel_stop(route_coords, candidate_coords):
+    """Async variant of find_best_fuel_stop() for the ASGI views"""
+    if not candidate_coords or len(route_coords) < 2:
+        return None
+
+    try:
+        scores = score_fuel_insertions(
+            *await _async_fetch_candidate_distances(route_coords, candidate_coords)
+        )
+    except RoutingError as e:
+        print(f"Distance table unavailable: {e}")
+        if len(candidate_coords) * (len(route_coords) - 1) > MAX_FALLBACK_PROBES:
+            return None
+        scores = await _async_score_positions_from_routes(route_coords, candidate_coords)
+
+    return _best_insertion(scores)
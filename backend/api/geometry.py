@@ -0,0 +1,201 @@
+"""
+Route geometry storage helpers.
+
+Route lines are kept out of Trip.route and stored separately as encoded
+polylines (Google's algorithm, 6 decimal places like OSRM's polyline6),
+which is several times smaller than GeoJSON coordinate arrays.
+"""
+import copy
+import math
+
+import numpy as np
+
+POLYLINE_PRECISION = 6
+
+METERS_PER_DEGREE = 111320
+
+EARTH_RADIUS_METERS = 6371008.8
+
+# Web-mercator ground resolution at zoom 0, in meters per pixel at the equator
+METERS_PER_PIXEL_AT_ZOOM_0 = 156543.03
+
+
+def _encode_value(value):
+    value = ~(value << 1) if value < 0 else value << 1
+    chunks = []
+    while value >= 0x20:
+        chunks.append(chr((0x20 | (value & 0x1F)) + 63))
+        value >>= 5
+    chunks.append(chr(value + 63))
+    return "".join(chunks)
+
+
+def encode_polyline(coordinates, precision=POLYLINE_PRECISION):
+    """Encode (longitude, latitude) pairs as a polyline string"""
+    factor = 10 ** precision
+    encoded = []
+    previous_lat = previous_lon = 0
+    for lon, lat in coordinates:
+        lat_value = int(round(lat * factor))
+        lon_value = int(round(lon * factor))
+        # Polylines store latitude first
+        encoded.append(_encode_value(lat_value - previous_lat))
+        encoded.append(_encode_value(lon_value - previous_lon))
+        previous_lat, previous_lon = lat_value, lon_value
+    return "".join(encoded)
+
+
+def decode_polyline(polyline, precision=POLYLINE_PRECISION):
+    """Decode a polyline string into [longitude, latitude] pairs"""
+    factor = 10 ** precision
+    coordinates = []
+    index = lat = lon = 0
+    values = []
+    while index < len(polyline):
+        result = shift = 0
+        while True:
+            byte = ord(polyline[index]) - 63
+            index += 1
+            result |= (byte & 0x1F) << shift
+            shift += 5
+            if byte < 0x20:
+                break
+        values.append(~(result >> 1) if result & 1 else result >> 1)
+        if len(values) == 2:
+            lat += values[0]
+            lon += values[1]
+            coordinates.append([lon / factor, lat / factor])
+            values = []
+    return coordinates
+
+
+def zoom_tolerance(zoom, latitude=0):
+    """Meters covered by one screen pixel at a web map zoom level"""
+    return METERS_PER_PIXEL_AT_ZOOM_0 * math.cos(math.radians(latitude)) / (2 ** zoom)
+
+
+def simplify(coordinates, tolerance_meters):
+    """
+    Douglas-Peucker simplification of (longitude, latitude) pairs.
+
+    Points are projected onto a local equirectangular plane so the
+    tolerance is in meters. The first and last points are always kept.
+    """
+    if tolerance_meters <= 0 or len(coordinates) < 3:
+        return [list(point) for point in coordinates]
+
+    points = np.asarray(coordinates, dtype=float)
+    scale = math.cos(math.radians(points[:, 1].mean()))
+    xy = np.column_stack((points[:, 0] * scale, points[:, 1])) * METERS_PER_DEGREE
+
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        segment = xy[end] - xy[start]
+        offsets = xy[start + 1:end] - xy[start]
+        length = math.hypot(*segment)
+        if length == 0:
+            distances = np.hypot(offsets[:, 0], offsets[:, 1])
+        else:
+            # Perpendicular distance of every interior point to the chord
+            distances = np.abs(segment[0] * offsets[:, 1] - segment[1] * offsets[:, 0]) / length
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance_meters:
+            split = start + 1 + farthest
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+
+    return points[keep].tolist()
+
+
+def haversine_meters(start, end):
+    """Great-circle distance between two (longitude, latitude) pairs"""
+    lon1, lat1 = map(math.radians, start)
+    lon2, lat2 = map(math.radians, end)
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = math.sin(dlat / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_METERS * math.asin(math.sqrt(a))
+
+
+def segment_lengths(coordinates):
+    """Meters between consecutive (longitude, latitude) points"""
+    points = np.asarray(coordinates, dtype=float).reshape(-1, 2)
+    if len(points) < 2:
+        return np.zeros(0)
+    deltas = np.diff(points, axis=0)
+    scale = np.cos(np.radians((points[:-1, 1] + points[1:, 1]) / 2))
+    return np.hypot(deltas[:, 0] * scale, deltas[:, 1]) * METERS_PER_DEGREE
+
+
+class RouteIndex:
+    """
+    Interpolation index over a route line.
+
+    Holds cumulative meters along the line and cumulative (driving seconds,
+    meters) at every OSRM step boundary, so the position after a given
+    driving time or distance is found by binary search instead of a walk
+    over the route. Step distances and the line's own length differ a
+    little, so distances are mapped onto the line proportionally.
+    """
+
+    def __init__(self, coordinates, legs):
+        self.points = np.asarray(coordinates, dtype=float).reshape(-1, 2)
+        self.line_distance = np.concatenate(([0.0], np.cumsum(segment_lengths(self.points))))
+        steps = [step for leg in legs for step in (leg.get("steps") or [leg])]
+        self.time = np.concatenate(([0.0], np.cumsum([step.get("duration", 0) for step in steps])))
+        self.distance = np.concatenate(([0.0], np.cumsum([step.get("distance", 0) for step in steps])))
+
+    def distance_at(self, elapsed):
+        """Meters driven after elapsed seconds of driving (scalar or array)"""
+        elapsed = np.clip(np.asarray(elapsed, dtype=float), 0, self.time[-1])
+        if len(self.time) < 2:
+            return np.zeros_like(elapsed)
+        i = np.clip(np.searchsorted(self.time, elapsed, side="right") - 1, 0, len(self.time) - 2)
+        span = self.time[i + 1] - self.time[i]
+        fraction = np.divide(elapsed - self.time[i], span, out=np.zeros_like(elapsed), where=span > 0)
+        return self.distance[i] + fraction * (self.distance[i + 1] - self.distance[i])
+
+    def position_at_distance(self, meters):
+        """[longitude, latitude] after driving meters along the route"""
+        if len(self.points) == 0:
+            raise ValueError("Route has no geometry")
+        if len(self.points) == 1 or self.line_distance[-1] == 0:
+            return self.points[0].tolist()
+        ratio = self.line_distance[-1] / self.distance[-1] if self.distance[-1] else 0.0
+        target = min(max(float(meters) * ratio, 0.0), self.line_distance[-1])
+        i = int(np.searchsorted(self.line_distance, target, side="right")) - 1
+        i = min(max(i, 0), len(self.points) - 2)
+        span = self.line_distance[i + 1] - self.line_distance[i]
+        fraction = (target - self.line_distance[i]) / span if span > 0 else 0.0
+        return (self.points[i] + fraction * (self.points[i + 1] - self.points[i])).tolist()
+
+    def position_at(self, elapsed):
+        """[longitude, latitude] after elapsed seconds of driving"""
+        return self.position_at_distance(self.distance_at(elapsed))
+
+
+def split_route_geometry(route_data):
+    """
+    Separate the line geometry from an OSRM route response.
+
+    Returns (route_data without geometries, coordinates of the first route).
+    Turn-by-turn steps are dropped as well: they are only needed while the
+    stops are planned, which happens on the full response, and stored legs
+    keep their summary, distance and duration. route_data itself is left
+    untouched.
+    """
+    stripped = copy.deepcopy(route_data)
+    coordinates = []
+    for index, route in enumerate(stripped.get("routes") or []):
+        geometry = route.pop("geometry", None)
+        if index == 0 and isinstance(geometry, dict):
+            coordinates = geometry.get("coordinates") or []
+        for leg in route.get("legs", []):
+            leg.pop("steps", None)
+    return stripped, coordinates
@@ -0,0 +1,212 @@
+"""
+Hours-of-service scheduler.
+
+Walks the per-step durations of an OSRM route once and lays out the
+driver's day: driving, 30-minute breaks, 10-hour rests, 34-hour restarts,
+fuel stops and the on-duty time at each waypoint, following the
+property-carrying rules:
+
+- at most 11 hours of driving after 10 consecutive hours off duty,
+- no driving after the 14th hour since coming on duty,
+- a 30-minute break after 8 hours of driving (any 30 minutes not
+  driving counts, e.g. a fuel stop or a pickup),
+- at most 70 on-duty hours in the cycle; a 34-hour restart resets it.
+
+Cycle hours already used are taken from the trip. Hours dropping off the
+rolling 8-day window during the trip are not credited back.
+"""
+from dataclasses import dataclass
+
+from .fuel import METERS_PER_MILE, usable_range
+
+MAX_DRIVING_HOURS = 11  # Maximum driving hours per day
+DUTY_WINDOW_HOURS = 14  # Driving must stop this long after coming on duty
+BREAK_AFTER_DRIVING_HOURS = 8  # Driving allowed before a 30-minute break
+BREAK_MINUTES = 30
+REQUIRED_REST_HOURS = 10  # Required rest hours per day
+MAX_CYCLE_HOURS = 70  # Maximum hours in cycle
+RESTART_HOURS = 34  # Off-duty hours that reset the cycle
+FUEL_STOP_MINUTES = 30
+
+HOUR = 3600
+
+# Times within this many seconds, and distances within this many meters, of
+# a limit count as reaching it
+TIME_EPSILON = 1e-6
+DISTANCE_EPSILON = 1e-3
+
+
+@dataclass
+class HOSEvent:
+    kind: str  # driving, break, rest, restart, fuel, or the waypoint stop type
+    start: float  # Seconds after the trip starts
+    duration: float  # Seconds
+    distance: float  # Meters driven since the trip started, when the event begins
+    driving_time: float  # Seconds driven since the trip started, when the event begins
+    cycle_hours: float  # On-duty hours used in the cycle, when the event begins
+    leg_index: int
+    step_index: int
+    waypoint_index: int = None  # Set on the stop at a route waypoint
+
+    @property
+    def end(self):
+        return self.start + self.duration
+
+
+class HOSScheduler:
+    """
+    One pass of the scheduler over a route.
+
+    run() takes the OSRM legs and, for the end of every leg, the
+    (stop_type, dwell seconds) of the waypoint reached there; waypoint
+    events carry waypoint_index = leg index + 1. fuel_interval_miles
+    defaults to the usable tank range from api.fuel.
+    """
+
+    def __init__(self, current_cycle_hours=0, fuel_interval_miles=None):
+        self.fuel_interval = (fuel_interval_miles or usable_range()) * METERS_PER_MILE
+        self.clock = 0.0
+        self.distance = 0.0
+        self.driving_time = 0.0
+        self.cycle = current_cycle_hours * HOUR
+        self.driving_since_rest = 0.0
+        self.window_since_rest = 0.0
+        self.driving_since_break = 0.0
+        self.distance_since_fuel = 0.0
+        self.events = []
+        self.leg_index = 0
+        self.step_index = 0
+
+    def _emit(self, kind, duration):
+        event = HOSEvent(
+            kind=kind,
+            start=self.clock,
+            duration=duration,
+            distance=self.distance,
+            driving_time=self.driving_time,
+            cycle_hours=self.cycle / HOUR,
+            leg_index=self.leg_index,
+            step_index=self.step_index,
+        )
+        self.events.append(event)
+        self.clock += duration
+        return event
+
+    def _rest(self):
+        self._emit("rest", REQUIRED_REST_HOURS * HOUR)
+        self.driving_since_rest = self.window_since_rest = self.driving_since_break = 0.0
+
+    def _restart(self):
+        self._emit("restart", RESTART_HOURS * HOUR)
+        self.cycle = 0.0
+        self.driving_since_rest = self.window_since_rest = self.driving_since_break = 0.0
+
+    def _not_driving(self, kind, duration):
+        """
+        Time stopped inside the duty window: waypoint work and fueling are
+        on duty and count toward the cycle, a break is off duty.
+        """
+        if kind != "break":
+            self.cycle += duration
+        event = self._emit(kind, duration)
+        self.window_since_rest += duration
+        if duration >= BREAK_MINUTES * 60:
+            self.driving_since_break = 0.0
+        return event
+
+    def _drive(self, duration, distance):
+        last = self.events[-1] if self.events else None
+        if last is not None and last.kind == "driving":
+            # Extend the current driving stretch instead of emitting a new one
+            last.duration += duration
+            self.clock += duration
+        else:
+            self._emit("driving", duration)
+        self.distance += distance
+        self.driving_time += duration
+        self.cycle += duration
+        self.driving_since_rest += duration
+        self.window_since_rest += duration
+        self.driving_since_break += duration
+        self.distance_since_fuel += distance
+
+    def _make_room(self, fuel_due=False):
+        """
+        Insert whatever stop the next second of driving requires. fuel_due
+        is set when the tank runs out within TIME_EPSILON at the current
+        speed, which a distance check alone can miss at high speeds.
+        """
+        if self.cycle >= MAX_CYCLE_HOURS * HOUR - TIME_EPSILON:
+            self._restart()
+        elif (
+            self.driving_since_rest >= MAX_DRIVING_HOURS * HOUR - TIME_EPSILON
+            or self.window_since_rest >= DUTY_WINDOW_HOURS * HOUR - TIME_EPSILON
+        ):
+            self._rest()
+        elif fuel_due or self.distance_since_fuel >= self.fuel_interval - DISTANCE_EPSILON:
+            self._not_driving("fuel", FUEL_STOP_MINUTES * 60)
+            self.distance_since_fuel = 0.0
+        elif self.driving_since_break >= BREAK_AFTER_DRIVING_HOURS * HOUR - TIME_EPSILON:
+            self._not_driving("break", BREAK_MINUTES * 60)
+
+    def drive_step(self, duration, distance):
+        """Drive one route step, stopping for rests, breaks and fuel inside it"""
+        remaining = duration
+        speed = distance / duration if duration > 0 else 0.0
+        if duration <= 0:
+            self.distance += distance
+            self.distance_since_fuel += distance
+            return
+
+        while remaining > TIME_EPSILON:
+            # Seconds of driving left before the tank range is used up
+            fuel_left = (
+                (self.fuel_interval - self.distance_since_fuel) / speed
+                if speed > 0
+                else float("inf")
+            )
+            allowed = min(
+                remaining,
+                MAX_DRIVING_HOURS * HOUR - self.driving_since_rest,
+                DUTY_WINDOW_HOURS * HOUR - self.window_since_rest,
+                BREAK_AFTER_DRIVING_HOURS * HOUR - self.driving_since_break,
+                MAX_CYCLE_HOURS * HOUR - self.cycle,
+                fuel_left,
+            )
+            if allowed <= TIME_EPSILON:
+                # Every limit above is matched by a check in _make_room, so
+                # each pass either drives or inserts a stop
+                self._make_room(fuel_due=fuel_left <= TIME_EPSILON)
+                continue
+            self._drive(allowed, allowed * speed)
+            remaining -= allowed
+
+    def arrive(self, stop_type, dwell, waypoint_index):
+        """On-duty time at the waypoint that ends the current leg"""
+        if stop_type == "fuel":
+            self.distance_since_fuel = 0.0
+        if dwell > 0 and self.cycle + dwell > MAX_CYCLE_HOURS * HOUR:
+            self._restart()
+        event = self._not_driving(stop_type, dwell)
+        event.waypoint_index = waypoint_index
+
+    def run(self, legs, stops):
+        for leg_index, (leg, (stop_type, dwell)) in enumerate(zip(legs, stops)):
+            self.leg_index = leg_index
+            steps = leg.get("steps") or [leg]
+            for step_index, step in enumerate(steps):
+                self.step_index = step_index
+                self.drive_step(step.get("duration", 0), step.get("distance", 0))
+            self.arrive(stop_type, dwell, leg_index + 1)
+        return self.events
+
+
+def schedule_trip(legs, stops, current_cycle_hours=0, fuel_interval_miles=None):
+    """
+    HOS events for driving the given OSRM legs, in order.
+
+    stops holds one (stop_type, dwell seconds) pair per leg for the
+    waypoint at its end. Runs in one linear pass over the steps.
+    """
+    scheduler = HOSScheduler(current_cycle_hours, fuel_interval_miles)
+    return scheduler.run(legs, stops)
@@ -0,0 +1,132 @@
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .models import Location, TripPlanJob
+from .planning import PlanningError, build_trip, build_trip_plan
+from .routing import RoutingError
+
+# Statuses of jobs that still expect a worker to pick them up or finish them
+PENDING_STATUSES = ("queued", "running")
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Per-process worker pool for background trip planning"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, "TRIP_PLANNING_WORKERS", 4),
+                    thread_name_prefix="trip-planning",
+                )
+    return _executor
+
+
+def _update_job(job, **fields):
+    for name, value in fields.items():
+        setattr(job, name, value)
+    job.save(update_fields=[*fields, "updated_at"])
+
+
+def fail_stale_jobs(jobs=None):
+    """
+    Mark pending jobs that have not reported progress within
+    TRIP_PLAN_JOB_TIMEOUT seconds as failed.
+
+    Jobs live in an in-process pool, so a restart loses them while their
+    rows stay queued or running. jobs narrows the check (default: all
+    jobs). Returns the number of jobs marked failed.
+    """
+    jobs = TripPlanJob.objects.all() if jobs is None else jobs
+    now = timezone.now()
+    cutoff = now - timedelta(seconds=getattr(settings, "TRIP_PLAN_JOB_TIMEOUT", 600))
+    return jobs.filter(status__in=PENDING_STATUSES, updated_at__lt=cutoff).update(
+        status="failed",
+        message="Planning interrupted",
+        error="The planning job stopped reporting progress; plan the trip again",
+        # Bulk updates bypass auto_now
+        updated_at=now,
+    )
+
+
+def planning_in_progress(trip):
+    """Whether a background job is still planning trip; stale jobs are failed first"""
+    fail_stale_jobs(trip.plan_jobs.all())
+    return trip.plan_jobs.filter(status__in=PENDING_STATUSES).exists()
+
+
+def run_plan_job(job_id, location_ids, slugs):
+    """Build the plan for a queued TripPlanJob and record its outcome"""
+    job = TripPlanJob.objects.select_related("trip").get(id=job_id)
+    if job.status != "queued":
+        # Marked failed by fail_stale_jobs() while waiting for a worker
+        return
+    locations_by_id = Location.objects.in_bulk(location_ids)
+    locations = [locations_by_id[location_id] for location_id in location_ids]
+
+    _update_job(job, status="running", progress=10, message="Planning started")
+    try:
+        build_trip_plan(
+            job.trip,
+            locations,
+            slugs,
+            progress=lambda percent, message: _update_job(
+                job, progress=percent, message=message
+            ),
+        )
+    except (RoutingError, PlanningError) as e:
+        _update_job(job, status="failed", message="Planning failed", error=str(e))
+        return
+    except Exception as e:
+        print(f"Error in plan job {job_id}: {str(e)}")
+        print(f"Traceback: {traceback.format_exc()}")
+        _update_job(job, status="failed", message="Planning failed", error=str(e))
+        return
+
+    _update_job(job, status="completed", progress=100, message="Trip planned")
+
+
+def _run_in_worker(job_id, location_ids, slugs):
+    # Worker threads own their DB connections; drop stale ones around each job
+    close_old_connections()
+    try:
+        run_plan_job(job_id, location_ids, slugs)
+    finally:
+        close_old_connections()
+
+
+def enqueue_plan_job(trip, locations, slugs):
+    """
+    Queue background planning for trip and return the TripPlanJob.
+
+    The job is handed to the worker pool once the surrounding transaction
+    commits, so workers never see a trip that is not yet visible. With
+    TRIP_PLANNING_WORKERS set to 0 the job runs inline instead.
+    """
+    job = TripPlanJob.objects.create(trip=trip, message="Queued")
+    location_ids = [location.id for location in locations]
+    slugs = list(slugs)
+
+    if getattr(settings, "TRIP_PLANNING_WORKERS", 4) == 0:
+        transaction.on_commit(lambda: run_plan_job(job.id, location_ids, slugs))
+    else:
+        transaction.on_commit(
+            lambda: get_executor().submit(_run_in_worker, job.id, location_ids, slugs)
+        )
+    return job
+
+
+def enqueue_new_trip(user, locations, slugs, current_cycle_hours):
+    """Save a new, unplanned trip and queue its planning. Returns (trip, job)"""
+    trip = build_trip(user, locations, current_cycle_hours)
+    trip.save()
+    return trip, enqueue_plan_job(trip, locations, slugs)
@@ -0,0 +1,159 @@
+import asyncio
+import math
+import time
+
+from .geometry import haversine_meters
+from .routing import RoutingProvider
+
+# Roads are never straight; scale great-circle distances to approximate
+# driving distances.
+ROAD_DETOUR_FACTOR = 1.2
+AVERAGE_SPEED_MPS = 80 * 1000 / 3600  # 80 km/h
+
+# Legs are broken into steps no longer than this so per-step consumers
+# (HOS planning, geometry interpolation) see realistic granularity.
+MAX_STEP_METERS = 20000
+
+
+def _interpolate(start, end, fraction):
+    return [
+        start[0] + (end[0] - start[0]) * fraction,
+        start[1] + (end[1] - start[1]) * fraction,
+    ]
+
+
+class LocalRoutingProvider(RoutingProvider):
+    """
+    In-process stand-in for OSRM.
+
+    Distances are great-circle distances scaled by ROAD_DETOUR_FACTOR and
+    durations assume a constant AVERAGE_SPEED_MPS. Responses have the same
+    shape as OSRM's so load tests and benchmarks can drive the real code
+    paths without a public router. Geometries are always GeoJSON.
+
+    latency (seconds) simulates the upstream round-trip: sync calls sleep,
+    async calls await, so benchmarks can compare how each stack overlaps it.
+    """
+
+    name = "local"
+
+    def __init__(
+        self,
+        detour_factor=ROAD_DETOUR_FACTOR,
+        speed_mps=AVERAGE_SPEED_MPS,
+        max_step_meters=MAX_STEP_METERS,
+        latency=0,
+    ):
+        self.detour_factor = detour_factor
+        self.speed_mps = speed_mps
+        self.max_step_meters = max_step_meters
+        self.latency = latency
+
+    def _distance(self, start, end):
+        return haversine_meters(start, end) * self.detour_factor
+
+    def _leg(self, start, end, with_steps):
+        distance = self._distance(start, end)
+        duration = distance / self.speed_mps
+        step_count = max(1, math.ceil(distance / self.max_step_meters))
+        points = [_interpolate(start, end, i / step_count) for i in range(step_count + 1)]
+
+        leg = {
+            "distance": distance,
+            "duration": duration,
+            "weight": duration,
+            "summary": "",
+            "steps": [],
+        }
+        if with_steps:
+            for i in range(step_count):
+                leg["steps"].append(
+                    {
+                        "distance": distance / step_count,
+                        "duration": duration / step_count,
+                        "weight": duration / step_count,
+                        "name": "",
+                        "mode": "driving",
+                        "geometry": {"type": "LineString", "coordinates": points[i:i + 2]},
+                        "maneuver": {
+                            "type": "depart" if i == 0 else "continue",
+                            "location": points[i],
+                        },
+                    }
+                )
+            leg["steps"].append(
+                {
+                    "distance": 0,
+                    "duration": 0,
+                    "weight": 0,
+                    "name": "",
+                    "mode": "driving",
+                    "geometry": {"type": "LineString", "coordinates": [points[-1], points[-1]]},
+                    "maneuver": {"type": "arrive", "location": points[-1]},
+                }
+            )
+        return leg, points
+
+    def route(self, coordinates, params):
+        if self.latency:
+            time.sleep(self.latency)
+        return self._build_route(coordinates, params)
+
+    def table(self, coordinates, params):
+        if self.latency:
+            time.sleep(self.latency)
+        return self._build_table(coordinates, params)
+
+    async def aroute(self, coordinates, params):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._build_route(coordinates, params)
+
+    async def atable(self, coordinates, params):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._build_table(coordinates, params)
+
+    def _build_route(self, coordinates, params):
+        coordinates = [(float(lon), float(lat)) for lon, lat in coordinates]
+        with_steps = str(params.get("steps", "false")).lower() == "true"
+
+        legs = []
+        geometry = [list(coordinates[0])]
+        for start, end in zip(coordinates, coordinates[1:]):
+            leg, points = self._leg(start, end, with_steps)
+            legs.append(leg)
+            geometry.extend(points[1:])
+
+        route = {
+            "distance": sum(leg["distance"] for leg in legs),
+            "duration": sum(leg["duration"] for leg in legs),
+            "weight": sum(leg["weight"] for leg in legs),
+            "weight_name": "duration",
+            "legs": legs,
+        }
+        if params.get("overview", "simplified") != "false":
+            route["geometry"] = {"type": "LineString", "coordinates": geometry}
+
+        return {
+            "code": "Ok",
+            "routes": [route],
+            "waypoints": [
+                {"name": "", "location": list(coordinate), "distance": 0}
+                for coordinate in coordinates
+            ],
+        }
+
+    def _build_table(self, coordinates, params):
+        coordinates = [(float(lon), float(lat)) for lon, lat in coordinates]
+        distances = [
+            [self._distance(source, destination) for destination in coordinates]
+            for source in coordinates
+        ]
+        return {
+            "code": "Ok",
+            "distances": distances,
+            "durations": [[distance / self.speed_mps for distance in row] for row in distances],
+            "sources": [{"name": "", "location": list(c)} for c in coordinates],
+            "destinations": [{"name": "", "location": list(c)} for c in coordinates],
+        }
@@ -0,0 +1,145 @@
+import math
+
+from django.conf import settings
+
+from .geometry import METERS_PER_DEGREE, haversine_meters
+from .models import LOCATION_GRID_DEGREES, Location, location_grid_cell
+
+# Decimal places kept when storing coordinates (~0.1 m); incoming values are
+# rounded so the same point always maps to the same Location row.
+COORDINATE_PRECISION = 6
+
+# Points closer than this reuse an existing row (0 = exact matches only)
+LOCATION_MATCH_RADIUS_METERS = getattr(settings, "LOCATION_MATCH_RADIUS_METERS", 25)
+
+
+def normalize_coordinates(latitude, longitude):
+    """(latitude, longitude) rounded to COORDINATE_PRECISION"""
+    return (
+        round(float(latitude), COORDINATE_PRECISION),
+        round(float(longitude), COORDINATE_PRECISION),
+    )
+
+
+def _distance(first, second):
+    """Meters between two (latitude, longitude) pairs"""
+    return haversine_meters((first[1], first[0]), (second[1], second[0]))
+
+
+def neighbouring_cells(latitude, longitude, radius_meters):
+    """Grid cells that may hold a point within radius_meters of (latitude, longitude)"""
+    cell_height = LOCATION_GRID_DEGREES * METERS_PER_DEGREE
+    # Cells get narrower towards the poles
+    cell_width = cell_height * max(math.cos(math.radians(latitude)), 0.01)
+    lat_ring = math.ceil(radius_meters / cell_height)
+    lon_ring = math.ceil(radius_meters / cell_width)
+
+    row = math.floor(latitude / LOCATION_GRID_DEGREES)
+    column = math.floor(longitude / LOCATION_GRID_DEGREES)
+    return {
+        f"{row + i}:{column + j}"
+        for i in range(-lat_ring, lat_ring + 1)
+        for j in range(-lon_ring, lon_ring + 1)
+    }
+
+
+def _exact_locations(keys):
+    """Location rows matching (latitude, longitude) keys, in one IN query"""
+    if not keys:
+        return {}
+    latitudes = {latitude for latitude, _ in keys}
+    longitudes = {longitude for _, longitude in keys}
+    rows = Location.objects.filter(latitude__in=latitudes, longitude__in=longitudes)
+    # The IN filters match a cross product of the pairs; keep exact matches
+    return {
+        (row.latitude, row.longitude): row
+        for row in rows
+        if (row.latitude, row.longitude) in keys
+    }
+
+
+def _nearest(key, rows, radius_meters):
+    best, best_distance = None, radius_meters
+    for row in rows:
+        distance = _distance(key, (row.latitude, row.longitude))
+        if distance <= best_distance:
+            best, best_distance = row, distance
+    return best
+
+
+def _nearby_locations(keys, radius_meters):
+    """
+    Nearest Location row within radius_meters of each key.
+
+    Candidate rows are fetched with one query on the indexed grid_cell
+    column covering the neighbourhood of every key.
+    """
+    cells = set()
+    for latitude, longitude in keys:
+        cells |= neighbouring_cells(latitude, longitude, radius_meters)
+    rows = list(Location.objects.filter(grid_cell__in=cells))
+
+    found = {}
+    for key in keys:
+        nearest = _nearest(key, rows, radius_meters)
+        if nearest is not None:
+            found[key] = nearest
+    return found
+
+
+def get_or_create_locations(locations_data, radius_meters=None):
+    """
+    Location rows for location dicts, in the same order.
+
+    Each dict needs latitude and longitude and may carry a street_name used
+    when the row has to be created. A point within radius_meters (default
+    LOCATION_MATCH_RADIUS_METERS) of an existing location reuses that row,
+    so GPS jitter around one place does not create a row per ping.
+    Existing rows are fetched with a single query and the missing ones
+    inserted with one bulk_create, so the number of queries does not depend
+    on how many locations are resolved.
+    """
+    if radius_meters is None:
+        radius_meters = LOCATION_MATCH_RADIUS_METERS
+
+    keys = [
+        normalize_coordinates(data["latitude"], data["longitude"])
+        for data in locations_data
+    ]
+    wanted = set(keys)
+    if radius_meters > 0:
+        found = _nearby_locations(wanted, radius_meters)
+    else:
+        found = _exact_locations(wanted)
+
+    # New points close to each other within this batch share one new row
+    missing = {}
+    aliases = {}
+    for key, data in zip(keys, locations_data):
+        if key in found or key in missing or key in aliases:
+            continue
+        nearby = _nearest(key, missing.values(), radius_meters) if radius_meters > 0 else None
+        if nearby is not None:
+            aliases[key] = (nearby.latitude, nearby.longitude)
+            continue
+        missing[key] = Location(
+            latitude=key[0],
+            longitude=key[1],
+            grid_cell=location_grid_cell(*key),
+            street_name=data.get("street_name") or "",
+        )
+
+    if missing:
+        # Concurrent requests may insert the same point first; ignore the
+        # unique (latitude, longitude) conflict and read the winner back.
+        Location.objects.bulk_create(missing.values(), ignore_conflicts=True)
+        found.update(_exact_locations(set(missing)))
+        for key, target in aliases.items():
+            found[key] = found[target]
+
+    return [found[key] for key in keys]
+
+
+def get_or_create_location(location_data, radius_meters=None):
+    """Single-location shortcut for get_or_create_locations()"""
+    return get_or_create_locations([location_data], radius_meters)[0]
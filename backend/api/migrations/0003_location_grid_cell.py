@@ -0,0 +1,44 @@
+# Generated by Django 4.2.10 on 2026-10-17 02:31
+
+import math
+
+from django.db import migrations, models
+
+GRID_DEGREES = 0.001
+
+
+BATCH_SIZE = 1000
+
+
+def fill_grid_cells(apps, schema_editor):
+    Location = apps.get_model('api', 'Location')
+    # Stream the table and update it a batch at a time
+    locations = Location.objects.only('id', 'latitude', 'longitude').order_by('id')
+    batch = []
+    for location in locations.iterator(chunk_size=BATCH_SIZE):
+        location.grid_cell = (
+            f"{math.floor(location.latitude / GRID_DEGREES)}:"
+            f"{math.floor(location.longitude / GRID_DEGREES)}"
+        )
+        batch.append(location)
+        if len(batch) == BATCH_SIZE:
+            Location.objects.bulk_update(batch, ['grid_cell'])
+            batch = []
+    if batch:
+        Location.objects.bulk_update(batch, ['grid_cell'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_trip_plan_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='grid_cell',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=32),
+        ),
+        migrations.RunPython(fill_grid_cells, migrations.RunPython.noop),
+    ]
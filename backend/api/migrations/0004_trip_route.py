@@ -0,0 +1,84 @@
+# Generated by Django 4.2.10 on 2026-10-17 02:35
+
+import copy
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Helpers are copied from api.geometry as it was when this migration was
+# written, so later changes to that module cannot alter what it does.
+POLYLINE_PRECISION = 6
+
+
+def _encode_value(value):
+    value = ~(value << 1) if value < 0 else value << 1
+    chunks = []
+    while value >= 0x20:
+        chunks.append(chr((0x20 | (value & 0x1F)) + 63))
+        value >>= 5
+    chunks.append(chr(value + 63))
+    return ''.join(chunks)
+
+
+def encode_polyline(coordinates, precision=POLYLINE_PRECISION):
+    factor = 10 ** precision
+    encoded = []
+    previous_lat = previous_lon = 0
+    for lon, lat in coordinates:
+        lat_value = int(round(lat * factor))
+        lon_value = int(round(lon * factor))
+        encoded.append(_encode_value(lat_value - previous_lat))
+        encoded.append(_encode_value(lon_value - previous_lon))
+        previous_lat, previous_lon = lat_value, lon_value
+    return ''.join(encoded)
+
+
+def split_route_geometry(route_data):
+    """(route_data without route and step geometries, coordinates of the first route)"""
+    stripped = copy.deepcopy(route_data)
+    coordinates = []
+    for index, route in enumerate(stripped.get('routes') or []):
+        geometry = route.pop('geometry', None)
+        if index == 0 and isinstance(geometry, dict):
+            coordinates = geometry.get('coordinates') or []
+        for leg in route.get('legs', []):
+            for step in leg.get('steps', []):
+                step.pop('geometry', None)
+    return stripped, coordinates
+
+
+def move_route_geometry(apps, schema_editor):
+    Trip = apps.get_model('api', 'Trip')
+    TripRoute = apps.get_model('api', 'TripRoute')
+    for trip in Trip.objects.exclude(route__isnull=True).only('id', 'route').iterator():
+        route, coordinates = split_route_geometry(trip.route)
+        TripRoute.objects.create(
+            trip=trip,
+            polyline=encode_polyline(coordinates),
+            precision=POLYLINE_PRECISION,
+            point_count=len(coordinates),
+        )
+        Trip.objects.filter(pk=trip.pk).update(route=route)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_location_grid_cell'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TripRoute',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('polyline', models.TextField()),
+                ('precision', models.PositiveSmallIntegerField(default=6)),
+                ('point_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('trip', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='route_geometry', to='api.trip')),
+            ],
+        ),
+        migrations.RunPython(move_route_geometry, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.10 on 2026-10-17 02:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_trip_route'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='stop',
+            name='stop_type',
+            field=models.CharField(choices=[('pickup', 'Pickup'), ('dropoff', 'Dropoff'), ('fuel', 'Fuel'), ('rest', 'Rest'), ('break', 'Break')], max_length=20),
+        ),
+    ]
@@ -0,0 +1,97 @@
+# Generated by Django 4.2.10 on 2026-10-17 02:47
+
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+import django.db.models.deletion
+
+ON_DUTY_STATUSES = {'driving', 'onDuty'}
+
+
+def hours_by_day(changes):
+    """
+    {date: (on-duty hours, driving hours)} for (time, status) pairs sorted by
+    time, split at local midnight. Copied from api.cycle as it was when this
+    migration was written.
+    """
+    days = defaultdict(lambda: [0.0, 0.0])
+    for (start, duty_status), (end, _) in zip(changes, changes[1:]):
+        if duty_status not in ON_DUTY_STATUSES:
+            continue
+        start = timezone.localtime(start)
+        end = timezone.localtime(end)
+        while start < end:
+            midnight = timezone.make_aware(
+                datetime.combine(start.date() + timedelta(days=1), datetime.min.time())
+            )
+            until = min(end, midnight)
+            hours = (until - start).total_seconds() / 3600
+            days[start.date()][0] += hours
+            if duty_status == 'driving':
+                days[start.date()][1] += hours
+            start = until
+    return {day: tuple(values) for day, values in days.items()}
+
+
+def fill_duty_days(apps, schema_editor):
+    DutyDay = apps.get_model('api', 'DutyDay')
+    DutyStatusChange = apps.get_model('api', 'DutyStatusChange')
+    LogSheet = apps.get_model('api', 'LogSheet')
+    changes = {}
+    rows = (
+        DutyStatusChange.objects.order_by('log_sheet_id', 'time')
+        .values_list('log_sheet_id', 'time', 'status')
+        .iterator()
+    )
+    for log_sheet_id, time, duty_status in rows:
+        changes.setdefault(log_sheet_id, []).append((time, duty_status))
+    drivers = dict(
+        LogSheet.objects.filter(pk__in=changes).values_list('id', 'trip__created_by_id')
+    )
+    DutyDay.objects.bulk_create(
+        [
+            DutyDay(
+                driver_id=drivers[log_sheet_id],
+                log_sheet_id=log_sheet_id,
+                day=day,
+                on_duty_hours=on_duty,
+                driving_hours=driving,
+            )
+            for log_sheet_id, sheet_changes in changes.items()
+            for day, (on_duty, driving) in hours_by_day(sheet_changes).items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_stop_break_type'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DutyDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('on_duty_hours', models.FloatField(default=0)),
+                ('driving_hours', models.FloatField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('driver', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='duty_days', to=settings.AUTH_USER_MODEL)),
+                ('log_sheet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='duty_days', to='api.logsheet')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['driver', 'day'], name='duty_day_driver_day_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='dutyday',
+            constraint=models.UniqueConstraint(fields=('log_sheet', 'day'), name='unique_duty_day_per_log_sheet'),
+        ),
+        migrations.RunPython(fill_duty_days, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.2.10 on 2026-10-17 02:48
+
+from django.db import migrations, models
+
+
+def complete_extra_active_log_sheets(apps, schema_editor):
+    """Keep only the newest active log sheet of each trip active"""
+    LogSheet = apps.get_model('api', 'LogSheet')
+    seen = set()
+    extra = []
+    active = LogSheet.objects.filter(status='active').order_by('trip_id', '-start_time', '-id')
+    for log_sheet_id, trip_id in active.values_list('id', 'trip_id'):
+        if trip_id in seen:
+            extra.append(log_sheet_id)
+        seen.add(trip_id)
+    LogSheet.objects.filter(pk__in=extra).update(status='completed')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_duty_day'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='logsheet',
+            index=models.Index(fields=['trip', 'status'], name='log_sheet_trip_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='logsheet',
+            index=models.Index(fields=['trip', 'start_time', 'end_time'], name='log_sheet_trip_period_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='logsheet',
+            index=models.Index(fields=['trip', '-created_at'], name='log_sheet_trip_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trip',
+            index=models.Index(fields=['created_by', '-created_at'], name='trip_created_by_created_idx'),
+        ),
+        migrations.RunPython(complete_extra_active_log_sheets, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='logsheet',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'active')), fields=('trip',), name='one_active_log_sheet_per_trip'),
+        ),
+    ]
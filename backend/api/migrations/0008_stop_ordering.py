@@ -0,0 +1,49 @@
+# Generated by Django 4.2.10 on 2026-10-17 02:50
+
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.constraints
+
+
+def renumber_duplicate_sequences(apps, schema_editor):
+    """Number the stops of trips with repeated sequences 1..n in their current order"""
+    Stop = apps.get_model('api', 'Stop')
+    trips = (
+        Stop.objects.values('trip_id', 'sequence')
+        .annotate(count=Count('id'))
+        .filter(count__gt=1)
+        .values_list('trip_id', flat=True)
+        .distinct()
+    )
+    for trip_id in list(trips):
+        stops = list(Stop.objects.filter(trip_id=trip_id).order_by('sequence', 'id'))
+        for sequence, stop in enumerate(stops, start=1):
+            stop.sequence = sequence
+        Stop.objects.bulk_update(stops, ['sequence'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_log_sheet_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='stop',
+            options={'ordering': ['sequence', 'id']},
+        ),
+        migrations.AddIndex(
+            model_name='stop',
+            index=models.Index(fields=['trip', 'sequence'], name='stop_trip_sequence_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stop',
+            index=models.Index(fields=['trip', 'status'], name='stop_trip_status_idx'),
+        ),
+        migrations.RunPython(renumber_duplicate_sequences, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='stop',
+            constraint=models.UniqueConstraint(deferrable=django.db.models.constraints.Deferrable['DEFERRED'], fields=('trip', 'sequence'), name='unique_stop_sequence_per_trip'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.10 on 2026-10-17 02:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_stop_ordering'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dutystatuschange',
+            name='idempotency_key',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='dutystatuschange',
+            constraint=models.UniqueConstraint(fields=('log_sheet', 'idempotency_key'), name='unique_duty_status_change_key'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations
+
+
+def strip_route_steps(apps, schema_editor):
+    """Drop the turn-by-turn steps from the legs of stored routes"""
+    Trip = apps.get_model('api', 'Trip')
+    for trip in Trip.objects.exclude(route__isnull=True).only('id', 'route').iterator():
+        changed = False
+        for route in (trip.route or {}).get('routes') or []:
+            for leg in route.get('legs') or []:
+                if 'steps' in leg:
+                    del leg['steps']
+                    changed = True
+        if changed:
+            trip.save(update_fields=['route'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_duty_status_change_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.RunPython(strip_route_steps, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,121 @@
+from rest_framework import status
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+
+from .models import Trip
+from .serializers import query_list
+from .trip_cache import trip_cache
+from .versioning import etag_for, etag_matches
+
+
+class ConditionalGetMixin:
+    """
+    ETag support for list and retrieve.
+
+    get_version() returns a cheap version of the data the response is built
+    from (see api.versioning), or None when it cannot tell. A request whose
+    If-None-Match matches the current ETag gets 304 Not Modified before the
+    queryset is evaluated or anything is serialized. The version is kept
+    on the view as self.version for the rest of the request.
+    """
+
+    def get_version(self):
+        raise NotImplementedError
+
+    def list(self, request, *args, **kwargs):
+        return self._conditional_get(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._conditional_get(super().retrieve, request, *args, **kwargs)
+
+    def _conditional_get(self, handler, request, *args, **kwargs):
+        version = self.version = self.get_version()
+        if version is None:
+            return handler(request, *args, **kwargs)
+
+        # The query string selects fields, expansions and pages
+        etag = etag_for(version, request.META.get("QUERY_STRING", ""))
+        if etag_matches(etag, request.headers.get("If-None-Match")):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+        response = handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            response["ETag"] = etag
+        return response
+
+
+class CachedTripRepresentationMixin:
+    """
+    Serve serialized trips for list and retrieve from api.trip_cache.
+
+    Only trip ids are read to resolve the page or the requested trip;
+    trips missing from the cache are loaded with the action's eager
+    queryset, serialized and stored. Send X-Cache-Bypass: 1 to skip cache
+    reads; the X-Cache response header reports HIT, MISS or BYPASS.
+
+    Entries are keyed by the version ConditionalGetMixin computed for the
+    request, so an entry stored before a write is never served after it,
+    even when the write was made, and invalidated, by another process.
+    Without a version the cache is bypassed.
+    """
+
+    def _cache_bypassed(self):
+        return self.request.headers.get("X-Cache-Bypass", "").lower() in ("1", "true", "yes")
+
+    def _cache_variant(self):
+        # Everything besides the trip that shapes the serialized output, and
+        # the version of the rows it is built from
+        fields = ",".join(sorted(query_list(self.request, "fields")))
+        expand = ",".join(sorted(query_list(self.request, "expand")))
+        version = getattr(self, "version", None)
+        return f"{self.action}|version={version}|fields={fields}|expand={expand}"
+
+    def _visible_trips(self):
+        """Unloaded trips the user may see, filtered like get_queryset()"""
+        trips = Trip.objects.filter(created_by=self.request.user).only("id", "created_at")
+        trip_id = self.kwargs.get("trip_pk")
+        return trips.filter(id=trip_id) if trip_id else trips
+
+    def _serialize_trips(self, trip_ids):
+        variant = self._cache_variant()
+        if self._cache_bypassed() or getattr(self, "version", None) is None:
+            cached, generations = {}, {}
+            self.cache_status = "BYPASS"
+        else:
+            cached, generations = trip_cache.lookup(trip_ids, variant)
+            self.cache_status = "HIT" if len(cached) == len(trip_ids) else "MISS"
+
+        missing = [trip_id for trip_id in trip_ids if trip_id not in cached]
+        if missing:
+            fresh = {
+                trip.id: dict(self.get_serializer(trip).data)
+                for trip in self.get_queryset().filter(id__in=missing)
+            }
+            trip_cache.store(fresh, variant, generations)
+            cached.update(fresh)
+        return [cached[trip_id] for trip_id in trip_ids if trip_id in cached]
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        cache_status = getattr(self, "cache_status", None)
+        if cache_status:
+            response["X-Cache"] = cache_status
+        return response
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self._visible_trips())
+        page = self.paginate_queryset(queryset)
+        trips = page if page is not None else queryset
+        data = self._serialize_trips([trip.id for trip in trips])
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+    def retrieve(self, request, *args, **kwargs):
+        trip_id = str(self.kwargs.get("pk", ""))
+        if not trip_id.isdigit() or not self._visible_trips().filter(id=trip_id).exists():
+            raise NotFound()
+        data = self._serialize_trips([int(trip_id)])
+        if not data:
+            raise NotFound()
+        return Response(data[0])
@@ -1,3 +1,5 @@
+import math
+
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.utils.translation import gettext_lazy as _
@@ -34,13 +36,25 @@ class User(AbstractUser):
     def __str__(self):
         return self.email
 
+# Side of a location grid cell in degrees (~111 m of latitude)
+LOCATION_GRID_DEGREES = 0.001
+
+def location_grid_cell(latitude, longitude):
+    """Key of the fixed-size grid cell containing a point, e.g. 40123:-100456"""
+    return f"{math.floor(latitude / LOCATION_GRID_DEGREES)}:{math.floor(longitude / LOCATION_GRID_DEGREES)}"
+
 class Location(models.Model):
     latitude = models.FloatField()
     longitude = models.FloatField()
+    grid_cell = models.CharField(max_length=32, db_index=True, editable=False, default='')
     street_name = models.CharField(max_length=255, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    def save(self, *args, **kwargs):
+        self.grid_cell = location_grid_cell(self.latitude, self.longitude)
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.street_name or f'Location at {self.latitude}, {self.longitude}'}"
 
@@ -65,6 +79,10 @@ class Trip(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        # Trip lists, and log sheet lists joined through trip__created_by
+        indexes = [models.Index(fields=["created_by", "-created_at"], name="trip_created_by_created_idx")]
+
     def __str__(self):
         return f"Trip {self.id} - {self.status}"
 
@@ -81,6 +99,7 @@ class Stop(models.Model):
         ("dropoff", "Dropoff"),
         ("fuel", "Fuel"),
         ("rest", "Rest"),
+        ("break", "Break"),
     ]
 
     trip = models.ForeignKey(Trip, on_delete=models.CASCADE, related_name="stops")
@@ -96,9 +115,60 @@ class Stop(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        ordering = ["sequence", "id"]
+        indexes = [
+            models.Index(fields=["trip", "sequence"], name="stop_trip_sequence_idx"),
+            models.Index(fields=["trip", "status"], name="stop_trip_status_idx"),
+        ]
+        constraints = [
+            # Deferred so stops can be renumbered inside a transaction. Backends
+            # without deferrable constraints (SQLite) skip it; the index above
+            # still serves ordered lookups there.
+            models.UniqueConstraint(
+                fields=["trip", "sequence"],
+                name="unique_stop_sequence_per_trip",
+                deferrable=models.Deferrable.DEFERRED,
+            ),
+        ]
+
     def __str__(self):
         return f"{self.stop_type} Stop {self.sequence} - {self.status}"
 
+class TripRoute(models.Model):
+    """Line geometry of a trip's planned route, kept out of Trip.route"""
+    trip = models.OneToOneField(Trip, on_delete=models.CASCADE, related_name="route_geometry")
+    polyline = models.TextField()  # Encoded polyline, (latitude, longitude) order
+    precision = models.PositiveSmallIntegerField(default=6)  # Decimal places encoded
+    point_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Route for trip {self.trip_id} ({self.point_count} points)"
+
+class TripPlanJob(models.Model):
+    STATUS_CHOICES = [
+        ("queued", "Queued"),
+        ("running", "Running"),
+        ("completed", "Completed"),
+        ("failed", "Failed"),
+    ]
+
+    trip = models.ForeignKey(Trip, on_delete=models.CASCADE, related_name="plan_jobs")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="queued")
+    progress = models.PositiveSmallIntegerField(default=0)  # Percent complete
+    message = models.CharField(max_length=255, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Plan job {self.id} for trip {self.trip_id} - {self.status}"
+
 class DutyStatusChange(models.Model):
     STATUS_CHOICES = [
         ("offDuty", "Off Duty"),
@@ -112,11 +182,19 @@ class DutyStatusChange(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES)
     location = models.ForeignKey(Location, on_delete=models.CASCADE)
     label = models.CharField(max_length=255, blank=True)
+    # Client-chosen key that makes retried uploads of the same change no-ops
+    idempotency_key = models.CharField(max_length=64, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['time']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['log_sheet', 'idempotency_key'],
+                name='unique_duty_status_change_key',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.status} at {self.time}"
@@ -144,23 +222,49 @@ class LogSheet(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["trip", "status"], name="log_sheet_trip_status_idx"),
+            # Overlap checks: trip = ? AND start_time <= ? AND end_time >= ?
+            models.Index(fields=["trip", "start_time", "end_time"], name="log_sheet_trip_period_idx"),
+            models.Index(fields=["trip", "-created_at"], name="log_sheet_trip_created_idx"),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["trip"],
+                condition=models.Q(status="active"),
+                name="one_active_log_sheet_per_trip",
+            ),
+        ]
+
     def __str__(self):
         return f"Log Sheet {self.id} - {self.status}"
 
     def calculate_duty_hours(self):
         """Calculate total hours for each duty status"""
-        hours = {
-            "offDuty": 0,
-            "sleeper": 0,
-            "driving": 0,
-            "onDuty": 0,
-        }
-
-        changes = self.duty_status_changes.all().order_by('time')
-        for i in range(len(changes) - 1):
-            current = changes[i]
-            next_change = changes[i + 1]
-            duration = (next_change.time - current.time).total_seconds() / 3600  # Convert to hours
-            hours[current.status] += duration
-
-        return hours
+        from .duty_hours import duty_hours
+
+        return duty_hours([self.pk])[self.pk]
+
+class DutyDay(models.Model):
+    """
+    Hours a log sheet contributes to one calendar day of its driver's
+    rolling cycle. Kept up to date as duty status changes are saved or
+    deleted, so cycle totals never rescan the log history.
+    """
+    driver = models.ForeignKey(User, on_delete=models.CASCADE, related_name="duty_days")
+    log_sheet = models.ForeignKey(LogSheet, on_delete=models.CASCADE, related_name="duty_days")
+    day = models.DateField()
+    on_duty_hours = models.FloatField(default=0)  # Driving plus on duty (not driving)
+    driving_hours = models.FloatField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["log_sheet", "day"], name="unique_duty_day_per_log_sheet"),
+        ]
+        indexes = [models.Index(fields=["driver", "day"], name="duty_day_driver_day_idx")]
+
+    def __str__(self):
+        return f"{self.day}: {self.on_duty_hours:.2f} on-duty hours"
+
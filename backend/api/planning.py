@@ -0,0 +1,286 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .geometry import POLYLINE_PRECISION, RouteIndex, encode_polyline, split_route_geometry
+from .hos import (
+    BREAK_MINUTES,
+    FUEL_STOP_MINUTES,
+    REQUIRED_REST_HOURS,
+    RESTART_HOURS,
+    schedule_trip,
+)
+from .locations import COORDINATE_PRECISION, get_or_create_location, get_or_create_locations
+from .models import Stop, Trip, TripRoute
+from .routing import fetch_route
+
+ROUTE_PARAMS = {"overview": "full", "geometries": "geojson", "steps": "true"}
+
+METERS_PER_MILE = 1609.34
+
+# Stop type for each location slug sent by the client
+STOP_TYPES_BY_SLUG = {
+    "pickupLocation": "pickup",
+    "dropoffLocation": "dropoff",
+    "fuelStop": "fuel",
+}
+
+# On-duty dwell time (minutes) at each type of waypoint
+STOP_DURATIONS = {"pickup": 60, "dropoff": 60, "fuel": FUEL_STOP_MINUTES}
+
+# Stop type and summary for the stops the HOS scheduler inserts en route
+HOS_STOP_TYPES = {"rest": "rest", "restart": "rest", "break": "break", "fuel": "fuel"}
+HOS_STOP_SUMMARIES = {
+    "rest": f"{REQUIRED_REST_HOURS}-hour rest",
+    "restart": f"{RESTART_HOURS}-hour restart",
+    "break": f"{BREAK_MINUTES}-minute break",
+    "fuel": "Fuel stop",
+}
+
+
+class PlanningError(Exception):
+    """Raised when a trip plan cannot be built from the routing response"""
+
+
+def coordinates_of(locations):
+    """(longitude, latitude) pairs for Location rows"""
+    return [(location.longitude, location.latitude) for location in locations]
+
+
+def resolve_locations(locations_data):
+    """Location rows for validated location dicts, in the same order"""
+    if not locations_data:
+        raise PlanningError("No valid coordinates found in locations")
+
+    return get_or_create_locations(
+        [
+            {
+                **location_data,
+                "street_name": location_data.get(
+                    "street_name",
+                    f"Location at {location_data['latitude']}, {location_data['longitude']}",
+                ),
+            }
+            for location_data in locations_data
+        ]
+    )
+
+
+def build_trip(user, locations, current_cycle_hours):
+    """
+    Unsaved trip for locations in route order: the current location,
+    followed by pickup, dropoff and an optional fuel stop.
+    """
+    return Trip(
+        current_location=locations[0],
+        pickup_location=locations[1] if len(locations) > 1 else None,
+        dropoff_location=locations[2] if len(locations) > 2 else None,
+        fuel_stop=locations[3] if len(locations) > 3 else None,
+        current_cycle_hours=current_cycle_hours,
+        created_by=user,
+    )
+
+
+def _require_route(route_data):
+    if not route_data.get("routes"):
+        print("No routes found in OSRM response")
+        raise PlanningError("No route found")
+
+
+def slug_waypoints(locations, slugs):
+    """Waypoints in route order for locations sent with client slugs"""
+    waypoints = [("start", locations[0])]
+    for location, slug in zip(locations[1:], slugs[1:]):
+        waypoints.append((STOP_TYPES_BY_SLUG.get(slug, "waypoint"), location))
+    return waypoints
+
+
+def leg_stops(trip, waypoints, route_data, start_time=None):
+    """
+    Unsaved stops for driving the route: one at each waypoint after the
+    first, plus the rests, breaks, restarts and fuel stops the HOS
+    scheduler inserts along the way, numbered in the order they happen.
+    """
+    route = route_data["routes"][0]
+    legs = route["legs"]
+    start_time = start_time or timezone.now()
+    dwell = [
+        (stop_type, STOP_DURATIONS.get(stop_type, 0) * 60)
+        for stop_type, _ in waypoints[1:len(legs) + 1]
+    ]
+    events = [
+        event
+        for event in schedule_trip(legs, dwell, trip.current_cycle_hours)
+        if event.kind != "driving"
+    ]
+
+    # Place en-route stops where the driver is after event.driving_time
+    # seconds at the wheel, and resolve their locations in one batch
+    coordinates = (route.get("geometry") or {}).get("coordinates") or [
+        (location.longitude, location.latitude) for _, location in waypoints
+    ]
+    index = RouteIndex(coordinates, legs)
+    en_route = [event for event in events if event.waypoint_index is None]
+    en_route_data = []
+    for event in en_route:
+        longitude, latitude = (
+            round(value, COORDINATE_PRECISION) for value in index.position_at(event.driving_time)
+        )
+        en_route_data.append(
+            {
+                "longitude": longitude,
+                "latitude": latitude,
+                "street_name": f"{HOS_STOP_SUMMARIES[event.kind]} at {latitude}, {longitude}",
+            }
+        )
+    en_route_locations = iter(get_or_create_locations(en_route_data) if en_route_data else [])
+
+    stops = []
+    last_distance = 0.0
+    for sequence, event in enumerate(events, start=1):
+        if event.waypoint_index is not None:
+            stop_type, location = waypoints[event.waypoint_index]
+            summary = legs[event.leg_index].get("summary", "")
+        else:
+            stop_type = HOS_STOP_TYPES[event.kind]
+            location = next(en_route_locations)
+            summary = HOS_STOP_SUMMARIES[event.kind]
+        stops.append(
+            Stop(
+                trip=trip,
+                location=location,
+                summary=summary,
+                sequence=sequence,
+                status="pending",
+                stop_type=stop_type,
+                arrival_time=start_time + timedelta(seconds=event.start),
+                duration_minutes=round(event.duration / 60),
+                cycle_hours_at_stop=event.cycle_hours,
+                distance_from_last_stop=(event.distance - last_distance) / METERS_PER_MILE,
+            )
+        )
+        last_distance = event.distance
+    return stops
+
+
+def save_trip_plan(trip, route_data, stops):
+    """
+    Persist a planned trip, its route geometry and its stops as one unit.
+
+    The trip is written once (inserted if new) and all stops with a single
+    bulk_create, inside one transaction, so a failure part-way through
+    leaves nothing behind. The new stops replace any the trip already had.
+    The route line is stored as a TripRoute polyline and left out of
+    trip.route.
+    """
+    trip.route, coordinates = split_route_geometry(route_data)
+    trip.status = "planned"
+    with transaction.atomic():
+        if trip.pk:
+            trip.stops.all().delete()
+        trip.save()
+        TripRoute.objects.update_or_create(
+            trip=trip,
+            defaults={
+                "polyline": encode_polyline(coordinates),
+                "precision": POLYLINE_PRECISION,
+                "point_count": len(coordinates),
+            },
+        )
+        for stop in stops:
+            stop.trip = trip
+        Stop.objects.bulk_create(stops)
+    print(f"Saved planned trip {trip.id} with {len(stops)} stops")
+    return trip
+
+
+def create_planned_trip(user, locations, slugs, current_cycle_hours, route_data):
+    """Build a new trip and its stops in memory and save them atomically"""
+    _require_route(route_data)
+    trip = build_trip(user, locations, current_cycle_hours)
+    stops = leg_stops(trip, slug_waypoints(locations, slugs), route_data)
+    return save_trip_plan(trip, route_data, stops)
+
+
+def build_trip_plan(trip, locations, slugs, progress=None):
+    """
+    Fetch the route through locations and plan an existing trip's stops.
+
+    locations are the trip's Location rows in route order (the first one is
+    the current location) and slugs the matching client slugs. progress, if
+    given, is called as progress(percent, message) between steps.
+    Raises RoutingError when the router fails and PlanningError when it
+    finds no route. Returns the stored route data, without geometry.
+    """
+    report = progress or (lambda percent, message: None)
+
+    # Get route from OSRM (served from the route cache for known lanes)
+    report(20, "Fetching route")
+    route_data = fetch_route(coordinates_of(locations), ROUTE_PARAMS)
+    _require_route(route_data)
+
+    report(60, "Creating stops")
+    stops = leg_stops(trip, slug_waypoints(locations, slugs), route_data)
+    save_trip_plan(trip, route_data, stops)
+
+    report(90, "Stops created")
+    return trip.route
+
+
+def route_waypoints(trip):
+    """Waypoints in route order, each paired with the stop type it produces"""
+    return [
+        ("start", trip.current_location),
+        ("pickup", trip.pickup_location),
+        ("dropoff", trip.dropoff_location),
+    ]
+
+
+def fuel_candidates_from_request(data):
+    """
+    Fuel stop candidates from FuelCandidatesSerializer data: the "fuelStops"
+    list, or the single "fuelStop".
+    """
+    candidates = data.get("fuelStops")
+    if candidates is None:
+        fuel_stop = data.get("fuelStop")
+        candidates = [fuel_stop] if fuel_stop else []
+    return [dict(candidate) for candidate in candidates]
+
+
+def candidate_coordinates(candidates):
+    return [
+        (float(candidate["longitude"]), float(candidate["latitude"]))
+        for candidate in candidates
+    ]
+
+
+def place_fuel_stop(trip, waypoints, candidates, best):
+    """
+    Insert the chosen fuel candidate into waypoints and set it on the trip.
+
+    best is the (candidate_index, position) pair returned by the fuel
+    optimizer. When it is None no candidate could be reached within the
+    usable range, so none is placed and the HOS scheduler adds fuel stops
+    along the route as needed. The trip itself is saved later, together
+    with its stops. Returns the fuel stop Location, or None.
+    """
+    if best is None:
+        print("No fuel stop candidate within range; planning without one")
+        return None
+
+    best_candidate, best_fuel_position = best
+    fuel_stop = candidates[best_candidate]
+
+    fuel_location = get_or_create_location(fuel_stop)
+    waypoints.insert(best_fuel_position, ("fuel", fuel_location))
+    trip.fuel_stop = fuel_location
+    print(f"Fuel stop placed at position {best_fuel_position}: {fuel_location}")
+    return fuel_location
+
+
+def apply_route_plan(trip, waypoints, route_data):
+    """Store route_data on trip and create a stop at the end of every leg"""
+    _require_route(route_data)
+    return save_trip_plan(trip, route_data, leg_stops(trip, waypoints, route_data))
@@ -0,0 +1,87 @@
+"""
+Response bodies shared by the DRF trip views and their async counterparts.
+
+Both entry points wrap the incoming request in a DRF Request, so the
+helpers here read query parameters and body fields the same way.
+"""
+from django.conf import settings
+from rest_framework.reverse import reverse
+
+from .models import Trip
+from .serializers import LogSheetSerializer, StopSerializer, TripSerializer, TripStatusSerializer
+from .versioning import parse_version, trip_delta, trip_version
+
+
+def load_trip(trip_id):
+    """A trip with everything TripSerializer renders loaded in a fixed number of queries"""
+    return TripSerializer.setup_eager_loading(Trip.objects.filter(pk=trip_id)).get()
+
+
+def trip_payload(trip, context=None):
+    """
+    The trip, its route and its stops, as returned after planning or
+    changing a trip. The route and the stops are sent once, at the top
+    level.
+    """
+    trip = load_trip(trip.pk)
+    return {
+        "trip": TripSerializer(trip, context=context or {}, omit=("route", "stops")).data,
+        "route": trip.route,
+        # Served from the prefetch cache
+        "stops": StopSerializer(trip.stops.all(), many=True).data,
+    }
+
+
+def requested_since(request):
+    """The version from ?since= (or a "since" body field), or None"""
+    since = request.query_params.get("since")
+    if since is None and isinstance(request.data, dict):
+        since = request.data.get("since")
+    return parse_version(since) if since is not None else None
+
+
+def wants_async_planning(request):
+    """Whether ?async= (or an "async" body field) asks for a background planning job"""
+    flag = request.query_params.get("async")
+    if flag is None and isinstance(request.data, dict):
+        flag = request.data.get("async")
+    if flag is None:
+        return getattr(settings, "TRIP_PLANNING_ASYNC", False)
+    return str(flag).lower() in ("1", "true", "yes")
+
+
+def plan_job_payload(trip, job, request):
+    """Body of the 202 response for a trip planned in the background"""
+    return {
+        "job_id": job.id,
+        "trip_id": trip.id,
+        "status": job.status,
+        "status_url": reverse("trip-plan-status", kwargs={"pk": trip.id}, request=request),
+    }
+
+
+def trip_response_data(trip, since=None, context=None):
+    """
+    Body of the response to a custom action on trip.
+
+    With since only the status fields, stops and log sheets changed after
+    that version are returned, plus the ids of all current stops and log
+    sheets so deleted rows can be dropped. Otherwise the full trip, route
+    and stops. Both carry the new version, to be sent as the ETag.
+    """
+    version = trip_version(trip.id)
+    if since is None:
+        return {"version": version, **trip_payload(trip, context)}
+
+    delta = trip_delta(trip, since)
+    return {
+        "version": version,
+        "delta": True,
+        "trip": TripStatusSerializer(trip).data if delta["trip_changed"] else None,
+        "stops": StopSerializer(delta["stops"], many=True).data,
+        "stop_ids": delta["stop_ids"],
+        "log_sheets": LogSheetSerializer(
+            LogSheetSerializer.setup_eager_loading(delta["log_sheets"]), many=True
+        ).data,
+        "log_sheet_ids": delta["log_sheet_ids"],
+    }
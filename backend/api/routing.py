@@ -0,0 +1,582 @@
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import httpx
+import requests
+from django.conf import settings
+from django.core.cache import caches
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+OSRM_BASE_URL = getattr(settings, "OSRM_BASE_URL", "http://router.project-osrm.org")
+OSRM_PROFILE = "driving"
+
+# The public OSRM server rejects table requests with more coordinates than this
+OSRM_TABLE_MAX_COORDINATES = getattr(settings, "OSRM_TABLE_MAX_COORDINATES", 100)
+
+# Django cache alias backing the route cache across processes and restarts
+ROUTE_CACHE_ALIAS = "routes"
+
+# Coordinates are rounded before hashing so that the same lane requested with
+# slightly different float formatting maps to the same cache entry.
+COORDINATE_PRECISION = 6
+
+
+class RoutingError(Exception):
+    """Raised when the routing service does not return a usable response"""
+
+
+class RouteCache:
+    """
+    Cache of routing responses: a thread-safe in-process LRU with a TTL and
+    a size cap, in front of an optional Django cache alias that keeps
+    entries across restarts and shares them between processes.
+
+    Entries are stored as JSON and every get() returns a fresh copy, so
+    callers may modify what they receive.
+    """
+
+    def __init__(self, max_entries=1024, ttl_seconds=86400, alias=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.alias = alias
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(coordinates, params):
+        """Content address for a coordinate sequence and its OSRM params"""
+        normalized = {
+            "coordinates": [
+                [round(float(lon), COORDINATE_PRECISION), round(float(lat), COORDINATE_PRECISION)]
+                for lon, lat in coordinates
+            ],
+            "params": {key: str(value) for key, value in sorted(params.items())},
+        }
+        payload = json.dumps(normalized, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _get_local(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            expires_at, payload = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return payload
+
+    def _set_local(self, key, payload):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, payload)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get(self, key):
+        payload = self._get_local(key)
+        if payload is None and self.alias:
+            payload = caches[self.alias].get(key)
+            if payload is not None:
+                self._set_local(key, payload)
+
+        with self._lock:
+            if payload is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(payload)
+
+    def set(self, key, value):
+        payload = json.dumps(value, separators=(",", ":"))
+        self._set_local(key, payload)
+        if self.alias:
+            caches[self.alias].set(key, payload, timeout=self.ttl_seconds)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+        if self.alias:
+            caches[self.alias].clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "backend": caches[self.alias].__class__.__name__ if self.alias else None,
+            }
+
+
+route_cache = RouteCache(
+    max_entries=getattr(settings, "OSRM_ROUTE_CACHE_MAX_ENTRIES", 1024),
+    ttl_seconds=getattr(settings, "OSRM_ROUTE_CACHE_TTL", 86400),
+    alias=ROUTE_CACHE_ALIAS if ROUTE_CACHE_ALIAS in settings.CACHES else None,
+)
+
+
+class RoutingProvider:
+    """
+    Interface for routing backends.
+
+    Implementations take (longitude, latitude) pairs and return OSRM-shaped
+    JSON so callers never need to know which backend answered.
+    """
+
+    name = "base"
+
+    def route(self, coordinates, params):
+        """OSRM route service response ("routes", "legs", "waypoints")"""
+        raise NotImplementedError
+
+    def table(self, coordinates, params):
+        """OSRM table service response ("distances", "durations")"""
+        raise NotImplementedError
+
+    async def aroute(self, coordinates, params):
+        """Async variant of route(); by default runs route() in a thread"""
+        return await asyncio.to_thread(self.route, coordinates, params)
+
+    async def atable(self, coordinates, params):
+        """Async variant of table(); by default runs table() in a thread"""
+        return await asyncio.to_thread(self.table, coordinates, params)
+
+    def stats(self):
+        """Provider-specific health and saturation figures"""
+        return {"provider": self.name}
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing upstream for a cool-down period.
+
+    After failure_threshold consecutive failures the breaker opens and
+    rejects calls immediately. Once reset_timeout seconds have passed a
+    single trial call is let through (half-open); its outcome closes or
+    re-opens the breaker.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.rejected = 0
+        self.times_opened = 0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    self.rejected += 1
+                    return False
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+
+            if self.state == self.HALF_OPEN:
+                if self._trial_in_flight:
+                    self.rejected += 1
+                    return False
+                self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            self._trial_in_flight = False
+            if (
+                self.state == self.HALF_OPEN
+                or self.consecutive_failures >= self.failure_threshold
+            ):
+                if self.state != self.OPEN:
+                    self.times_opened += 1
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "failure_threshold": self.failure_threshold,
+                "reset_timeout": self.reset_timeout,
+                "times_opened": self.times_opened,
+                "rejected": self.rejected,
+            }
+
+
+class OSRMHttpProvider(RoutingProvider):
+    """
+    Routing over HTTP against an OSRM server.
+
+    One keep-alive session per process is shared by every request thread,
+    and async callers share one httpx client per event loop.
+    Calls have connect/read timeouts, idempotent GETs are retried with
+    exponential backoff on connection errors and 429/5xx responses, and a
+    circuit breaker fails fast while the upstream is down.
+    """
+
+    name = "osrm"
+
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(
+        self,
+        base_url=OSRM_BASE_URL,
+        profile=OSRM_PROFILE,
+        pool_size=getattr(settings, "OSRM_POOL_SIZE", 10),
+        connect_timeout=getattr(settings, "OSRM_CONNECT_TIMEOUT", 3.05),
+        read_timeout=getattr(settings, "OSRM_READ_TIMEOUT", 10),
+        max_retries=getattr(settings, "OSRM_MAX_RETRIES", 2),
+        backoff_factor=getattr(settings, "OSRM_RETRY_BACKOFF", 0.3),
+        async_pool_size=getattr(settings, "OSRM_ASYNC_POOL_SIZE", 100),
+        breaker=None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.profile = profile
+        self.pool_size = pool_size
+        self.async_pool_size = async_pool_size
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        # {event loop: (httpx client, generator closing it with the loop)}
+        self._async_clients = {}
+        self.timeout = (connect_timeout, read_timeout)
+        self.breaker = breaker or CircuitBreaker(
+            failure_threshold=getattr(settings, "OSRM_BREAKER_FAILURE_THRESHOLD", 5),
+            reset_timeout=getattr(settings, "OSRM_BREAKER_RESET_TIMEOUT", 30),
+        )
+
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=self.RETRY_STATUSES,
+            allowed_methods=frozenset(["GET"]),
+            raise_on_status=False,
+        )
+        self.adapter = HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=retry,
+        )
+        self.session = requests.Session()
+        self.session.mount("http://", self.adapter)
+        self.session.mount("https://", self.adapter)
+
+        self._stats_lock = threading.Lock()
+        self.requests_total = 0
+        self.requests_failed = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    def _url(self, service, coordinates):
+        encoded = ";".join(f"{lon},{lat}" for lon, lat in coordinates)
+        return f"{self.base_url}/{service}/v1/{self.profile}/{encoded}"
+
+    def _start_request(self, url, params):
+        if not self.breaker.allow_request():
+            raise RoutingError("Routing service unavailable (circuit open)")
+
+        print(f"Requesting from OSRM: {url}")
+        print(f"With params: {params}")
+        with self._stats_lock:
+            self.requests_total += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def _end_request(self):
+        with self._stats_lock:
+            self.in_flight -= 1
+
+    def _request_failed(self, error):
+        self.breaker.record_failure()
+        with self._stats_lock:
+            self.requests_failed += 1
+        print(f"OSRM request failed: {error}")
+        raise RoutingError(f"OSRM request failed: {error}") from error
+
+    def _handle_response(self, status_code, text, parse_json):
+        print(f"OSRM response status: {status_code}")
+
+        if status_code == 200:
+            try:
+                data = parse_json()
+            except ValueError as e:
+                # A healthy upstream answers in JSON; proxies and captive
+                # portals may not
+                self._request_failed(e)
+            self.breaker.record_success()
+            return data
+
+        if status_code >= 500 or status_code == 429:
+            self.breaker.record_failure()
+        else:
+            # 4xx responses such as NoRoute mean the upstream is healthy
+            self.breaker.record_success()
+
+        with self._stats_lock:
+            self.requests_failed += 1
+        print(f"OSRM error response: {text}")
+        raise RoutingError(f"OSRM API error: {text}")
+
+    def _get(self, service, coordinates, params):
+        url = self._url(service, coordinates)
+        self._start_request(url, params)
+        try:
+            response = self.session.get(url, params=params, timeout=self.timeout)
+        except requests.RequestException as e:
+            self._request_failed(e)
+        finally:
+            self._end_request()
+        return self._handle_response(response.status_code, response.text, response.json)
+
+    def route(self, coordinates, params):
+        return self._get("route", coordinates, params)
+
+    def table(self, coordinates, params):
+        return self._get("table", coordinates, params)
+
+    def _make_async_client(self):
+        return httpx.AsyncClient(
+            timeout=httpx.Timeout(self.timeout[1], connect=self.timeout[0]),
+            limits=httpx.Limits(
+                max_connections=self.async_pool_size,
+                max_keepalive_connections=self.async_pool_size,
+            ),
+        )
+
+    async def _async_client_lifetime(self, loop, client):
+        # Suspended until the loop shuts down its async generators, as
+        # asyncio.run() and async_to_sync do before closing it
+        try:
+            yield
+        finally:
+            self._async_clients.pop(loop, None)
+            await client.aclose()
+
+    async def _get_async_client(self):
+        # httpx clients are bound to the event loop they were created on,
+        # so each loop gets its own, closed when the loop shuts down
+        loop = asyncio.get_running_loop()
+        entry = self._async_clients.get(loop)
+        if entry is None:
+            # Loops closed without shutting down their generators
+            for stale in [other for other in self._async_clients if other.is_closed()]:
+                self._async_clients.pop(stale, None)
+            client = self._make_async_client()
+            lifetime = self._async_client_lifetime(loop, client)
+            await lifetime.__anext__()
+            entry = self._async_clients[loop] = (client, lifetime)
+        return entry[0]
+
+    async def _aget(self, service, coordinates, params):
+        url = self._url(service, coordinates)
+        self._start_request(url, params)
+        client = await self._get_async_client()
+        try:
+            for attempt in range(self.max_retries + 1):
+                retries_left = attempt < self.max_retries
+                try:
+                    response = await client.get(url, params=params)
+                except httpx.TransportError as e:
+                    if not retries_left:
+                        self._request_failed(e)
+                else:
+                    if response.status_code not in self.RETRY_STATUSES or not retries_left:
+                        break
+                await asyncio.sleep(self.backoff_factor * (2 ** attempt))
+        finally:
+            self._end_request()
+        return self._handle_response(response.status_code, response.text, response.json)
+
+    async def aroute(self, coordinates, params):
+        return await self._aget("route", coordinates, params)
+
+    async def atable(self, coordinates, params):
+        return await self._aget("table", coordinates, params)
+
+    def stats(self):
+        pools = []
+        for key in list(self.adapter.poolmanager.pools.keys()):
+            pool = self.adapter.poolmanager.pools.get(key)
+            if pool is None:
+                continue
+            # The queue is pre-filled with None placeholders; only real
+            # connections count as idle keep-alive sockets.
+            queued = list(pool.pool.queue) if pool.pool is not None else []
+            idle = sum(1 for conn in queued if conn is not None)
+            pools.append(
+                {
+                    "host": pool.host,
+                    "port": pool.port,
+                    "maxsize": pool.pool.maxsize if pool.pool is not None else 0,
+                    "idle_connections": idle,
+                    "connections_opened": pool.num_connections,
+                    "requests": pool.num_requests,
+                }
+            )
+
+        with self._stats_lock:
+            return {
+                "provider": self.name,
+                "base_url": self.base_url,
+                "pool_size": self.pool_size,
+                "async_pool_size": self.async_pool_size,
+                "timeout": {"connect": self.timeout[0], "read": self.timeout[1]},
+                "requests_total": self.requests_total,
+                "requests_failed": self.requests_failed,
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight,
+                "pools": pools,
+                "circuit_breaker": self.breaker.stats(),
+            }
+
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def get_routing_provider():
+    """Process-wide routing provider selected by the ROUTING_PROVIDER setting"""
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                name = getattr(settings, "ROUTING_PROVIDER", "osrm")
+                if name == "local":
+                    from .local_routing import LocalRoutingProvider
+
+                    _provider = LocalRoutingProvider()
+                elif name == "osrm":
+                    _provider = OSRMHttpProvider()
+                else:
+                    raise ValueError(f"Unknown ROUTING_PROVIDER: {name}")
+    return _provider
+
+
+def set_routing_provider(provider):
+    """Swap the process-wide provider, e.g. for load tests and benchmarks"""
+    global _provider
+    with _provider_lock:
+        _provider = provider
+    route_cache.clear()
+
+
+def fetch_route(coordinates, params=None):
+    """
+    Fetch a route for a sequence of (longitude, latitude) pairs.
+
+    Responses are served from the route cache when the same lane has been
+    requested before with the same parameters.
+    """
+    params = params or {}
+    provider = get_routing_provider()
+    key = RouteCache.make_key(coordinates, {"provider": provider.name, **params})
+    cached = route_cache.get(key)
+    if cached is not None:
+        return cached
+
+    route_data = provider.route(coordinates, params)
+    if route_data.get("routes"):
+        route_cache.set(key, route_data)
+    return route_data
+
+
+def fetch_distance_table(coordinates):
+    """
+    Fetch the distance/duration matrix for a set of (longitude, latitude)
+    pairs in a single round-trip.
+
+    Returns a dict with "distances" (meters) and "durations" (seconds), each
+    indexed as [source][destination] in the order the coordinates were given.
+    """
+    params = {"annotations": "distance,duration"}
+    provider = get_routing_provider()
+    key = RouteCache.make_key(
+        coordinates, {"provider": provider.name, "service": "table", **params}
+    )
+    cached = route_cache.get(key)
+    if cached is not None:
+        return cached
+
+    table_data = provider.table(coordinates, params)
+    if table_data.get("code") != "Ok" or not table_data.get("distances"):
+        raise RoutingError(f"OSRM table error: {table_data.get('message', 'no distances')}")
+
+    route_cache.set(key, table_data)
+    return table_data
+
+
+async def async_fetch_route(coordinates, params=None):
+    """Async variant of fetch_route() sharing the same route cache"""
+    params = params or {}
+    provider = get_routing_provider()
+    key = RouteCache.make_key(coordinates, {"provider": provider.name, **params})
+    cached = route_cache.get(key)
+    if cached is not None:
+        return cached
+
+    route_data = await provider.aroute(coordinates, params)
+    if route_data.get("routes"):
+        route_cache.set(key, route_data)
+    return route_data
+
+
+async def async_fetch_distance_table(coordinates):
+    """Async variant of fetch_distance_table() sharing the same route cache"""
+    params = {"annotations": "distance,duration"}
+    provider = get_routing_provider()
+    key = RouteCache.make_key(
+        coordinates, {"provider": provider.name, "service": "table", **params}
+    )
+    cached = route_cache.get(key)
+    if cached is not None:
+        return cached
+
+    table_data = await provider.atable(coordinates, params)
+    if table_data.get("code") != "Ok" or not table_data.get("distances"):
+        raise RoutingError(f"OSRM table error: {table_data.get('message', 'no distances')}")
+
+    route_cache.set(key, table_data)
+    return table_data
+
+
+def routing_stats():
+    """Snapshot of the routing provider, its connection pool and the route cache"""
+    return {
+        "provider": get_routing_provider().stats(),
+        "cache": route_cache.stats(),
+    }
@@ -1,10 +1,43 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
-from .models import Trip, LogSheet, Stop, Location, DutyStatusChange
+from django.db.models import Prefetch
+from .models import Trip, LogSheet, Stop, Location, DutyStatusChange, TripPlanJob
+from .locations import get_or_create_location, get_or_create_locations
 from django.contrib.auth.password_validation import validate_password
 
 User = get_user_model()
 
+def query_list(request, name):
+    """Comma-separated query parameter as a set, e.g. ?expand=stops,route"""
+    value = request.query_params.get(name, '') if request is not None else ''
+    return {item.strip() for item in value.split(',') if item.strip()}
+
+class SparseFieldsMixin:
+    """
+    ?fields=a,b limits a GET response to the named fields, and list
+    responses leave out Meta.expandable_fields unless they are named in
+    ?expand=. Only the top-level serializer of a view is trimmed. Fields
+    named in omit are always left out.
+    """
+
+    def __init__(self, *args, omit=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        for name in omit:
+            self.fields.pop(name, None)
+        request = self.context.get('request')
+        view = self.context.get('view')
+        if request is None or view is None or request.method != 'GET':
+            return
+
+        requested = query_list(request, 'fields')
+        expanded = query_list(request, 'expand')
+        omitted = set()
+        if getattr(view, 'action', None) == 'list':
+            omitted = set(getattr(self.Meta, 'expandable_fields', ())) - expanded
+        for name in list(self.fields):
+            if name in omitted or (requested and name not in requested | expanded):
+                self.fields.pop(name)
+
 class LocationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Location
@@ -45,7 +78,7 @@ class StopSerializer(serializers.ModelSerializer):
         model = Stop
         fields = ['id', 'location', 'sequence', 'arrival_time', 'status', 'stop_type', 'duration_minutes', 'cycle_hours_at_stop', 'distance_from_last_stop']
 
-class LogSheetSerializer(serializers.ModelSerializer):
+class LogSheetSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     start_location = LocationSerializer(read_only=True)
     end_location = LocationSerializer(read_only=True)
     duty_status_changes = serializers.SerializerMethodField()
@@ -54,8 +87,27 @@ class LogSheetSerializer(serializers.ModelSerializer):
         model = LogSheet
         fields = ['id', 'start_time', 'end_time', 'start_location', 'end_location', 
                  'start_cycle_hours', 'end_cycle_hours', 'status', 'duty_status_changes']
+        # Left out of list responses unless requested with ?expand=
+        expandable_fields = ['duty_status_changes']
+
+    @staticmethod
+    def setup_eager_loading(queryset, include=('duty_status_changes',)):
+        """
+        Load everything this serializer renders in a fixed number of queries.
+        include names the expandable relations to prefetch.
+        """
+        queryset = queryset.select_related('start_location', 'end_location')
+        if 'duty_status_changes' in include:
+            queryset = queryset.prefetch_related(
+                Prefetch(
+                    'duty_status_changes',
+                    queryset=DutyStatusChange.objects.select_related('location'),
+                )
+            )
+        return queryset
 
     def get_duty_status_changes(self, obj):
+        # Served from the prefetch cache when setup_eager_loading() was used
         return DutyStatusChangeSerializer(obj.duty_status_changes.all(), many=True).data
 
 class DutyStatusChangeSerializer(serializers.ModelSerializer):
@@ -63,31 +115,79 @@ class DutyStatusChangeSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = DutyStatusChange
-        fields = ['id', 'time', 'status', 'location', 'label']
+        fields = ['id', 'time', 'status', 'location', 'label', 'idempotency_key']
+
+MAX_DUTY_STATUS_BATCH = 500  # Changes accepted in one batch upload
+
+class DutyStatusChangeBatchSerializer(serializers.ListSerializer):
+    """
+    Many duty status changes for one log sheet, validated together and
+    inserted with one bulk_create. Items whose idempotency_key is already
+    stored on the log sheet (or repeated in the batch) are skipped.
+    """
+
+    def validate(self, attrs):
+        by_key = {}
+        for item in attrs:
+            key = item.get('idempotency_key')
+            if key and by_key.setdefault(key, item) != item:
+                raise serializers.ValidationError(
+                    f"idempotency_key {key} is used for different changes"
+                )
+        return attrs
+
+    def create(self, validated_data):
+        for item in validated_data:
+            item['idempotency_key'] = item.get('idempotency_key') or None
+        log_sheet = validated_data[0]['log_sheet']
+        keys = {item['idempotency_key'] for item in validated_data} - {None}
+        stored = set(
+            DutyStatusChange.objects.filter(log_sheet=log_sheet, idempotency_key__in=keys)
+            .values_list('idempotency_key', flat=True)
+        ) if keys else set()
+
+        new_items = []
+        self.skipped_keys = []
+        for item in validated_data:
+            key = item['idempotency_key']
+            if key in stored:
+                self.skipped_keys.append(key)
+                continue
+            if key is not None:
+                stored.add(key)
+            new_items.append(item)
+        if not new_items:
+            return []
+
+        # Resolve every location with one lookup and at most one insert
+        locations = get_or_create_locations([item.pop('location') for item in new_items])
+        return DutyStatusChange.objects.bulk_create(
+            DutyStatusChange(location=location, **item)
+            for item, location in zip(new_items, locations)
+        )
 
 class DutyStatusChangeCreateSerializer(serializers.ModelSerializer):
     location = serializers.DictField()
     
     class Meta:
         model = DutyStatusChange
-        fields = ['time', 'status', 'location', 'label']
+        fields = ['time', 'status', 'location', 'label', 'idempotency_key']
+        list_serializer_class = DutyStatusChangeBatchSerializer
+        # Uniqueness per log sheet is handled by the views
+        validators = []
+
+    def validate_location(self, value):
+        try:
+            float(value['latitude'])
+            float(value['longitude'])
+        except (KeyError, TypeError, ValueError):
+            raise serializers.ValidationError("latitude and longitude are required numbers")
+        return value
 
     def create(self, validated_data):
         location_data = validated_data.pop('location')
         
-        # Try to find existing location first
-        try:
-            location = Location.objects.get(
-                latitude=location_data['latitude'],
-                longitude=location_data['longitude']
-            )
-        except Location.DoesNotExist:
-            # If location doesn't exist, create it
-            location = Location.objects.create(
-                latitude=location_data['latitude'],
-                longitude=location_data['longitude'],
-                street_name=location_data.get('street_name', '')
-            )
+        location = get_or_create_location(location_data)
         
         # Create duty status change
         duty_status_change = DutyStatusChange.objects.create(
@@ -109,21 +209,13 @@ class LogSheetCreateSerializer(serializers.ModelSerializer):
         start_location_data = validated_data.pop('start_location')
         end_location_data = validated_data.pop('end_location', None)
         
-        # Create or get start location
-        start_location, _ = Location.objects.get_or_create(
-            latitude=start_location_data['latitude'],
-            longitude=start_location_data['longitude'],
-            defaults={'street_name': start_location_data.get('street_name', '')}
-        )
-        
-        # Create or get end location if provided
-        end_location = None
+        # Create or get start and end locations together
         if end_location_data:
-            end_location, _ = Location.objects.get_or_create(
-                latitude=end_location_data['latitude'],
-                longitude=end_location_data['longitude'],
-                defaults={'street_name': end_location_data.get('street_name', '')}
+            start_location, end_location = get_or_create_locations(
+                [start_location_data, end_location_data]
             )
+        else:
+            start_location, end_location = get_or_create_location(start_location_data), None
         
         # Create log sheet with locations
         log_sheet = LogSheet.objects.create(
@@ -133,7 +225,7 @@ class LogSheetCreateSerializer(serializers.ModelSerializer):
         )
         return log_sheet
 
-class TripSerializer(serializers.ModelSerializer):
+class TripSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     created_by = UserSerializer(read_only=True)
     stops = StopSerializer(many=True, read_only=True)
     log_sheets = LogSheetSerializer(many=True, read_only=True)
@@ -147,6 +239,51 @@ class TripSerializer(serializers.ModelSerializer):
         fields = ['id', 'created_by', 'current_location', 'pickup_location', 'dropoff_location', 
                  'current_cycle_hours', 'status', 'route', 'created_at', 'updated_at', 'stops', 'log_sheets', 'fuel_stop']
         read_only_fields = ['created_by']
+        # Heavy fields left out of list responses unless requested with ?expand=
+        expandable_fields = ['route', 'stops', 'log_sheets']
+
+    @staticmethod
+    def setup_eager_loading(queryset, include=('route', 'stops', 'log_sheets')):
+        """
+        Load everything this serializer renders in a fixed number of queries:
+        one for the trips with their user and locations, and one each for
+        stops, log sheets and duty status changes. include names the
+        expandable fields to load; the route JSON is deferred otherwise.
+        """
+        queryset = queryset.select_related(
+            'created_by', 'current_location', 'pickup_location', 'dropoff_location', 'fuel_stop'
+        )
+        if 'route' not in include:
+            queryset = queryset.defer('route')
+        if 'stops' in include:
+            queryset = queryset.prefetch_related(
+                Prefetch('stops', queryset=Stop.objects.select_related('location'))
+            )
+        if 'log_sheets' in include:
+            queryset = queryset.prefetch_related(
+                Prefetch(
+                    'log_sheets',
+                    queryset=LogSheetSerializer.setup_eager_loading(LogSheet.objects.all()),
+                )
+            )
+        return queryset
+
+class TripStatusSerializer(serializers.ModelSerializer):
+    """Status fields of a trip, sent in delta responses"""
+    current_location = LocationSerializer(read_only=True)
+    fuel_stop = LocationSerializer(read_only=True)
+
+    class Meta:
+        model = Trip
+        fields = ['id', 'status', 'current_location', 'fuel_stop', 'current_cycle_hours', 'updated_at']
+
+class TripPlanJobSerializer(serializers.ModelSerializer):
+    job_id = serializers.IntegerField(source='id', read_only=True)
+    trip_id = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = TripPlanJob
+        fields = ['job_id', 'trip_id', 'status', 'progress', 'message', 'error', 'created_at', 'updated_at']
 
 class LocationInputSerializer(serializers.Serializer):
     id = serializers.CharField(required=False)
@@ -156,6 +293,19 @@ class LocationInputSerializer(serializers.Serializer):
     stop_type = serializers.CharField(required=False)
     slug = serializers.CharField(required=False)
 
+MAX_FUEL_CANDIDATES = 50  # Each candidate adds rows to the routing tables
+
+class FuelStopInputSerializer(LocationInputSerializer):
+    latitude = serializers.FloatField(min_value=-90, max_value=90)
+    longitude = serializers.FloatField(min_value=-180, max_value=180)
+
+class FuelCandidatesSerializer(serializers.Serializer):
+    """Fuel stop candidates for plan_route: a list under "fuelStops", or a single "fuelStop" """
+    fuelStops = serializers.ListField(
+        child=FuelStopInputSerializer(), required=False, allow_null=True, max_length=MAX_FUEL_CANDIDATES
+    )
+    fuelStop = FuelStopInputSerializer(required=False, allow_null=True)
+
 class TripCreateSerializer(serializers.ModelSerializer):
     locations = LocationInputSerializer(many=True)
     current_cycle_hours = serializers.FloatField(required=True)
@@ -0,0 +1,77 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .cycle import record_change, record_log_sheet
+from .models import DutyStatusChange, LogSheet, Stop, Trip
+from .trip_cache import invalidate_trip
+
+
+@receiver([post_save, post_delete], sender=Trip)
+def trip_changed(sender, instance, **kwargs):
+    invalidate_trip(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Stop)
+@receiver([post_save, post_delete], sender=LogSheet)
+def trip_child_changed(sender, instance, **kwargs):
+    invalidate_trip(instance.trip_id)
+
+
+@receiver([post_save, post_delete], sender=DutyStatusChange)
+def duty_status_change_changed(sender, instance, **kwargs):
+    trip_id = (
+        LogSheet.objects.filter(pk=instance.log_sheet_id)
+        .values_list("trip_id", flat=True)
+        .first()
+    )
+    invalidate_trip(trip_id)
+
+
+def touch_log_sheet(log_sheet_id):
+    # Delta responses find changed sheets by updated_at, and a change moved
+    # or deleted off a sheet leaves no row there to match
+    LogSheet.objects.filter(pk=log_sheet_id).update(updated_at=timezone.now())
+
+
+@receiver(pre_save, sender=DutyStatusChange)
+def duty_status_change_saving(sender, instance, **kwargs):
+    # What the change was before this save, for the ledger to take back out
+    instance._recorded = (
+        DutyStatusChange.objects.filter(pk=instance.pk)
+        .values_list("log_sheet_id", "time", "status")
+        .first()
+        if instance.pk
+        else None
+    )
+
+
+@receiver(post_save, sender=DutyStatusChange)
+def duty_status_change_recorded(sender, instance, **kwargs):
+    recorded = getattr(instance, "_recorded", None)
+    removed = None
+    if recorded is not None:
+        log_sheet_id, *removed = recorded
+        removed = tuple(removed)
+        if log_sheet_id != instance.log_sheet_id:
+            record_change(log_sheet_id, removed=removed, exclude_id=instance.pk)
+            touch_log_sheet(log_sheet_id)
+            removed = None
+    added = (instance.time, instance.status)
+    if removed != added:
+        record_change(instance.log_sheet_id, removed=removed, added=added, exclude_id=instance.pk)
+
+
+@receiver(post_delete, sender=DutyStatusChange)
+def duty_status_change_removed(sender, instance, origin=None, **kwargs):
+    touch_log_sheet(instance.log_sheet_id)
+    if origin is instance:
+        record_change(
+            instance.log_sheet_id,
+            removed=(instance.time, instance.status),
+            exclude_id=instance.pk,
+        )
+    else:
+        # Deleted in bulk or along with its sheet, trip or location; the
+        # other deleted rows are already gone, so deltas would not add up
+        record_log_sheet(instance.log_sheet_id)
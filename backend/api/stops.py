@@ -0,0 +1,58 @@
+"""
+Set-based stop sequence maintenance.
+
+Stops are renumbered 1..n with a single UPDATE ... CASE that only touches
+rows whose sequence changes, inside one transaction; the (trip, sequence)
+unique constraint is deferred so intermediate duplicates are allowed.
+"""
+from django.db import transaction
+from django.db.models import Case, IntegerField, Value, When
+from django.utils import timezone
+
+from .models import Stop
+from .trip_cache import invalidate_trip
+
+
+class StopOrderError(Exception):
+    """Raised when a new stop order does not list exactly the trip's stops"""
+
+
+def resequence_stops(trip, stop_ids=None):
+    """
+    Number trip's stops 1..n, in the order of stop_ids or, by default, in
+    their current order (closing gaps left by deletions).
+
+    stop_ids must contain every stop of the trip exactly once. Takes two
+    queries however many stops move. Returns the number of stops updated.
+    """
+    with transaction.atomic():
+        current = dict(
+            Stop.objects.select_for_update()
+            .filter(trip=trip)
+            .order_by("sequence", "id")
+            .values_list("id", "sequence")
+        )
+        if stop_ids is None:
+            stop_ids = list(current)
+        elif len(stop_ids) != len(current) or set(stop_ids) != set(current):
+            raise StopOrderError("stop_ids must list every stop of the trip exactly once")
+
+        moved = {
+            stop_id: sequence
+            for sequence, stop_id in enumerate(stop_ids, start=1)
+            if current[stop_id] != sequence
+        }
+        if not moved:
+            return 0
+
+        updated = Stop.objects.filter(pk__in=moved).update(
+            sequence=Case(
+                *[When(pk=stop_id, then=Value(sequence)) for stop_id, sequence in moved.items()],
+                output_field=IntegerField(),
+            ),
+            # Bulk updates bypass auto_now
+            updated_at=timezone.now(),
+        )
+    # Bulk updates send no signals
+    invalidate_trip(trip.id)
+    return updated
@@ -1,3 +1,1267 @@
+import asyncio
+from datetime import datetime, timedelta
+from unittest import mock
+
+import httpx
+import numpy as np
+import requests
+from django.core.cache import caches
+from django.db import connection
+from django.db.models import QuerySet
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .cycle import cycle_hours, recap, record_log_sheet
+from .fuel import (
+    METERS_PER_MILE,
+    _assemble_candidate_distances,
+    _async_fetch_candidate_distances,
+    _async_score_positions_from_routes,
+    _best_insertion,
+    _candidate_chunks,
+    _fetch_candidate_distances,
+    _score_positions_from_routes,
+    score_fuel_insertions,
+)
+from .geometry import RouteIndex, decode_polyline, encode_polyline, simplify, split_route_geometry
+from .hos import HOSScheduler, schedule_trip
+from .jobs import fail_stale_jobs, run_plan_job
+from .local_routing import LocalRoutingProvider
+from .locations import get_or_create_locations
+from .planning import place_fuel_stop
+from .serializers import MAX_FUEL_CANDIDATES
+from .responses import trip_payload
+from .routing import (
+    CircuitBreaker,
+    OSRMHttpProvider,
+    RouteCache,
+    RoutingError,
+    fetch_route,
+    set_routing_provider,
+)
+from .stops import resequence_stops
+from .trip_cache import TripRepresentationCache
+from .trips import close_active_trips
+from .models import (
+    DutyStatusChange,
+    Location,
+    LogSheet,
+    Stop,
+    Trip,
+    TripPlanJob,
+    User,
+    location_grid_cell,
+)
+
+
+class TripDataTestCase(TestCase):
+    """Authenticated client plus helpers to build trips with nested rows"""
+
+    def setUp(self):
+        caches["trips"].clear()
+        self.user = User.objects.create_user(
+            email="driver@example.com",
+            username="driver",
+            password="password",
+            first_name="Test",
+            last_name="Driver",
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.point = 0
+
+    def assertUsesIndex(self, queryset, index_name):
+        if connection.vendor == "postgresql":
+            # Tiny test tables would otherwise always be scanned sequentially
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+        self.assertIn(index_name, queryset.explain())
+
+    def location(self):
+        self.point += 1
+        return Location.objects.create(latitude=40 + self.point * 0.01, longitude=-100)
+
+    def add_trip(self, stops=3, log_sheets=2, changes=3):
+        now = timezone.now()
+        trip = Trip.objects.create(
+            created_by=self.user,
+            current_location=self.location(),
+            pickup_location=self.location(),
+            dropoff_location=self.location(),
+            fuel_stop=self.location(),
+            current_cycle_hours=5,
+        )
+        for sequence in range(1, stops + 1):
+            Stop.objects.create(
+                trip=trip,
+                location=self.location(),
+                sequence=sequence,
+                stop_type="rest",
+                arrival_time=now,
+                duration_minutes=30,
+                cycle_hours_at_stop=5,
+            )
+        for day in range(log_sheets):
+            log_sheet = LogSheet.objects.create(
+                trip=trip,
+                start_time=now + timedelta(days=day),
+                end_time=now + timedelta(days=day, hours=12),
+                start_location=self.location(),
+                end_location=self.location(),
+                start_cycle_hours=5,
+                # Only the newest sheet of a trip may be active
+                status="active" if day == log_sheets - 1 else "completed",
+            )
+            for hour in range(changes):
+                DutyStatusChange.objects.create(
+                    log_sheet=log_sheet,
+                    time=now + timedelta(days=day, hours=hour),
+                    status="driving",
+                    location=self.location(),
+                )
+        return trip
+
+
+class TripQueryCountTests(TripDataTestCase):
+    """Trip and log sheet endpoints must not issue a query per nested row"""
+
+    def test_trip_list_query_count_is_constant(self):
+        self.add_trip()
+        url = "/api/trips/?expand=route,stops,log_sheets"
+        # ETag version, page ids, then for trips missing from the cache:
+        # trips (with user and locations), stops, log sheets, duty changes
+        with self.assertNumQueries(6):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+        for _ in range(4):
+            self.add_trip(stops=6, log_sheets=3, changes=5)
+        with self.assertNumQueries(6):
+            response = self.client.get(url)
+        trips = response.data["results"]
+        self.assertEqual(len(trips), 5)
+        self.assertEqual(len(trips[0]["log_sheets"][0]["duty_status_changes"]), 5)
+
+    def test_trip_list_summary_skips_nested_rows(self):
+        for _ in range(3):
+            self.add_trip()
+        # ETag version, page ids, trips
+        with self.assertNumQueries(3):
+            response = self.client.get("/api/trips/")
+        trip = response.data["results"][0]
+        self.assertNotIn("route", trip)
+        self.assertNotIn("stops", trip)
+        self.assertNotIn("log_sheets", trip)
+        self.assertIn("current_location", trip)
+
+    def test_trip_detail_query_count_is_constant(self):
+        trip = self.add_trip(stops=10, log_sheets=4, changes=6)
+        with self.assertNumQueries(6):
+            response = self.client.get(f"/api/trips/{trip.id}/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["stops"]), 10)
+
+    def test_log_sheet_list_query_count_is_constant(self):
+        for _ in range(3):
+            self.add_trip(log_sheets=3, changes=4)
+        # ETag version, log sheets (with locations), duty changes
+        with self.assertNumQueries(3):
+            response = self.client.get("/api/log-sheets/?expand=duty_status_changes")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["results"]), 9)
+        self.assertEqual(len(response.data["results"][0]["duty_status_changes"]), 4)
+
+    def test_trip_payload_query_count_is_constant(self):
+        short = self.add_trip(stops=2, log_sheets=1, changes=1)
+        long = self.add_trip(stops=12, log_sheets=3, changes=5)
+        # Trip (with user and locations), stops, log sheets, duty changes
+        with self.assertNumQueries(4):
+            trip_payload(short)
+        with self.assertNumQueries(4):
+            payload = trip_payload(long)
+        self.assertEqual(len(payload["stops"]), 12)
+        self.assertEqual(len(payload["trip"]["log_sheets"]), 3)
+
+
+class ListPaginationTests(TripDataTestCase):
+    """Cursor pagination and sparse fieldsets on list endpoints"""
+
+    def test_trip_list_pages_follow_cursor(self):
+        trips = [self.add_trip(stops=0, log_sheets=0) for _ in range(5)]
+        seen = []
+        url = "/api/trips/?page_size=2"
+        while url:
+            response = self.client.get(url)
+            self.assertLessEqual(len(response.data["results"]), 2)
+            seen.extend(trip["id"] for trip in response.data["results"])
+            url = response.data["next"]
+        # Newest first, every trip exactly once
+        self.assertEqual(seen, [trip.id for trip in reversed(trips)])
+
+    def test_trip_list_filters_by_status(self):
+        active = self.add_trip(stops=0, log_sheets=0)
+        Trip.objects.filter(pk=active.pk).update(status="in_progress")
+        for _ in range(3):
+            self.add_trip(stops=0, log_sheets=0)
+        response = self.client.get("/api/trips/?status=in_progress&page_size=1")
+        self.assertEqual([trip["id"] for trip in response.data["results"]], [active.id])
+
+    def test_fields_limits_response(self):
+        self.add_trip()
+        response = self.client.get("/api/trips/?fields=id,status")
+        self.assertEqual(set(response.data["results"][0]), {"id", "status"})
+
+        response = self.client.get("/api/trips/?fields=id&expand=stops")
+        self.assertEqual(set(response.data["results"][0]), {"id", "stops"})
+
+    def test_all_log_sheets_are_paginated(self):
+        self.add_trip(log_sheets=3, changes=1)
+        response = self.client.get("/api/log-sheets/?page_size=2")
+        self.assertEqual(len(response.data["results"]), 2)
+        self.assertIsNotNone(response.data["next"])
+        self.assertNotIn("duty_status_changes", response.data["results"][0])
+
+    def test_log_sheet_list_filters_by_status(self):
+        trip = self.add_trip(log_sheets=3, changes=0)
+        newest_completed = trip.log_sheets.filter(status="completed").latest("created_at")
+        response = self.client.get("/api/log-sheets/?status=completed&page_size=1")
+        self.assertEqual(
+            [log_sheet["id"] for log_sheet in response.data["results"]], [newest_completed.id]
+        )
+
+
+class TripDeltaResponseTests(TripDataTestCase):
+    """Custom trip actions return only what changed since a client's version"""
+
+    def test_delta_contains_only_changed_stops(self):
+        trip = self.add_trip(stops=4, log_sheets=1, changes=1)
+        stop = trip.stops.order_by("sequence").first()
+
+        full = self.client.post(
+            f"/api/trips/{trip.id}/update_stop_status/",
+            {"stop_id": stop.id, "status": "in_progress"},
+            format="json",
+        )
+        self.assertEqual(len(full.data["stops"]), 4)
+        self.assertEqual(full["ETag"], f'"{full.data["version"]}"')
+
+        response = self.client.post(
+            f"/api/trips/{trip.id}/update_stop_status/?since={full.data['version']}",
+            {"stop_id": stop.id, "status": "skipped"},
+            format="json",
+        )
+        self.assertTrue(response.data["delta"])
+        self.assertIsNone(response.data["trip"])
+        self.assertEqual([s["id"] for s in response.data["stops"]], [stop.id])
+        self.assertEqual(len(response.data["stop_ids"]), 4)
+        self.assertEqual(response.data["log_sheets"], [])
+        self.assertNotEqual(response.data["version"], full.data["version"])
+
+    def test_full_response_sends_route_once(self):
+        trip = self.add_trip(stops=2, log_sheets=1, changes=1)
+        trip.route = {"routes": [{"distance": 1000.0, "duration": 60.0, "legs": []}]}
+        trip.save()
+
+        response = self.client.post(f"/api/trips/{trip.id}/complete/")
+        self.assertEqual(response.data["route"], trip.route)
+        self.assertNotIn("route", response.data["trip"])
+        self.assertNotIn("stops", response.data["trip"])
+        self.assertEqual(len(response.data["stops"]), 2)
+
+    def test_delta_resends_sheet_of_deleted_change(self):
+        trip = self.add_trip(stops=1, log_sheets=2, changes=2)
+        version = self.client.post(f"/api/trips/{trip.id}/complete/").data["version"]
+        log_sheet = trip.log_sheets.order_by("start_time").first()
+        log_sheet.duty_status_changes.order_by("time").last().delete()
+
+        response = self.client.post(f"/api/trips/{trip.id}/complete/?since={version}")
+        self.assertEqual([sheet["id"] for sheet in response.data["log_sheets"]], [log_sheet.id])
+        self.assertEqual(len(response.data["log_sheets"][0]["duty_status_changes"]), 1)
+
+
+class ConditionalGetTests(TripDataTestCase):
+    """Polling unchanged trips and log sheets is answered with 304"""
+
+    def test_unchanged_trip_costs_one_query(self):
+        trip = self.add_trip()
+        first = self.client.get(f"/api/trips/{trip.id}/")
+        etag = first["ETag"]
+
+        with self.assertNumQueries(1):
+            response = self.client.get(f"/api/trips/{trip.id}/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+    def test_child_changes_and_deletes_change_the_etag(self):
+        trip = self.add_trip(stops=3, log_sheets=1, changes=2)
+        etag = self.client.get(f"/api/trips/{trip.id}/")["ETag"]
+
+        change = DutyStatusChange.objects.filter(log_sheet__trip=trip).first()
+        change.label = "Fuel"
+        change.save()
+        response = self.client.get(f"/api/trips/{trip.id}/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        etag = response["ETag"]
+        trip.stops.order_by("sequence").last().delete()
+        response = self.client.get(f"/api/trips/{trip.id}/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_lists_vary_by_query_string(self):
+        self.add_trip()
+        etag = self.client.get("/api/log-sheets/")["ETag"]
+        response = self.client.get("/api/log-sheets/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(
+            "/api/log-sheets/?expand=duty_status_changes", HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 200)
+
+
+class TripCacheTests(TripDataTestCase):
+    """Serialized trips are cached until one of their rows changes"""
+
+    def test_cached_trip_skips_nested_queries(self):
+        trip = self.add_trip(stops=5, log_sheets=2, changes=3)
+        url = f"/api/trips/{trip.id}/"
+        self.assertEqual(self.client.get(url)["X-Cache"], "MISS")
+
+        # ETag version, trip visibility
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertEqual(response["X-Cache"], "HIT")
+        self.assertEqual(len(response.data["stops"]), 5)
+
+    def test_writes_invalidate_cached_trip(self):
+        trip = self.add_trip(stops=2, log_sheets=1, changes=1)
+        url = f"/api/trips/{trip.id}/"
+        self.client.get(url)
+
+        change = DutyStatusChange.objects.filter(log_sheet__trip=trip).first()
+        change.label = "Weigh station"
+        change.save()
+        response = self.client.get(url)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(
+            response.data["log_sheets"][0]["duty_status_changes"][0]["label"], "Weigh station"
+        )
+
+    def test_write_invalidated_by_another_process_is_not_served(self):
+        trip = self.add_trip(stops=2, log_sheets=1, changes=1)
+        url = f"/api/trips/{trip.id}/"
+        self.client.get(url)
+
+        # The writer's signals reach its own cache, not the one serving reads
+        with mock.patch("api.trip_cache.trip_cache", TripRepresentationCache("default")):
+            Stop.objects.filter(trip=trip).first().delete()
+        response = self.client.get(url)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(len(response.data["stops"]), 1)
+
+    def test_bypass_header_skips_cache(self):
+        trip = self.add_trip()
+        self.client.get("/api/trips/")
+        response = self.client.get("/api/trips/", HTTP_X_CACHE_BYPASS="1")
+        self.assertEqual(response["X-Cache"], "BYPASS")
+        self.assertEqual(response.data["results"][0]["id"], trip.id)
+
+
+class DutyHoursSummaryTests(TripDataTestCase):
+    """Per-status duty hours for many log sheets at once"""
+
+    def test_calculate_duty_hours_sums_until_next_change(self):
+        trip = self.add_trip(stops=0, log_sheets=1, changes=0)
+        log_sheet = trip.log_sheets.get()
+        start = log_sheet.start_time
+        for minutes, duty_status in ((0, "onDuty"), (30, "driving"), (330, "offDuty"), (360, "driving")):
+            DutyStatusChange.objects.create(
+                log_sheet=log_sheet,
+                time=start + timedelta(minutes=minutes),
+                status=duty_status,
+                location=self.location(),
+            )
+        self.assertEqual(
+            log_sheet.calculate_duty_hours(),
+            {"offDuty": 0.5, "sleeper": 0, "driving": 5.0, "onDuty": 0.5},
+        )
+
+    def test_summary_query_count_is_constant(self):
+        for _ in range(3):
+            self.add_trip(stops=0, log_sheets=3, changes=4)
+
+        with self.assertNumQueries(2):
+            response = self.client.get("/api/log-sheets/summary/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["count"], 9)
+        self.assertEqual(response.data["totals"]["driving"], 27)
+        self.assertEqual(response.data["log_sheets"][0]["hours"]["driving"], 3)
+
+    def test_summary_filters_by_date(self):
+        trip = self.add_trip(stops=0, log_sheets=3)
+        first = trip.log_sheets.order_by("start_time").first().start_time
+        response = self.client.get(
+            f"/api/trips/{trip.id}/log-sheets/summary/",
+            {"from": first.isoformat(), "to": timezone.localdate(first + timedelta(days=1)).isoformat()},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["count"], 2)
+
+        response = self.client.get("/api/log-sheets/summary/", {"from": "last week"})
+        self.assertEqual(response.status_code, 400)
+
+
+class LogSheetIndexTests(TripDataTestCase):
+    """Hot log sheet queries are served by their composite indexes"""
+
+    def test_hot_queries_use_indexes(self):
+        trip = self.add_trip(stops=0, log_sheets=3, changes=0)
+        now = timezone.now()
+        self.assertUsesIndex(
+            LogSheet.objects.filter(trip=trip, status="active"), "log_sheet_trip_status_idx"
+        )
+        self.assertUsesIndex(
+            LogSheet.objects.filter(trip=trip, start_time__lte=now, end_time__gte=now),
+            "log_sheet_trip_period_idx",
+        )
+        self.assertUsesIndex(
+            LogSheet.objects.filter(trip=trip).order_by("-created_at"),
+            "log_sheet_trip_created_idx",
+        )
+        self.assertUsesIndex(
+            Trip.objects.filter(created_by=self.user).order_by("-created_at"),
+            "trip_created_by_created_idx",
+        )
+
+    def test_one_active_log_sheet_per_trip(self):
+        trip = self.add_trip(stops=0, log_sheets=0)
+        data = {
+            "start_time": timezone.now().isoformat(),
+            "start_location": {"latitude": 41.5, "longitude": -99.5},
+            "start_cycle_hours": 5,
+            "status": "active",
+        }
+        url = f"/api/trips/{trip.id}/log-sheets/"
+        self.assertEqual(self.client.post(url, data, format="json").status_code, 201)
+        data["start_time"] = (timezone.now() + timedelta(days=2)).isoformat()
+        self.assertEqual(self.client.post(url, data, format="json").status_code, 400)
+        self.assertEqual(trip.log_sheets.filter(status="active").count(), 1)
+
+
+class StopOrderingTests(TripDataTestCase):
+    """Stops come back in sequence order and are looked up through indexes"""
+
+    def test_stops_are_ordered_by_sequence(self):
+        trip = self.add_trip(stops=0, log_sheets=0)
+        for sequence in (3, 1, 2):
+            Stop.objects.create(
+                trip=trip,
+                location=self.location(),
+                sequence=sequence,
+                stop_type="rest",
+                arrival_time=timezone.now(),
+                duration_minutes=30,
+                cycle_hours_at_stop=5,
+            )
+        self.assertEqual(trip.stops.first().sequence, 1)
+        self.assertEqual([stop.sequence for stop in trip.stops.all()], [1, 2, 3])
+
+        response = self.client.get(f"/api/trips/{trip.id}/")
+        self.assertEqual([stop["sequence"] for stop in response.data["stops"]], [1, 2, 3])
+
+    def test_stop_scans_use_indexes(self):
+        trip = self.add_trip(log_sheets=0)
+        self.assertUsesIndex(trip.stops.filter(sequence__gt=1), "stop_trip_sequence_idx")
+        # Bulk status updates run unordered
+        self.assertUsesIndex(trip.stops.filter(status="pending").order_by(), "stop_trip_status_idx")
+
+
+class StopResequencingTests(TripDataTestCase):
+    """Stop renumbering runs as one UPDATE, whatever the number of stops"""
+
+    def sequences(self, trip):
+        return list(trip.stops.values_list("id", "sequence"))
+
+    def test_reorder_stops_applies_new_order(self):
+        trip = self.add_trip(stops=5, log_sheets=0)
+        ids = [stop_id for stop_id, _ in self.sequences(trip)]
+        new_order = [ids[4], ids[0], ids[1], ids[2], ids[3]]
+
+        # The locking read and one UPDATE, inside a savepoint
+        with self.assertNumQueries(4):
+            resequence_stops(trip, new_order)
+        self.assertEqual(self.sequences(trip), [(stop_id, i) for i, stop_id in enumerate(new_order, 1)])
+
+        response = self.client.post(
+            f"/api/trips/{trip.id}/reorder_stops/", {"stop_ids": ids}, format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([stop["id"] for stop in response.data["stops"]], ids)
+
+        response = self.client.post(
+            f"/api/trips/{trip.id}/reorder_stops/", {"stop_ids": ids[:-1]}, format="json"
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_delete_stop_closes_the_gap(self):
+        trip = self.add_trip(stops=4, log_sheets=0)
+        second = trip.stops.get(sequence=2)
+        response = self.client.delete(f"/api/trips/{trip.id}/delete_stop/?stop_id={second.id}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([sequence for _, sequence in self.sequences(trip)], [1, 2, 3])
+
+
+class CloseActiveTripsTests(TripDataTestCase):
+    """Stale in-progress trips are closed with a fixed number of queries"""
+
+    def add_active_trips(self, count):
+        trips = [self.add_trip(stops=2, log_sheets=1, changes=2) for _ in range(count)]
+        Trip.objects.filter(pk__in=[trip.pk for trip in trips]).update(status="in_progress")
+        return trips
+
+    def test_query_count_does_not_grow_with_backlog(self):
+        self.add_active_trips(1)
+        with CaptureQueriesContext(connection) as one:
+            close_active_trips(self.user)
+        self.add_active_trips(5)
+        with CaptureQueriesContext(connection) as five:
+            self.assertEqual(len(close_active_trips(self.user)), 5)
+        self.assertEqual(len(one), len(five))
+
+    def test_start_trip_closes_other_trips(self):
+        stale = self.add_active_trips(3)
+        trip = self.add_trip(log_sheets=0)
+        response = self.client.post(f"/api/trips/{trip.id}/start_trip/")
+        self.assertEqual(response.status_code, 200)
+
+        self.assertFalse(Trip.objects.filter(pk__in=[t.pk for t in stale], status="in_progress").exists())
+        self.assertFalse(Stop.objects.filter(trip__in=stale, status="pending").exists())
+        log_sheet = stale[0].log_sheets.get()
+        self.assertEqual(log_sheet.status, "completed")
+        self.assertEqual(log_sheet.end_location_id, stale[0].current_location_id)
+        # 5 entered plus the 1 hour driven between the two logged changes
+        self.assertAlmostEqual(log_sheet.end_cycle_hours, 6)
+        self.assertEqual(Trip.objects.get(pk=trip.pk).status, "in_progress")
+
+
+class DutyStatusBatchTests(TripDataTestCase):
+    """Buffered duty status changes uploaded in one request"""
+
+    def changes(self, log_sheet, count, prefix="evt"):
+        return [
+            {
+                "time": (log_sheet.start_time + timedelta(minutes=15 * i)).isoformat(),
+                "status": "driving" if i % 2 else "onDuty",
+                "location": {"latitude": 40.5 + i * 0.01, "longitude": -99.0},
+                "idempotency_key": f"{prefix}-{i}",
+            }
+            for i in range(count)
+        ]
+
+    def test_batch_is_inserted_with_constant_queries(self):
+        trip = self.add_trip(stops=0, log_sheets=1, changes=0)
+        log_sheet = trip.log_sheets.get()
+        url = f"/api/log-sheets/{log_sheet.id}/duty_status_changes/"
+
+        with CaptureQueriesContext(connection) as small:
+            response = self.client.post(url, self.changes(log_sheet, 2, "a"), format="json")
+        self.assertEqual(response.status_code, 201)
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.post(url, {"changes": self.changes(log_sheet, 40, "b")}, format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data["created"]), 40)
+        self.assertEqual(len(small), len(large))
+        # The ledger saw the batch although bulk_create sends no signals
+        self.assertTrue(log_sheet.duty_days.exists())
+
+    def test_retried_upload_skips_stored_changes(self):
+        trip = self.add_trip(stops=0, log_sheets=1, changes=0)
+        log_sheet = trip.log_sheets.get()
+        url = f"/api/log-sheets/{log_sheet.id}/duty_status_changes/"
+        changes = self.changes(log_sheet, 5)
+
+        self.client.post(url, changes[:3], format="json")
+        response = self.client.post(url, changes, format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data["created"]), 2)
+        self.assertEqual(response.data["skipped_keys"], ["evt-0", "evt-1", "evt-2"])
+        self.assertEqual(log_sheet.duty_status_changes.count(), 5)
+
+        response = self.client.post(url, changes, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(log_sheet.duty_status_changes.count(), 5)
+
+    def test_concurrent_single_change_returns_stored_row(self):
+        trip = self.add_trip(stops=0, log_sheets=1, changes=0)
+        log_sheet = trip.log_sheets.get()
+        change = self.changes(log_sheet, 1)[0]
+        stored = DutyStatusChange.objects.create(
+            log_sheet=log_sheet,
+            time=log_sheet.start_time,
+            status="onDuty",
+            location=self.location(),
+            idempotency_key=change["idempotency_key"],
+        )
+        first = QuerySet.first
+
+        def stale_first(queryset):
+            # The key check misses a row another request stored meanwhile
+            return None if queryset.model is DutyStatusChange else first(queryset)
+
+        with mock.patch.object(QuerySet, "first", stale_first):
+            response = self.client.post(
+                f"/api/log-sheets/{log_sheet.id}/duty_status_change/", change, format="json"
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["id"], stored.id)
+        self.assertEqual(log_sheet.duty_status_changes.count(), 1)
+
+    def test_invalid_item_rejects_the_whole_batch(self):
+        trip = self.add_trip(stops=0, log_sheets=1, changes=0)
+        log_sheet = trip.log_sheets.get()
+        changes = self.changes(log_sheet, 3)
+        changes[1]["location"] = {"latitude": "north"}
+        response = self.client.post(
+            f"/api/log-sheets/{log_sheet.id}/duty_status_changes/", changes, format="json"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(log_sheet.duty_status_changes.exists())
+
+
+class RouteGeometryTests(TestCase):
+    """Polyline storage and simplification of route lines"""
+
+    def test_polyline_round_trip(self):
+        line = [[-100.123456, 40.654321], [-99.5, 40.7], [-98.000001, 41.25]]
+        self.assertEqual(decode_polyline(encode_polyline(line)), line)
+
+    def test_simplify_keeps_shape_within_tolerance(self):
+        straight = [[i * 0.01, 0] for i in range(100)]
+        self.assertEqual(simplify(straight, 1), [straight[0], straight[-1]])
+
+        corner = [[0, 0], [0.5, 0], [1, 0], [1, 0.5], [1, 1]]
+        self.assertEqual(simplify(corner, 10), [[0, 0], [1, 0], [1, 1]])
+
+    def test_route_index_positions_by_driving_time(self):
+        line = [[0, 0], [0.5, 0], [1, 0], [1, 1]]
+        # A slow first half of the way east, then twice as fast
+        legs = [{"steps": [
+            {"duration": 2000, "distance": 55660},
+            {"duration": 1000, "distance": 55660},
+            {"duration": 2000, "distance": 111320},
+        ]}]
+        index = RouteIndex(line, legs)
+        for elapsed, expected in ((0, [0, 0]), (1000, [0.25, 0]), (2500, [0.75, 0]), (4000, [1, 0.5])):
+            position = index.position_at(elapsed)
+            self.assertAlmostEqual(position[0], expected[0], places=3)
+            self.assertAlmostEqual(position[1], expected[1], places=3)
+        self.assertEqual(index.position_at(10 ** 6), [1, 1])
+
+    def test_split_route_geometry_keeps_only_leg_totals(self):
+        line = {"type": "LineString", "coordinates": [[0, 0], [1, 0]]}
+        leg = {"summary": "I-80", "distance": 111320.0, "duration": 4000.0, "steps": [
+            {"distance": 111320.0, "duration": 4000.0, "geometry": line, "maneuver": {}},
+        ]}
+        route_data = {"routes": [{"geometry": line, "distance": 111320.0, "legs": [leg]}]}
+
+        stored, coordinates = split_route_geometry(route_data)
+        self.assertEqual(coordinates, [[0, 0], [1, 0]])
+        self.assertEqual(
+            stored["routes"][0],
+            {"distance": 111320.0, "legs": [{"summary": "I-80", "distance": 111320.0, "duration": 4000.0}]},
+        )
+        # Planning still sees the full response
+        self.assertIn("steps", route_data["routes"][0]["legs"][0])
+
+
+class HOSSchedulerTests(TestCase):
+    """Stops the HOS scheduler inserts along a route"""
+
+    def legs(self, hours, steps=1000, mph=50):
+        step = {"duration": hours * 3600 / steps, "distance": hours * mph * 1609.34 / steps}
+        return [{"steps": [dict(step) for _ in range(steps)]}]
+
+    def test_multi_day_route_stays_within_limits(self):
+        events = schedule_trip(self.legs(40), [("dropoff", 3600)], current_cycle_hours=40)
+        kinds = [event.kind for event in events]
+        self.assertIn("rest", kinds)
+        self.assertIn("break", kinds)
+        self.assertIn("fuel", kinds)
+        self.assertIn("restart", kinds)
+        self.assertEqual(kinds[-1], "dropoff")
+        self.assertEqual(events[-1].waypoint_index, 1)
+
+        driving = since_break = 0
+        for event in events:
+            if event.kind == "driving":
+                driving += event.duration
+                since_break += event.duration
+                self.assertLessEqual(driving, 11 * 3600 + 1)
+                self.assertLessEqual(since_break, 8 * 3600 + 1)
+                self.assertLessEqual(event.cycle_hours + event.duration / 3600, 70 + 1e-3)
+            elif event.kind in ("rest", "restart"):
+                driving = since_break = 0
+            elif event.duration >= 30 * 60:
+                since_break = 0
+
+        total_driving = sum(event.duration for event in events if event.kind == "driving")
+        self.assertAlmostEqual(total_driving, 40 * 3600, places=3)
+
+    def test_short_route_needs_no_rest(self):
+        events = schedule_trip(self.legs(3, steps=10), [("pickup", 3600)])
+        self.assertEqual([event.kind for event in events], ["driving", "pickup"])
+
+    def test_tank_nearly_empty_at_high_speed_makes_progress(self):
+        scheduler = HOSScheduler(fuel_interval_miles=100)
+        # Short of the range by less than a millimetre, but more than a
+        # microsecond's driving at 1 km/s
+        scheduler.distance_since_fuel = scheduler.fuel_interval - 1e-4
+        scheduler.drive_step(10, 10000)
+        self.assertEqual([event.kind for event in scheduler.events], ["fuel", "driving"])
+        self.assertAlmostEqual(scheduler.distance, 10000)
+
+
+class CycleLedgerTests(TripDataTestCase):
+    """Rolling cycle hours kept up to date from duty status changes"""
+
+    def log_day(self, log_sheet, start, *segments):
+        """Changes every segment = (hours, status), closed with offDuty"""
+        for hours, duty_status in segments + ((0, "offDuty"),):
+            DutyStatusChange.objects.create(
+                log_sheet=log_sheet, time=start, status=duty_status, location=self.location()
+            )
+            start += timedelta(hours=hours)
+
+    def test_ledger_follows_inserts_and_deletes(self):
+        trip = self.add_trip(stops=0, log_sheets=1, changes=0)
+        log_sheet = trip.log_sheets.get()
+        today = timezone.localdate()
+        start = timezone.make_aware(datetime.combine(today, datetime.min.time()))
+        self.log_day(log_sheet, start + timedelta(hours=6), (1, "onDuty"), (8, "driving"), (1, "offDuty"), (2, "driving"))
+        self.log_day(log_sheet, start - timedelta(days=3, hours=2), (4, "driving"))
+
+        self.assertEqual(cycle_hours(self.user), 15)
+        # The 4-hour shift is split at midnight, so it leaves the window in two steps
+        self.assertEqual(cycle_hours(self.user, today + timedelta(days=4)), 13)
+        self.assertEqual(cycle_hours(self.user, today + timedelta(days=5)), 11)
+
+        with self.assertNumQueries(1):
+            summary = recap(self.user)
+        self.assertEqual(summary["cycle_hours"], 15)
+        self.assertEqual(summary["hours_available"], 55)
+        self.assertEqual(summary["days"][-1]["on_duty_hours"], 11)
+
+        log_sheet.duty_status_changes.filter(status="onDuty").delete()
+        self.assertEqual(cycle_hours(self.user), 14)
+        log_sheet.delete()
+        self.assertEqual(cycle_hours(self.user), 0)
+
+    def ledger(self, log_sheet):
+        return {
+            day.day: (round(day.on_duty_hours, 6), round(day.driving_hours, 6))
+            for day in log_sheet.duty_days.all()
+            if day.on_duty_hours or day.driving_hours
+        }
+
+    def test_single_changes_update_only_their_days(self):
+        trip = self.add_trip(stops=0, log_sheets=1, changes=0)
+        log_sheet = trip.log_sheets.get()
+        start = timezone.make_aware(datetime.combine(timezone.localdate(), datetime.min.time()))
+        for day in range(6):
+            self.log_day(log_sheet, start - timedelta(days=day, hours=-6), (3, "driving"), (2, "onDuty"))
+        change = log_sheet.duty_status_changes.order_by("time").last()
+        location = change.location
+
+        # Insert, trip to invalidate, both neighbours, driver, then inside a
+        # savepoint the existing days and one update for the only day touched
+        with self.assertNumQueries(9):
+            DutyStatusChange.objects.create(
+                log_sheet=log_sheet, time=start + timedelta(hours=7), status="onDuty", location=location
+            )
+
+        change.time -= timedelta(minutes=30)
+        change.status = "driving"
+        change.save()
+        log_sheet.duty_status_changes.order_by("time")[2].delete()
+        incremental = self.ledger(log_sheet)
+
+        record_log_sheet(log_sheet.id)
+        self.assertEqual(incremental, self.ledger(log_sheet))
+
+    def test_recap_endpoint(self):
+        response = self.client.get("/api/hos/recap/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["days"]), 8)
+        self.assertEqual(response.data["hours_available"], 70)
+        self.assertEqual(self.client.get("/api/hos/recap/", {"date": "soon"}).status_code, 400)
+
+
+class RouteCacheTests(TestCase):
+    """LRU cache of routing responses, optionally backed by a Django cache"""
+
+    def tearDown(self):
+        set_routing_provider(None)
+
+    def test_entries_expire_after_ttl(self):
+        cache = RouteCache(max_entries=4, ttl_seconds=60)
+        with mock.patch("api.routing.time.monotonic", return_value=1000):
+            cache.set("lane", {"routes": [1]})
+        with mock.patch("api.routing.time.monotonic", return_value=1059):
+            self.assertEqual(cache.get("lane"), {"routes": [1]})
+        with mock.patch("api.routing.time.monotonic", return_value=1061):
+            self.assertIsNone(cache.get("lane"))
+        self.assertEqual(cache.stats()["size"], 0)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = RouteCache(max_entries=2, ttl_seconds=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual((cache.get("a"), cache.get("c")), (1, 3))
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_hits_and_misses_are_counted(self):
+        cache = RouteCache()
+        cache.get("lane")
+        cache.set("lane", 1)
+        cache.get("lane")
+        cache.get("lane")
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (2, 1))
+        self.assertAlmostEqual(stats["hit_rate"], 2 / 3)
+
+    def test_keys_ignore_float_formatting(self):
+        params = {"overview": "false"}
+        self.assertEqual(
+            RouteCache.make_key([(-100.1, 40.2), (-99, 41)], params),
+            RouteCache.make_key([("-100.1000000001", "40.2"), (-99.0, 41.0)], params),
+        )
+        self.assertNotEqual(
+            RouteCache.make_key([(-100.1, 40.2)], params),
+            RouteCache.make_key([(-100.1, 40.2)], {"overview": "full"}),
+        )
+
+    def test_fetch_route_calls_provider_once_per_lane(self):
+        provider = LocalRoutingProvider()
+        set_routing_provider(provider)
+        lane = [(-100, 40), (-99, 41)]
+        with mock.patch.object(provider, "route", wraps=provider.route) as route:
+            first = fetch_route(lane, {"overview": "false"})
+            second = fetch_route([(-100.0, 40.0), (-99.0, 41.0)], {"overview": "false"})
+            fetch_route(lane, {"overview": "full"})
+        self.assertEqual(first, second)
+        self.assertEqual(route.call_count, 2)
+
+    def test_hits_are_copies(self):
+        cache = RouteCache()
+        cache.set("lane", {"routes": [{"distance": 1.0}]})
+        cache.get("lane")["routes"].clear()
+        self.assertEqual(cache.get("lane"), {"routes": [{"distance": 1.0}]})
+
+    def test_entries_are_shared_through_the_cache_alias(self):
+        writer = RouteCache(alias="default")
+        reader = RouteCache(alias="default")
+        writer.set("lane", {"routes": [1]})
+        self.assertEqual(reader.get("lane"), {"routes": [1]})
+        writer.clear()
+
+
+class FuelTableTests(TestCase):
+    """Distance tables between route waypoints and fuel candidates"""
+
+    route = [(-100.0, 40.0), (-98.0, 40.5), (-96.0, 41.0)]
+    candidates = [(-99.0 + i * 0.2, 40.2 + i * 0.05) for i in range(7)]
+
+    def setUp(self):
+        self.provider = LocalRoutingProvider()
+        set_routing_provider(self.provider)
+
+    def tearDown(self):
+        set_routing_provider(None)
+
+    def test_candidates_are_split_to_fit_table_requests(self):
+        with mock.patch("api.fuel.OSRM_TABLE_MAX_COORDINATES", 5):
+            chunks = _candidate_chunks(self.route, self.candidates)
+        # Each request carries the 3 waypoints and at most 2 candidates
+        self.assertEqual([len(chunk) for chunk in chunks], [5, 5, 5, 4])
+        self.assertTrue(all(chunk[:3] == self.route for chunk in chunks))
+        self.assertEqual([c for chunk in chunks for c in chunk[3:]], self.candidates)
+
+    def test_chunked_tables_match_one_table(self):
+        table = self.provider.table(self.route + self.candidates, {})
+        expected = _assemble_candidate_distances([table], len(self.route))
+
+        with mock.patch("api.fuel.OSRM_TABLE_MAX_COORDINATES", 5), mock.patch.object(
+            self.provider, "table", wraps=self.provider.table
+        ) as table_calls:
+            chunked = _fetch_candidate_distances(self.route, self.candidates)
+            self.assertEqual(table_calls.call_count, 4)
+            asynchronous = asyncio.run(
+                _async_fetch_candidate_distances(self.route, self.candidates)
+            )
+
+        for matrices in (chunked, asynchronous):
+            for actual, wanted in zip(matrices, expected):
+                np.testing.assert_allclose(actual, wanted)
+        legs, to_candidate, from_candidate = chunked
+        self.assertEqual(legs.shape, (2,))
+        self.assertEqual(to_candidate.shape, (3, 7))
+        self.assertEqual(from_candidate.shape, (7, 3))
+
+    def test_route_probes_score_like_tables(self):
+        candidates = self.candidates[:3]
+        expected = score_fuel_insertions(*_fetch_candidate_distances(self.route, candidates))
+        self.assertTrue(np.isfinite(expected).any())
+
+        probed = _score_positions_from_routes(self.route, candidates)
+        asynchronous = asyncio.run(_async_score_positions_from_routes(self.route, candidates))
+        np.testing.assert_allclose(probed, expected)
+        np.testing.assert_allclose(asynchronous, expected)
+
+    def test_unreachable_candidates_are_not_placed(self):
+        trip = Trip(current_cycle_hours=0)
+        waypoints = [("start", None), ("pickup", None), ("dropoff", None)]
+        self.assertIsNone(place_fuel_stop(trip, waypoints, [{"latitude": 40, "longitude": -99}], None))
+        self.assertEqual(len(waypoints), 3)
+        self.assertIsNone(trip.fuel_stop)
+
+
+class FuelScoringTests(TestCase):
+    """Vectorized scoring of fuel stop insertions"""
+
+    def miles(self, values):
+        return np.array(values, dtype=float) * METERS_PER_MILE
+
+    def test_out_of_range_and_unroutable_insertions_are_rejected(self):
+        # Waypoints A -> B -> C, 300 miles apart
+        legs = self.miles([300, 300])
+        # Rows are waypoints A, B, C; columns are candidates
+        to_candidate = self.miles([
+            [240, 500, np.nan],
+            [60, 200, np.nan],
+            [360, 100, np.nan],
+        ])
+        from_candidate = self.miles([
+            [240, 60, 360],
+            [500, 200, 100],
+            [np.nan, np.nan, np.nan],
+        ])
+
+        scores = score_fuel_insertions(legs, to_candidate, from_candidate)
+        self.assertEqual(scores.shape, (3, 2))
+        # 240 miles in, right on the way to B
+        self.assertAlmostEqual(scores[0, 0], 0)
+        # After B it is 120 miles past the ideal point plus a 120 mile detour
+        self.assertAlmostEqual(scores[0, 1], 240)
+        # 500 miles to reach, beyond the usable range either way
+        self.assertTrue(np.isinf(scores[1]).all())
+        self.assertTrue(np.isinf(scores[2]).all())
+        self.assertEqual(_best_insertion(scores), (0, 1))
+
+    def test_nothing_feasible_gives_no_insertion(self):
+        scores = np.full((2, 3), np.inf)
+        self.assertIsNone(_best_insertion(scores))
+
+
+class LocalRoutingProviderTests(TestCase):
+    """Offline OSRM stand-in"""
+
+    coordinates = [(-100.0, 40.0), (-99.0, 40.5), (-97.0, 41.0)]
+
+    def test_route_has_osrm_shape(self):
+        provider = LocalRoutingProvider(max_step_meters=50000)
+        data = provider.route(self.coordinates, {"steps": "true", "overview": "full"})
+
+        self.assertEqual(data["code"], "Ok")
+        self.assertEqual(len(data["waypoints"]), 3)
+        route = data["routes"][0]
+        self.assertEqual(len(route["legs"]), 2)
+        self.assertAlmostEqual(route["distance"], sum(leg["distance"] for leg in route["legs"]))
+        self.assertAlmostEqual(route["duration"], route["distance"] / provider.speed_mps)
+
+        line = route["geometry"]["coordinates"]
+        self.assertEqual(line[0], list(self.coordinates[0]))
+        self.assertEqual(line[-1], list(self.coordinates[-1]))
+        for leg in route["legs"]:
+            steps = leg["steps"]
+            self.assertEqual(steps[0]["maneuver"]["type"], "depart")
+            self.assertEqual(steps[-1]["maneuver"]["type"], "arrive")
+            self.assertLessEqual(max(step["distance"] for step in steps), 50000)
+            self.assertAlmostEqual(sum(step["distance"] for step in steps), leg["distance"])
+
+    def test_route_without_steps_or_overview(self):
+        data = LocalRoutingProvider().route(self.coordinates, {"overview": "false"})
+        route = data["routes"][0]
+        self.assertNotIn("geometry", route)
+        self.assertEqual([leg["steps"] for leg in route["legs"]], [[], []])
+
+    def test_table_matches_route_legs(self):
+        provider = LocalRoutingProvider()
+        table = provider.table(self.coordinates, {})
+        legs = provider.route(self.coordinates, {})["routes"][0]["legs"]
+
+        self.assertEqual(table["code"], "Ok")
+        self.assertEqual(len(table["distances"]), 3)
+        self.assertEqual(table["distances"][1][1], 0)
+        self.assertAlmostEqual(table["distances"][0][1], legs[0]["distance"])
+        self.assertAlmostEqual(table["durations"][1][2], legs[1]["duration"])
+
+
+class RoutingResilienceTests(TestCase):
+    """Circuit breaker and retries around OSRM calls"""
+
+    def test_breaker_opens_after_consecutive_failures(self):
+        breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+        with mock.patch("api.routing.time.monotonic", return_value=100):
+            breaker.record_failure()
+            breaker.record_success()
+            for _ in range(2):
+                breaker.record_failure()
+            self.assertTrue(breaker.allow_request())
+            breaker.record_failure()
+            self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+            self.assertFalse(breaker.allow_request())
+        self.assertEqual(breaker.stats()["rejected"], 1)
+
+    def test_half_open_breaker_lets_one_trial_through(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+        with mock.patch("api.routing.time.monotonic", return_value=100):
+            breaker.record_failure()
+        with mock.patch("api.routing.time.monotonic", return_value=131):
+            self.assertTrue(breaker.allow_request())
+            self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+            self.assertFalse(breaker.allow_request())
+            # A failed trial re-opens the breaker for another cool-down
+            breaker.record_failure()
+            self.assertFalse(breaker.allow_request())
+        with mock.patch("api.routing.time.monotonic", return_value=162):
+            self.assertTrue(breaker.allow_request())
+            breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(breaker.stats()["times_opened"], 2)
+
+    def test_session_retries_idempotent_requests(self):
+        provider = OSRMHttpProvider(max_retries=2, backoff_factor=0.5)
+        retry = provider.session.get_adapter("https://router.example").max_retries
+        self.assertEqual(retry.total, 2)
+        self.assertEqual(retry.backoff_factor, 0.5)
+        self.assertEqual(set(retry.status_forcelist), {429, 500, 502, 503, 504})
+        self.assertEqual(retry.allowed_methods, frozenset(["GET"]))
+
+    def test_failures_trip_the_breaker_and_fail_fast(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+        provider = OSRMHttpProvider(breaker=breaker)
+        with mock.patch.object(
+            provider.session, "get", side_effect=requests.ConnectionError("refused")
+        ) as get:
+            for _ in range(3):
+                with self.assertRaises(RoutingError):
+                    provider.route([(-100, 40), (-99, 41)], {})
+        self.assertEqual(get.call_count, 2)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(provider.stats()["requests_failed"], 2)
+
+    def test_async_requests_retry_server_errors(self):
+        provider = OSRMHttpProvider(max_retries=2, backoff_factor=0)
+        statuses = iter([503, 502, 200])
+
+        def respond(request):
+            return httpx.Response(next(statuses), json={"code": "Ok", "routes": []})
+
+        client = httpx.AsyncClient(transport=httpx.MockTransport(respond))
+        with mock.patch.object(provider, "_make_async_client", return_value=client):
+            route = asyncio.run(provider.aroute([(-100, 40), (-99, 41)], {}))
+        self.assertEqual(route, {"code": "Ok", "routes": []})
+        self.assertEqual(next(statuses, None), None)
+        self.assertEqual(provider.breaker.state, CircuitBreaker.CLOSED)
+        # Closed along with its event loop
+        self.assertTrue(client.is_closed)
+        self.assertEqual(provider._async_clients, {})
+
+    def test_non_json_response_is_a_routing_failure(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+        provider = OSRMHttpProvider(breaker=breaker)
+        response = requests.Response()
+        response.status_code = 200
+        response._content = b"<html>Gateway</html>"
+        with mock.patch.object(provider.session, "get", return_value=response):
+            with self.assertRaises(RoutingError):
+                provider.route([(-100, 40), (-99, 41)], {})
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(provider.stats()["requests_failed"], 1)
+
+
+class BulkLocationTests(TestCase):
+    """Resolving many location dicts to Location rows at once"""
+
+    def points(self, count, latitude=41.0):
+        return [
+            {"latitude": latitude + i * 0.01, "longitude": -100.0, "street_name": f"Point {i}"}
+            for i in range(count)
+        ]
+
+    def test_query_count_does_not_grow_with_batch_size(self):
+        Location.objects.create(latitude=41.0, longitude=-100.0)
+        # Existing rows, insert of the missing ones, read back
+        with self.assertNumQueries(3):
+            get_or_create_locations(self.points(2), radius_meters=0)
+        with self.assertNumQueries(3):
+            get_or_create_locations(self.points(30, latitude=45.0), radius_meters=0)
+
+    def test_rows_come_back_in_order_without_duplicates(self):
+        existing = Location.objects.create(latitude=41.01, longitude=-100.0)
+        data = self.points(3)
+        data.append({"latitude": "41.0000000001", "longitude": -100})
+
+        locations = get_or_create_locations(data, radius_meters=0)
+        self.assertEqual(
+            [(location.latitude, location.longitude) for location in locations],
+            [(41.0, -100.0), (41.01, -100.0), (41.02, -100.0), (41.0, -100.0)],
+        )
+        self.assertEqual(locations[1], existing)
+        self.assertEqual(locations[0], locations[3])
+        self.assertEqual(locations[2].street_name, "Point 2")
+        self.assertEqual(Location.objects.count(), 3)
+
+
+class LocationGridTests(TestCase):
+    """Points within the match radius reuse one Location row"""
+
+    # Degrees of latitude per meter on the haversine sphere
+    DEGREES_PER_METER = 1 / 111195.08
+
+    def point(self, latitude, longitude=-100.0):
+        return {"latitude": latitude, "longitude": longitude}
+
+    def test_match_radius_boundary(self):
+        existing = get_or_create_locations([self.point(41.0)], radius_meters=25)[0]
+        near, far = get_or_create_locations(
+            [
+                self.point(41.0 + 24 * self.DEGREES_PER_METER),
+                self.point(41.0 - 26 * self.DEGREES_PER_METER),
+            ],
+            radius_meters=25,
+        )
+        self.assertEqual(near, existing)
+        self.assertNotEqual(far, existing)
+        self.assertEqual(Location.objects.count(), 2)
+
+    def test_match_across_grid_cells(self):
+        existing = get_or_create_locations([self.point(41.000999)], radius_meters=25)[0]
+        # One cell row up, a meter away
+        location = get_or_create_locations([self.point(41.001008)], radius_meters=25)[0]
+        self.assertNotEqual(location_grid_cell(41.001008, -100.0), existing.grid_cell)
+        self.assertEqual(location, existing)
+
+    def test_nearby_new_points_in_one_batch_share_a_row(self):
+        first, close, apart = get_or_create_locations(
+            [
+                self.point(42.0),
+                self.point(42.0 + 10 * self.DEGREES_PER_METER),
+                self.point(42.0 + 30 * self.DEGREES_PER_METER),
+            ],
+            radius_meters=25,
+        )
+        self.assertEqual(first, close)
+        self.assertNotEqual(first, apart)
+        self.assertEqual(Location.objects.count(), 2)
+
+    def test_neighbourhood_is_fetched_with_one_query(self):
+        get_or_create_locations([self.point(43.0 + i * 0.01) for i in range(3)], radius_meters=25)
+        jittered = [self.point(43.0 + i * 0.01 + 0.00005) for i in range(3)]
+        with self.assertNumQueries(1):
+            get_or_create_locations(jittered, radius_meters=25)
+
+
+class PlanJobRecoveryTests(TripDataTestCase):
+    """Planning jobs lost with their worker process"""
+
+    def test_stale_jobs_are_reported_failed(self):
+        trip = self.add_trip(stops=0, log_sheets=0)
+        lost = TripPlanJob.objects.create(trip=trip, status="running", message="Fetching route")
+        TripPlanJob.objects.filter(pk=lost.pk).update(
+            updated_at=timezone.now() - timedelta(hours=1)
+        )
+        fresh = TripPlanJob.objects.create(trip=self.add_trip(stops=0, log_sheets=0))
+
+        response = self.client.get(f"/api/trips/{trip.id}/plan-status/")
+        self.assertEqual(response.data["status"], "failed")
+        self.assertEqual(fail_stale_jobs(), 0)
+        fresh.refresh_from_db()
+        self.assertEqual(fresh.status, "queued")
+
+    def test_plan_route_waits_for_background_job(self):
+        trip = self.add_trip(stops=0, log_sheets=0)
+        TripPlanJob.objects.create(trip=trip, status="running")
+        for url in (f"/api/trips/{trip.id}/plan_route/", f"/api/async/trips/{trip.id}/plan_route/"):
+            response = self.client.post(url, {}, format="json")
+            self.assertEqual(response.status_code, 409)
+        self.assertFalse(trip.stops.exists())
+
+    def test_failed_job_is_not_run_by_a_late_worker(self):
+        trip = self.add_trip(stops=0, log_sheets=0)
+        job = TripPlanJob.objects.create(trip=trip, status="failed")
+        run_plan_job(job.id, [], [])
+        job.refresh_from_db()
+        self.assertEqual(job.status, "failed")
+
+
+class FuelCandidateValidationTests(TripDataTestCase):
+    """Fuel stop candidates sent to plan_route are validated before routing"""
+
+    def test_malformed_candidates_are_rejected(self):
+        trip = self.add_trip(stops=0, log_sheets=0)
+        bodies = [
+            {"fuelStops": [{"latitude": 40}]},
+            {"fuelStops": [{"latitude": "north", "longitude": -100}]},
+            {"fuelStop": {"latitude": 95, "longitude": -100}},
+            {"fuelStops": [{"latitude": 40, "longitude": -100}] * (MAX_FUEL_CANDIDATES + 1)},
+        ]
+        for url in (f"/api/trips/{trip.id}/plan_route/", f"/api/async/trips/{trip.id}/plan_route/"):
+            for body in bodies:
+                response = self.client.post(url, body, format="json")
+                self.assertEqual(response.status_code, 400, (url, body))
+        trip.refresh_from_db()
+        self.assertIsNone(trip.route)
+
+
+class AsyncTripViewTests(TripDataTestCase):
+    """The async endpoints answer like their TripViewSet counterparts"""
+
+    def test_plan_route_delta_matches_viewset(self):
+        trip = self.add_trip(stops=2, log_sheets=1, changes=1)
+        trip.route = {"routes": [{"distance": 1000.0, "duration": 60.0, "legs": []}]}
+        trip.save()
+        version = self.client.post(f"/api/trips/{trip.id}/complete/").data["version"]
+
+        expected = self.client.post(f"/api/trips/{trip.id}/plan_route/?since={version}")
+        response = self.client.post(f"/api/async/trips/{trip.id}/plan_route/?since={version}")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()["delta"])
+        self.assertEqual(response.json(), expected.json())
+        self.assertEqual(response["ETag"], expected["ETag"])
+
+    def test_create_queues_background_planning(self):
+        locations = [
+            {"latitude": 40 + offset * 0.1, "longitude": -100, "slug": slug}
+            for offset, slug in enumerate(["currentLocation", "pickupLocation", "dropoffLocation"])
+        ]
+        response = self.client.post(
+            "/api/async/trips/?async=1",
+            {"locations": locations, "current_cycle_hours": 5},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 202)
+        job = TripPlanJob.objects.get(pk=response.json()["job_id"])
+        self.assertEqual(job.trip_id, response.json()["trip_id"])
+        self.assertTrue(
+            response.json()["status_url"].endswith(f"/api/trips/{job.trip_id}/plan-status/")
+        )
 
-# Create your tests here.
+    def test_rejects_unauthenticated_requests(self):
+        response = APIClient().post("/api/async/trips/", {}, format="json")
+        self.assertEqual(response.status_code, 401)
+        self.assertIn("detail", response.json())
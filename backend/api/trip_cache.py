@@ -0,0 +1,119 @@
+"""
+Cache of serialized trip representations.
+
+Entries live in the "trips" Django cache and are keyed by trip, a per-trip
+generation token and the representation variant (action, data version,
+fields, expand). Invalidating a trip replaces its generation, which orphans
+every cached variant at once; orphans simply expire. Readers take the
+generation before loading rows and store under it, so a representation
+built from data that changed meanwhile is never served.
+
+Generations only reach the processes sharing the cache backend. The data
+version in the variant (see api.versioning) is what keeps processes with
+their own LocMemCache from serving a trip another process has changed.
+"""
+import threading
+import time
+
+from django.core.cache import caches
+from django.db import transaction
+
+TRIP_CACHE_ALIAS = "trips"
+
+
+class TripRepresentationCache:
+    def __init__(self, alias=TRIP_CACHE_ALIAS):
+        self.alias = alias
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    @staticmethod
+    def _generation_key(trip_id):
+        return f"trip:{trip_id}:generation"
+
+    @staticmethod
+    def _entry_key(trip_id, generation, variant):
+        return f"trip:{trip_id}:{generation}:{variant}"
+
+    def _generations(self, trip_ids):
+        keys = {self._generation_key(trip_id): trip_id for trip_id in trip_ids}
+        found = self.cache.get_many(keys)
+        generations = {keys[key]: value for key, value in found.items()}
+
+        missing = [trip_id for trip_id in trip_ids if trip_id not in generations]
+        if missing:
+            # A fresh token never matches entries stored before an eviction
+            token = time.time_ns()
+            for trip_id in missing:
+                self.cache.add(self._generation_key(trip_id), token, timeout=None)
+            found = self.cache.get_many([self._generation_key(trip_id) for trip_id in missing])
+            generations.update({keys[key]: value for key, value in found.items()})
+        return generations
+
+    def lookup(self, trip_ids, variant):
+        """
+        Returns (cached, generations): representations found for trip_ids and
+        the generation tokens to pass to store() for the rest.
+        """
+        generations = self._generations(trip_ids)
+        keys = {
+            self._entry_key(trip_id, generations[trip_id], variant): trip_id
+            for trip_id in trip_ids
+            if trip_id in generations
+        }
+        found = self.cache.get_many(keys)
+        cached = {keys[key]: value for key, value in found.items()}
+        with self._lock:
+            self.hits += len(cached)
+            self.misses += len(trip_ids) - len(cached)
+        return cached, generations
+
+    def store(self, representations, variant, generations):
+        entries = {
+            self._entry_key(trip_id, generations[trip_id], variant): data
+            for trip_id, data in representations.items()
+            if trip_id in generations
+        }
+        if entries:
+            self.cache.set_many(entries)
+
+    def invalidate(self, trip_id):
+        self.cache.set(self._generation_key(trip_id), time.time_ns(), timeout=None)
+        with self._lock:
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "backend": self.cache.__class__.__name__,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            }
+
+
+trip_cache = TripRepresentationCache()
+
+
+def invalidate_trip(trip_id):
+    """
+    Drop every cached representation of a trip, now and again when the
+    current transaction commits, so no reader caches rows it could see
+    before the commit.
+    """
+    if trip_id is None:
+        return
+    trip_cache.invalidate(trip_id)
+    transaction.on_commit(lambda: trip_cache.invalidate(trip_id))
+
+
+def trip_cache_stats():
+    return trip_cache.stats()
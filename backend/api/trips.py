@@ -0,0 +1,49 @@
+"""
+Set-based trip lifecycle operations.
+
+Each operation touches every affected trip, stop and log sheet with a
+fixed number of queryset update() calls inside one transaction, whatever
+the number of rows. update() bypasses auto_now and signals, so updated_at
+is set explicitly and the trip cache is invalidated by hand.
+"""
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+from .cycle import trip_cycle_hours_expression
+from .models import LogSheet, Stop, Trip
+from .trip_cache import invalidate_trip
+
+
+def close_active_trips(user, exclude=None):
+    """
+    Complete every in-progress trip of user except exclude: pending stops
+    are completed and active log sheets closed at the trip's current
+    location. The trips are locked first. Returns the ids of the closed trips.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        trips = Trip.objects.select_for_update().filter(created_by=user, status="in_progress")
+        if exclude is not None:
+            trips = trips.exclude(pk=exclude.pk)
+        trip_ids = list(trips.values_list("id", flat=True))
+        if not trip_ids:
+            return []
+
+        Trip.objects.filter(pk__in=trip_ids).update(status="completed", updated_at=now)
+        Stop.objects.filter(trip_id__in=trip_ids, status="pending").update(
+            status="completed", updated_at=now
+        )
+        LogSheet.objects.filter(trip_id__in=trip_ids, status="active").update(
+            status="completed",
+            end_time=now,
+            end_location=Subquery(
+                Trip.objects.filter(pk=OuterRef("trip_id")).values("current_location")[:1]
+            ),
+            end_cycle_hours=trip_cycle_hours_expression(),
+            updated_at=now,
+        )
+
+    for trip_id in trip_ids:
+        invalidate_trip(trip_id)
+    return trip_ids
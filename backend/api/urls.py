@@ -1,6 +1,16 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import TripViewSet, StopViewSet, LogSheetViewSet, register, login
+from . import async_views
+from .views import (
+    TripViewSet,
+    StopViewSet,
+    LogSheetViewSet,
+    register,
+    login,
+    routing_status,
+    cache_status,
+    duty_recap,
+)
 
 # Create a router for nested routes
 trip_router = DefaultRouter()
@@ -41,6 +51,11 @@ urlpatterns = [
         LogSheetViewSet.as_view({"get": "list", "post": "create"}),
         name="trip-log-sheets",
     ),
+    path(
+        "trips/<int:trip_pk>/log-sheets/summary/",
+        LogSheetViewSet.as_view({"get": "summary"}),
+        name="trip-log-sheet-summary",
+    ),
     path(
         "trips/<int:trip_pk>/log-sheets/<int:pk>/",
         LogSheetViewSet.as_view(
@@ -55,4 +70,14 @@ urlpatterns = [
     ),
     path("auth/register/", register, name="register"),
     path("auth/login/", login, name="login"),
+    path("routing/status/", routing_status, name="routing-status"),
+    path("cache/status/", cache_status, name="cache-status"),
+    path("hos/recap/", duty_recap, name="duty-recap"),
+    # Async (ASGI) variants of the routing-bound trip endpoints
+    path("async/trips/", async_views.create_trip, name="async-trip-create"),
+    path(
+        "async/trips/<int:pk>/plan_route/",
+        async_views.plan_route,
+        name="async-trip-plan-route",
+    ),
 ]
@@ -0,0 +1,143 @@
+"""
+Trip versions for delta responses and conditional requests.
+
+A trip's version combines the newest updated_at across the trip, its stops,
+log sheets and duty status changes with the row count of each, so edits and
+deletions both produce a new version. It is computed with one aggregate
+query and never needs the tree to be serialized.
+
+Bulk queryset.update() calls bypass auto_now and must set updated_at
+explicitly for the change to show up in the version.
+"""
+import hashlib
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db.models import Count, IntegerField, Max, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from .models import DutyStatusChange, LogSheet, Stop, Trip
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+# (annotation prefix, model, lookup from the model to the trip)
+VERSIONED_CHILDREN = (
+    ("stops", Stop, "trip"),
+    ("log_sheets", LogSheet, "trip"),
+    ("duty_changes", DutyStatusChange, "log_sheet__trip"),
+)
+
+
+def _child_subquery(model, trip_lookup, aggregate):
+    return Subquery(
+        model.objects.filter(**{trip_lookup: OuterRef("pk")})
+        .order_by()
+        .values(trip_lookup)
+        .annotate(value=aggregate)
+        .values("value")[:1]
+    )
+
+
+def with_versions(queryset):
+    """Annotate a Trip queryset with what trip_version() needs"""
+    annotations = {}
+    for prefix, model, trip_lookup in VERSIONED_CHILDREN:
+        annotations[f"{prefix}_updated_at"] = _child_subquery(
+            model, trip_lookup, Max("updated_at")
+        )
+        annotations[f"{prefix}_count"] = Coalesce(
+            _child_subquery(model, trip_lookup, Count("id")),
+            0,
+            output_field=IntegerField(),
+        )
+    return queryset.annotate(**annotations)
+
+
+def format_version(updated_at, counts):
+    micros = (updated_at - EPOCH) // timedelta(microseconds=1)
+    return ".".join(str(part) for part in (micros, *counts))
+
+
+def annotated_version(trip):
+    """Version of a trip loaded through with_versions()"""
+    timestamps = [trip.updated_at] + [
+        getattr(trip, f"{prefix}_updated_at") for prefix, _, _ in VERSIONED_CHILDREN
+    ]
+    counts = [getattr(trip, f"{prefix}_count") for prefix, _, _ in VERSIONED_CHILDREN]
+    return format_version(max(t for t in timestamps if t is not None), counts)
+
+
+def trip_version(trip_id):
+    """Current version string of a trip, or None if it does not exist"""
+    trip = with_versions(Trip.objects.filter(pk=trip_id).only("id", "updated_at")).first()
+    return annotated_version(trip) if trip else None
+
+
+def collection_version(trips):
+    """
+    Version of a whole set of trips and their children, or None if the set
+    is empty. Computed with one aggregate query.
+    """
+    aggregates = {"latest_trip": Max("updated_at"), "total_trips": Count("id")}
+    for prefix, _, _ in VERSIONED_CHILDREN:
+        aggregates[f"latest_{prefix}"] = Max(f"{prefix}_updated_at")
+        aggregates[f"total_{prefix}"] = Sum(f"{prefix}_count")
+    values = with_versions(trips.order_by()).aggregate(**aggregates)
+    if values["latest_trip"] is None:
+        return None
+
+    timestamps = [values["latest_trip"]] + [
+        values[f"latest_{prefix}"] for prefix, _, _ in VERSIONED_CHILDREN
+    ]
+    counts = [values["total_trips"]] + [
+        values[f"total_{prefix}"] or 0 for prefix, _, _ in VERSIONED_CHILDREN
+    ]
+    return format_version(max(t for t in timestamps if t is not None), counts)
+
+
+def parse_version(version):
+    """Timestamp encoded in a version string, or None if it is malformed"""
+    try:
+        micros = int(str(version).split(".")[0])
+    except (TypeError, ValueError):
+        return None
+    return EPOCH + timedelta(microseconds=micros)
+
+
+def etag_for(version, variant=""):
+    """
+    Strong ETag for a version. variant distinguishes representations of the
+    same data, e.g. different ?fields= or page cursors.
+    """
+    if variant:
+        digest = hashlib.sha1(variant.encode()).hexdigest()[:12]
+        return f'"{version}-{digest}"'
+    return f'"{version}"'
+
+
+def etag_matches(etag, if_none_match):
+    """Whether an If-None-Match header value covers etag"""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    # Weak comparison, as RFC 9110 requires for If-None-Match
+    return "*" in candidates or etag in {tag.removeprefix("W/") for tag in candidates}
+
+
+def trip_delta(trip, since):
+    """
+    Rows of trip changed after the since timestamp.
+
+    Changed rows are returned as querysets; the ordered ids of all current
+    stops and log sheets are included so clients can drop deleted rows.
+    """
+    stops = trip.stops.order_by("sequence")
+    log_sheets = trip.log_sheets.order_by("start_time")
+    return {
+        "trip_changed": trip.updated_at > since,
+        "stops": stops.filter(updated_at__gt=since).select_related("location"),
+        "stop_ids": list(stops.values_list("id", flat=True)),
+        "log_sheets": log_sheets.filter(
+            Q(updated_at__gt=since) | Q(duty_status_changes__updated_at__gt=since)
+        ).distinct(),
+        "log_sheet_ids": list(log_sheets.values_list("id", flat=True)),
+    }
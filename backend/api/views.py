@@ -2,10 +2,10 @@ from django.shortcuts import render, get_object_or_404
 from rest_framework import viewsets, status, generics
 from rest_framework.response import Response
 from rest_framework.decorators import action, api_view, permission_classes
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import authenticate
-from .models import Trip, LogSheet, Stop, Location
+from .models import Trip, LogSheet, Stop, Location, TripRoute
 from .serializers import (
     TripSerializer,
     TripCreateSerializer,
@@ -16,15 +16,51 @@ from .serializers import (
     LoginSerializer,
     DutyStatusChangeSerializer,
     DutyStatusChangeCreateSerializer,
+    FuelCandidatesSerializer,
+    TripPlanJobSerializer,
+    MAX_DUTY_STATUS_BATCH,
+    query_list,
 )
-import requests
+from .cycle import recap, record_log_sheet, trip_cycle_hours
+from .duty_hours import duty_hours, total_hours
+from .fuel import find_best_fuel_stop
+from .geometry import decode_polyline, encode_polyline, simplify, zoom_tolerance
+from .jobs import enqueue_new_trip, fail_stale_jobs, planning_in_progress
+from .locations import get_or_create_location
+from .pagination import CreatedAtCursorPagination
+from .planning import (
+    ROUTE_PARAMS,
+    PlanningError,
+    apply_route_plan,
+    candidate_coordinates,
+    coordinates_of,
+    create_planned_trip,
+    fuel_candidates_from_request,
+    place_fuel_stop,
+    resolve_locations,
+    route_waypoints,
+)
+from .responses import (
+    plan_job_payload,
+    requested_since,
+    trip_payload,
+    trip_response_data,
+    wants_async_planning,
+)
+from .routing import RoutingError, fetch_route, routing_stats
+from .stops import StopOrderError, resequence_stops
+from .trips import close_active_trips
+from .trip_cache import invalidate_trip, trip_cache_stats
+from .mixins import CachedTripRepresentationMixin, ConditionalGetMixin
+from .versioning import collection_version, etag_for
 import json
 from datetime import datetime, timedelta
 import logging
 from django.db.models import Q
 from rest_framework import serializers
 from django.utils import timezone
-from django.db import connection
+from django.utils.dateparse import parse_date, parse_datetime
+from django.db import IntegrityError, connection, transaction
 
 logger = logging.getLogger(__name__)
 logger.info(f"Connecting to database with settings: {connection.settings_dict}")
@@ -112,22 +148,82 @@ def login(request):
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class TripViewSet(viewsets.ModelViewSet):
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def routing_status(request):
+    """Connection pool, circuit breaker and route cache stats for upstream routing"""
+    return Response(routing_stats())
+
+
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def cache_status(request):
+    """Hit rate and invalidation counts of the serialized trip cache"""
+    return Response(trip_cache_stats())
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def duty_recap(request):
+    """Rolling cycle recap of the current driver, for ?date= (default today)"""
+    on = None
+    if request.query_params.get("date"):
+        try:
+            on = parse_date(request.query_params["date"])
+        except ValueError:
+            on = None
+        if on is None:
+            return Response(
+                {"error": "date must be an ISO date"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+    return Response(recap(request.user, on))
+
+
+class TripViewSet(ConditionalGetMixin, CachedTripRepresentationMixin, viewsets.ModelViewSet):
     serializer_class = TripSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = CreatedAtCursorPagination
 
     def get_queryset(self):
         trip_id = self.kwargs.get("trip_pk")
+        queryset = Trip.objects.filter(created_by=self.request.user)
         if trip_id:
-            return Trip.objects.filter(
-                id=trip_id, created_by=self.request.user
-            ).prefetch_related("log_sheets")
-        return (
-            Trip.objects.filter(created_by=self.request.user)
-            .order_by("-created_at")
-            .prefetch_related("log_sheets")
+            queryset = queryset.filter(id=trip_id)
+        else:
+            queryset = queryset.order_by("-created_at")
+
+        # Only read-only actions prefetch; the others write stops before
+        # serializing and must not render a stale prefetch cache.
+        if self.action == "list":
+            # Lists are summaries; heavy fields only when asked with ?expand=
+            return TripSerializer.setup_eager_loading(
+                queryset, include=query_list(self.request, "expand")
+            )
+        if self.action == "retrieve":
+            return TripSerializer.setup_eager_loading(queryset)
+        return queryset.select_related(
+            "current_location", "pickup_location", "dropoff_location", "fuel_stop"
         )
 
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        # ?status= narrows lists, e.g. to find an in-progress trip
+        trip_status = self.request.query_params.get("status")
+        if self.action == "list" and trip_status:
+            queryset = queryset.filter(status=trip_status)
+        return queryset
+
+    def get_version(self):
+        """Version of the trips a list/retrieve response is built from"""
+        trips = Trip.objects.filter(created_by=self.request.user)
+        trip_id = self.kwargs.get("pk") or self.kwargs.get("trip_pk")
+        if trip_id:
+            if not str(trip_id).isdigit():
+                return None
+            trips = trips.filter(pk=trip_id)
+        return collection_version(trips)
+
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user)
 
@@ -146,156 +242,40 @@ class TripViewSet(viewsets.ModelViewSet):
             # Get locations from request data
             locations_data = validated_data["locations"]
             current_cycle_hours = validated_data["current_cycle_hours"]
+            slugs = [location_data.get("slug", "") for location_data in locations_data]
 
-            # Create or get locations first
-            locations = []
-            for location_data in locations_data:
-                # Try to find existing location
-                location, created = Location.objects.get_or_create(
-                    latitude=location_data["latitude"],
-                    longitude=location_data["longitude"],
-                    defaults={
-                        "street_name": location_data.get(
-                            "street_name",
-                            f"Location at {location_data['latitude']}, {location_data['longitude']}",
-                        )
-                    },
+            try:
+                locations = resolve_locations(locations_data)
+            except PlanningError as e:
+                return Response(
+                    {"error": str(e)}, status=status.HTTP_400_BAD_REQUEST
                 )
-                locations.append(location)
-
-            # Create trip with the locations
-            trip = Trip.objects.create(
-                current_location=locations[0],
-                pickup_location=locations[1] if len(locations) > 1 else None,
-                dropoff_location=locations[2] if len(locations) > 2 else None,
-                fuel_stop=locations[3] if len(locations) > 3 else None,
-                current_cycle_hours=current_cycle_hours,
-                created_by=request.user,
-            )
-
-            # Build route coordinates from locations
-            route_coords = []
-            for location in locations:
-                coords = f"{location.longitude},{location.latitude}"
-                route_coords.append(coords)
 
-            if not route_coords:
+            if wants_async_planning(request):
+                # Route fetching and stop generation run in the worker pool
+                trip, job = enqueue_new_trip(request.user, locations, slugs, current_cycle_hours)
                 return Response(
-                    {"error": "No valid coordinates found in locations"},
-                    status=status.HTTP_400_BAD_REQUEST,
+                    plan_job_payload(trip, job, request), status=status.HTTP_202_ACCEPTED
                 )
 
-            # Get route from OSRM
-            route_url = f"http://router.project-osrm.org/route/v1/driving/{';'.join(route_coords)}"
-            params = {"overview": "full", "geometries": "geojson", "steps": "true"}
-
-            print(f"Requesting route from OSRM: {route_url}")
-            print(f"With params: {params}")
-
-            response = requests.get(route_url, params=params)
-            print(f"OSRM response status: {response.status_code}")
-
-            if response.status_code != 200:
-                print(f"OSRM error response: {response.text}")
+            # The route is fetched before anything is written, then the trip
+            # and all of its stops are saved in one transaction
+            try:
+                route_data = fetch_route(coordinates_of(locations), ROUTE_PARAMS)
+                trip = create_planned_trip(
+                    request.user, locations, slugs, current_cycle_hours, route_data
+                )
+            except RoutingError as e:
                 return Response(
-                    {"error": f"OSRM API error: {response.text}"},
+                    {"error": str(e)},
                     status=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 )
-
-            route_data = response.json()
-
-            if not route_data.get("routes"):
-                print("No routes found in OSRM response")
+            except PlanningError as e:
                 return Response(
-                    {"error": "No route found"}, status=status.HTTP_400_BAD_REQUEST
-                )
-
-            # Save route data to trip
-            trip.route = route_data
-            trip.save()
-
-            # Create stops based on locations
-            current_time = timezone.now()
-            current_cycle_hours = trip.current_cycle_hours
-
-            # Create stops for each location (except current location)
-            for i, (location, location_data) in enumerate(
-                zip(locations[1:], locations_data[1:]), start=1
-            ):
-                # Determine stop type based on location slug
-                slug = location_data.get("slug", "")
-                print(f"Processing stop {i}:")
-                print(f"Location data: {location_data}")
-                print(f"Location: {location}")
-                print(f"Slug: {slug}")
-
-                if slug == "pickupLocation":
-                    stop_type = "pickup"
-                    duration_minutes = 60
-                elif slug == "dropoffLocation":
-                    stop_type = "dropoff"
-                    duration_minutes = 60
-                elif slug == "fuelStop":
-                    stop_type = "fuel"
-                    duration_minutes = 30
-                else:
-                    stop_type = "waypoint"
-                    duration_minutes = 0
-
-                # Create the stop
-                stop = Stop.objects.create(
-                    trip=trip,
-                    location=location,
-                    sequence=i,
-                    status="pending",
-                    stop_type=stop_type,
-                    arrival_time=current_time,
-                    duration_minutes=duration_minutes,
-                    cycle_hours_at_stop=current_cycle_hours,
+                    {"error": str(e)}, status=status.HTTP_400_BAD_REQUEST
                 )
-                print(f"Created {stop_type} stop: {stop.id}")
-
-                # Update tracking variables
-                current_cycle_hours += duration_minutes / 60
-                current_time += timedelta(minutes=duration_minutes)
-
-            # Add rest stops based on HOS compliance
-            MAX_DRIVING_HOURS = 11  # Maximum driving hours per day
-            REQUIRED_REST_HOURS = 10  # Required rest hours per day
-            MAX_CYCLE_HOURS = 70  # Maximum hours in cycle
-
-            # Add rest stops if needed
-            if current_cycle_hours >= MAX_DRIVING_HOURS:
-                # Use the last location for rest stop
-                last_location = locations[-1]
-                rest_stop = Stop.objects.create(
-                    trip=trip,
-                    location=last_location,
-                    sequence=len(locations),
-                    status="pending",
-                    stop_type="rest",
-                    arrival_time=current_time,
-                    duration_minutes=REQUIRED_REST_HOURS * 60,
-                    cycle_hours_at_stop=current_cycle_hours,
-                )
-                print(f"Created rest stop: {rest_stop.id}")
-
-                # Update tracking variables
-                current_cycle_hours += REQUIRED_REST_HOURS
-                current_time += timedelta(hours=REQUIRED_REST_HOURS)
 
-            # Update trip status
-            trip.status = "planned"
-            trip.save()
-            print(f"Updated trip status to: {trip.status}")
-
-            # Use TripSerializer for the response
-            response_data = {
-                "trip": TripSerializer(trip).data,
-                "route": route_data,
-                "stops": StopSerializer(trip.stops.all(), many=True).data,
-            }
-            return Response(response_data, status=status.HTTP_201_CREATED)
+            return Response(trip_payload(trip), status=status.HTTP_201_CREATED)
 
         except Exception as e:
             print(f"Error in create: {str(e)}")
@@ -307,6 +287,89 @@ class TripViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR,
             )
 
+    def _trip_response(self, trip):
+        """
+        Response for a custom action on trip: the full trip, route and
+        stops, or with ?since=<version> (or a "since" field in the body)
+        only what changed after that version. See trip_response_data().
+        """
+        response_data = trip_response_data(
+            trip, requested_since(self.request), self.get_serializer_context()
+        )
+        return Response(response_data, headers={"ETag": etag_for(response_data["version"])})
+
+    @action(detail=True, methods=["get"], url_path="plan-status")
+    def plan_status(self, request, pk=None):
+        trip = self.get_object()
+        fail_stale_jobs(trip.plan_jobs.all())
+        job = trip.plan_jobs.first()
+        if not job:
+            return Response(
+                {"error": "No planning job found for this trip"},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        return Response(TripPlanJobSerializer(job).data)
+
+    @action(detail=True, methods=["get"])
+    def geometry(self, request, pk=None):
+        """
+        Route line of the trip, as an encoded polyline or, with
+        ?encoding=geojson, a GeoJSON LineString. ?tolerance=<meters> or
+        ?zoom=<map zoom level> simplifies the line with Douglas-Peucker.
+        """
+        trip = self.get_object()
+        route_geometry = TripRoute.objects.filter(trip=trip).first()
+        if not route_geometry:
+            return Response(
+                {"error": "No route geometry for this trip"},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+
+        encoding = request.query_params.get("encoding", "polyline")
+        if encoding not in ("polyline", "geojson"):
+            return Response(
+                {"error": "encoding must be polyline or geojson"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            tolerance = float(request.query_params.get("tolerance", 0))
+            if "zoom" in request.query_params:
+                tolerance = zoom_tolerance(
+                    float(request.query_params["zoom"]),
+                    trip.current_location.latitude,
+                )
+        except ValueError:
+            return Response(
+                {"error": "tolerance and zoom must be numbers"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        precision = route_geometry.precision
+        if encoding == "polyline" and tolerance <= 0:
+            # Stored form, no need to decode
+            line = route_geometry.polyline
+            point_count = route_geometry.point_count
+        else:
+            coordinates = simplify(
+                decode_polyline(route_geometry.polyline, precision), tolerance
+            )
+            point_count = len(coordinates)
+            if encoding == "geojson":
+                line = {"type": "LineString", "coordinates": coordinates}
+            else:
+                line = encode_polyline(coordinates, precision)
+
+        return Response(
+            {
+                "trip_id": trip.id,
+                "encoding": encoding,
+                "precision": precision,
+                "tolerance": tolerance,
+                "point_count": point_count,
+                "geometry": line,
+            }
+        )
+
     @action(detail=True, methods=["post"])
     def plan_route(self, request, pk=None):
         try:
@@ -315,213 +378,46 @@ class TripViewSet(viewsets.ModelViewSet):
 
             # If route already exists, return it
             if trip.route:
-                response_data = {
-                    "trip": self.get_serializer(trip).data,
-                    "route": trip.route,
-                    "stops": StopSerializer(trip.stops.all(), many=True).data,
-                }
-                return Response(response_data)
-
-            # Get route from OSRM
-            start_coords = f"{trip.current_location['longitude']},{trip.current_location['latitude']}"
-            pickup_coords = f"{trip.pickup_location['longitude']},{trip.pickup_location['latitude']}"
-            dropoff_coords = f"{trip.dropoff_location['longitude']},{trip.dropoff_location['latitude']}"
-
-            # Build route URL with optional fuel stop
-            route_coords = [start_coords, pickup_coords, dropoff_coords]
-
-            # Check for fuel stop in request data
-            fuel_stop = request.data.get("fuelStop")
-            if fuel_stop and isinstance(fuel_stop, dict):
-                # Calculate total route distance without fuel stop
-                no_fuel_route_url = f"http://router.project-osrm.org/route/v1/driving/{';'.join(route_coords)}"
-                no_fuel_response = requests.get(
-                    no_fuel_route_url, params={"overview": "false"}
-                )
-                total_distance = (
-                    no_fuel_response.json()["routes"][0]["distance"] / 1609.34
-                )  # Convert to miles
-
-                # Assume average fuel consumption of 6 miles per gallon
-                # and tank capacity of 100 gallons
-                FUEL_EFFICIENCY = 6  # miles per gallon
-                TANK_CAPACITY = 100  # gallons
-                SAFETY_MARGIN = 0.2  # 20% safety margin
-
-                # Calculate optimal fuel stop distance
-                optimal_fuel_distance = (
-                    TANK_CAPACITY * FUEL_EFFICIENCY * (1 - SAFETY_MARGIN)
-                ) / 2
-
-                # Find the best position for fuel stop
-                best_fuel_position = 1  # Default to after start
-                min_deviation = float("inf")
-                best_fuel_stop = None
-
-                # Try different positions for fuel stop
-                for i in range(1, len(route_coords)):
-                    test_coords = route_coords.copy()
-                    fuel_stop_coords = (
-                        f"{fuel_stop['longitude']},{fuel_stop['latitude']}"
-                    )
-                    test_coords.insert(i, fuel_stop_coords)
-
-                    test_route_url = f"http://router.project-osrm.org/route/v1/driving/{';'.join(test_coords)}"
-                    test_response = requests.get(
-                        test_route_url, params={"overview": "false"}
-                    )
-
-                    if test_response.status_code == 200:
-                        route_data = test_response.json()
-                        if route_data.get("routes"):
-                            # Calculate deviation from optimal distance
-                            distance_to_fuel = (
-                                sum(
-                                    leg["distance"]
-                                    for leg in route_data["routes"][0]["legs"][:i]
-                                )
-                                / 1609.34
-                            )
-                            deviation = abs(distance_to_fuel - optimal_fuel_distance)
-
-                            if deviation < min_deviation:
-                                min_deviation = deviation
-                                best_fuel_position = i
-                                best_fuel_stop = {
-                                    "latitude": fuel_stop["latitude"],
-                                    "longitude": fuel_stop["longitude"],
-                                }
-
-                # Update trip's fuel stop location with the optimal position
-                if best_fuel_stop:
-                    trip.fuel_stop = best_fuel_stop
-                    trip.save()
-                    print(f"Updated fuel stop to optimal position: {best_fuel_stop}")
-
-            # Get final route with optimal fuel stop position
-            if fuel_stop and isinstance(fuel_stop, dict):
-                fuel_stop_coords = (
-                    f"{trip.fuel_stop['longitude']},{trip.fuel_stop['latitude']}"
-                )
-                route_coords.insert(best_fuel_position, fuel_stop_coords)
-
-            route_url = f"http://router.project-osrm.org/route/v1/driving/{';'.join(route_coords)}"
-            params = {"overview": "full", "geometries": "geojson", "steps": "true"}
-
-            print(f"Requesting route from OSRM: {route_url}")
-            print(f"With params: {params}")
+                return self._trip_response(trip)
 
-            response = requests.get(route_url, params=params)
-            print(f"OSRM response status: {response.status_code}")
-
-            if response.status_code != 200:
-                print(f"OSRM error response: {response.text}")
+            # Planning it here too would race the job's save_trip_plan()
+            if planning_in_progress(trip):
                 return Response(
-                    {"error": f"OSRM API error: {response.text}"},
-                    status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    {"error": "Trip is being planned in the background"},
+                    status=status.HTTP_409_CONFLICT,
                 )
 
-            route_data = response.json()
+            fuel_serializer = FuelCandidatesSerializer(data=request.data)
+            if not fuel_serializer.is_valid():
+                return Response(fuel_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-            if not route_data.get("routes"):
-                print("No routes found in OSRM response")
-                return Response(
-                    {"error": "No route found"}, status=status.HTTP_400_BAD_REQUEST
-                )
+            waypoints = route_waypoints(trip)
 
-            # Save route data to trip
-            trip.route = route_data
-            trip.save()
-
-            # Create stops along the route
-            route = route_data["routes"][0]
-            legs = route["legs"]
-
-            print(f"Creating stops with {len(legs)} legs")
-
-            # Initialize variables for HOS tracking
-            current_cycle_hours = trip.current_cycle_hours
-            total_distance = 0
-            last_stop_location = trip.current_location
-            current_time = timezone.now()
-
-            # Create stops based on legs
-            for i, leg in enumerate(legs):
-                # Determine stop type based on sequence and fuel stop presence
-                if i == 0:
-                    stop_type = "pickup"
-                    last_stop_location = trip.pickup_location
-                elif fuel_stop and i == 1:
-                    stop_type = "fuel"
-                    print(f"Fuel stop: {fuel_stop}")
-                    last_stop_location = fuel_stop
-                else:
-                    stop_type = "dropoff"
-                    last_stop_location = trip.dropoff_location
-
-                # Create the stop
-                stop = Stop.objects.create(
-                    trip=trip,
-                    location=last_stop_location,
-                    summary=leg["summary"],
-                    sequence=i + 1,
-                    status="pending",
-                    stop_type=stop_type,
-                    arrival_time=current_time + timedelta(seconds=leg["duration"]),
-                    duration_minutes=(
-                        60
-                        if stop_type in ["pickup", "dropoff"]
-                        else 30 if stop_type == "fuel" else 0
-                    ),
-                    cycle_hours_at_stop=current_cycle_hours + (leg["duration"] / 3600),
-                    distance_from_last_stop=leg["distance"] / 1609.34,
+            fuel_candidates = fuel_candidates_from_request(fuel_serializer.validated_data)
+            if fuel_candidates:
+                # Score every candidate and insertion position from distance tables
+                best = find_best_fuel_stop(
+                    coordinates_of(location for _, location in waypoints),
+                    candidate_coordinates(fuel_candidates),
                 )
-                print(f"Created {stop_type} stop: {stop.id}")
+                place_fuel_stop(trip, waypoints, fuel_candidates, best)
 
-                # Update tracking variables
-                current_cycle_hours += (leg["duration"] / 3600) + (
-                    stop.duration_minutes / 60
+            try:
+                route_data = fetch_route(
+                    coordinates_of(location for _, location in waypoints), ROUTE_PARAMS
                 )
-                total_distance += leg["distance"] / 1609.34
-                last_stop_location = stop.location
-                current_time += timedelta(
-                    seconds=leg["duration"] + (stop.duration_minutes * 60)
+                apply_route_plan(trip, waypoints, route_data)
+            except RoutingError as e:
+                return Response(
+                    {"error": str(e)},
+                    status=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 )
-
-            # Add rest stops based on HOS compliance
-            MAX_DRIVING_HOURS = 11  # Maximum driving hours per day
-            REQUIRED_REST_HOURS = 10  # Required rest hours per day
-            MAX_CYCLE_HOURS = 70  # Maximum hours in cycle
-
-            # Add rest stops if needed
-            if current_cycle_hours >= MAX_DRIVING_HOURS:
-                rest_stop = Stop.objects.create(
-                    trip=trip,
-                    location=last_stop_location,
-                    sequence=len(legs) + 1,
-                    status="pending",
-                    stop_type="rest",
-                    arrival_time=current_time,
-                    duration_minutes=REQUIRED_REST_HOURS * 60,
-                    cycle_hours_at_stop=current_cycle_hours,
+            except PlanningError as e:
+                return Response(
+                    {"error": str(e)}, status=status.HTTP_400_BAD_REQUEST
                 )
-                print(f"Created rest stop: {rest_stop.id}")
-
-                # Update tracking variables
-                current_cycle_hours += REQUIRED_REST_HOURS
-                current_time += timedelta(hours=REQUIRED_REST_HOURS)
-
-            # Update trip status
-            trip.status = "planned"
-            trip.save()
-            print(f"Updated trip status to: {trip.status}")
 
-            response_data = {
-                "trip": self.get_serializer(trip).data,
-                "route": route_data,
-                "stops": StopSerializer(trip.stops.all(), many=True).data,
-            }
-            return Response(response_data)
+            return self._trip_response(trip)
 
         except Exception as e:
             print(f"Error in plan_route: {str(e)}")
@@ -544,14 +440,13 @@ class TripViewSet(viewsets.ModelViewSet):
             trip.save()
 
             # Update all remaining stops to completed
-            trip.stops.filter(status="pending").update(status="completed")
+            trip.stops.filter(status="pending").update(
+                status="completed", updated_at=timezone.now()
+            )
+            # Bulk updates send no signals
+            invalidate_trip(trip.id)
 
-            response_data = {
-                "trip": self.get_serializer(trip).data,
-                "route": trip.route,
-                "stops": StopSerializer(trip.stops.all(), many=True).data,
-            }
-            return Response(response_data)
+            return self._trip_response(trip)
 
         except Exception as e:
             print(f"Error completing trip: {str(e)}")
@@ -569,27 +464,8 @@ class TripViewSet(viewsets.ModelViewSet):
             trip = self.get_object()
             print(f"Starting trip: {trip.id}")
 
-            # Check for any existing active trips for this user
-            active_trips = Trip.objects.filter(
-                created_by=request.user, status="in_progress"
-            ).exclude(id=trip.id)
-
-            # Complete any existing active trips
-            for active_trip in active_trips:
-                active_trip.status = "completed"
-                active_trip.save()
-
-                # Update all remaining stops to completed
-                active_trip.stops.filter(status="pending").update(status="completed")
-
-                # Complete any active log sheets
-                active_log = active_trip.log_sheets.filter(status="active").first()
-                if active_log:
-                    active_log.end_time = timezone.now()
-                    active_log.end_location = active_trip.current_location
-                    active_log.end_cycle_hours = active_trip.current_cycle_hours
-                    active_log.status = "completed"
-                    active_log.save()
+            # Complete any other trips the user left in progress
+            close_active_trips(request.user, exclude=trip)
 
             # Update trip status
             trip.status = "in_progress"
@@ -601,21 +477,17 @@ class TripViewSet(viewsets.ModelViewSet):
                 first_stop.status = "in_progress"
                 first_stop.save()
 
-                # Create initial driving log
+            # Create initial driving log, unless the trip is being restarted
+            if first_stop and not trip.log_sheets.filter(status="active").exists():
                 LogSheet.objects.create(
                     trip=trip,
                     start_time=timezone.now(),
                     start_location=trip.current_location,
-                    start_cycle_hours=trip.current_cycle_hours,
+                    start_cycle_hours=trip_cycle_hours(trip),
                     status="active",
                 )
 
-            response_data = {
-                "trip": self.get_serializer(trip).data,
-                "route": trip.route,
-                "stops": StopSerializer(trip.stops.all(), many=True).data,
-            }
-            return Response(response_data)
+            return self._trip_response(trip)
 
         except Exception as e:
             print(f"Error starting trip: {str(e)}")
@@ -666,7 +538,7 @@ class TripViewSet(viewsets.ModelViewSet):
                     # Update the active log with end time and location
                     active_log.end_time = timezone.now()
                     active_log.end_location = stop.location
-                    active_log.end_cycle_hours = trip.current_cycle_hours
+                    active_log.end_cycle_hours = trip_cycle_hours(trip)
                     active_log.status = "completed"
                     active_log.save()
 
@@ -677,7 +549,7 @@ class TripViewSet(viewsets.ModelViewSet):
                             trip=trip,
                             start_time=timezone.now(),
                             start_location=stop.location,
-                            start_cycle_hours=trip.current_cycle_hours,
+                            start_cycle_hours=active_log.end_cycle_hours,
                             status="active",
                         )
 
@@ -689,12 +561,7 @@ class TripViewSet(viewsets.ModelViewSet):
                 trip.save()
 
             # Get updated trip data
-            response_data = {
-                "trip": self.get_serializer(trip).data,
-                "route": trip.route,
-                "stops": StopSerializer(trip.stops.all(), many=True).data,
-            }
-            return Response(response_data)
+            return self._trip_response(trip)
 
         except Exception as e:
             print(f"Error updating stop status: {str(e)}")
@@ -716,10 +583,22 @@ class TripViewSet(viewsets.ModelViewSet):
             last_stop = trip.stops.order_by("-sequence").first()
             next_sequence = (last_stop.sequence + 1) if last_stop else 1
 
+            # Accept either a location dict or the id of an existing location
+            location = request.data.get("location")
+            if isinstance(location, dict):
+                location = get_or_create_location(location)
+            elif location is not None:
+                location = Location.objects.filter(pk=location).first()
+            if location is None:
+                return Response(
+                    {"error": "Invalid location data"},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
             # Create new stop
             stop_data = {
                 "trip": trip,
-                "location": request.data.get("location"),
+                "location": location,
                 "sequence": next_sequence,
                 "status": "pending",
                 "stop_type": request.data.get("stop_type", "rest"),
@@ -731,12 +610,7 @@ class TripViewSet(viewsets.ModelViewSet):
 
             stop = Stop.objects.create(**stop_data)
 
-            response_data = {
-                "trip": self.get_serializer(trip).data,
-                "route": trip.route,
-                "stops": StopSerializer(trip.stops.all(), many=True).data,
-            }
-            return Response(response_data)
+            return self._trip_response(trip)
 
         except Exception as e:
             print(f"Error creating stop: {str(e)}")
@@ -774,19 +648,12 @@ class TripViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_400_BAD_REQUEST,
                 )
 
-            stop.delete()
+            with transaction.atomic():
+                stop.delete()
+                # Close the gap in the remaining stops' sequences
+                resequence_stops(trip)
 
-            # Reorder remaining stops
-            for idx, stop in enumerate(trip.stops.order_by("sequence"), 1):
-                stop.sequence = idx
-                stop.save()
-
-            response_data = {
-                "trip": self.get_serializer(trip).data,
-                "route": trip.route,
-                "stops": StopSerializer(trip.stops.all(), many=True).data,
-            }
-            return Response(response_data)
+            return self._trip_response(trip)
 
         except Exception as e:
             print(f"Error deleting stop: {str(e)}")
@@ -798,6 +665,28 @@ class TripViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR,
             )
 
+    @action(detail=True, methods=["post"])
+    def reorder_stops(self, request, pk=None):
+        """Apply a whole new stop order, given as the list of all stop ids"""
+        trip = self.get_object()
+        stop_ids = request.data.get("stop_ids")
+        if not isinstance(stop_ids, list):
+            return Response(
+                {"error": "stop_ids must be a list"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            resequence_stops(trip, [int(stop_id) for stop_id in stop_ids])
+        except (TypeError, ValueError):
+            return Response(
+                {"error": "Invalid stop_id format"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        except StopOrderError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return self._trip_response(trip)
+
     @action(detail=True, methods=["post"])
     def update_location(self, request, pk=None):
         try:
@@ -811,15 +700,10 @@ class TripViewSet(viewsets.ModelViewSet):
                 )
 
             # Update trip's current location
-            trip.current_location = new_location
-            trip.save()
+            trip.current_location = get_or_create_location(new_location)
+            trip.save(update_fields=["current_location", "updated_at"])
 
-            response_data = {
-                "trip": self.get_serializer(trip).data,
-                "route": trip.route,
-                "stops": StopSerializer(trip.stops.all(), many=True).data,
-            }
-            return Response(response_data)
+            return self._trip_response(trip)
 
         except Exception as e:
             print(f"Error updating location: {str(e)}")
@@ -832,10 +716,29 @@ class TripViewSet(viewsets.ModelViewSet):
             )
 
 
-class LogSheetViewSet(viewsets.ModelViewSet):
+def _summary_bound(value, end=False):
+    """
+    Datetime for a ?from= or ?to= value: an ISO datetime, or a date meaning
+    the start of that day (or of the next one for the end of a range).
+    Raises ValueError for anything else.
+    """
+    day = parse_date(value)
+    if day is not None:
+        parsed = datetime.combine(day + timedelta(days=1) if end else day, datetime.min.time())
+    else:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            raise ValueError(value)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+class LogSheetViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = LogSheet.objects.all()
     serializer_class = LogSheetSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = CreatedAtCursorPagination
     print("SAKJD")
 
     def get_serializer_class(self):
@@ -847,17 +750,47 @@ class LogSheetViewSet(viewsets.ModelViewSet):
         trip_id = self.kwargs.get("trip_pk")
         if trip_id == "all":
             # Return all logs for the current user's trips
-            return LogSheet.objects.filter(trip__created_by=self.request.user).order_by(
-                "-created_at"
-            )
+            queryset = LogSheet.objects.filter(
+                trip__created_by=self.request.user
+            ).order_by("-created_at")
         elif trip_id:
             # Return logs for a specific trip, ensuring the user has access
-            return LogSheet.objects.filter(
+            queryset = LogSheet.objects.filter(
                 trip_id=trip_id, trip__created_by=self.request.user
             )
-        return LogSheet.objects.filter(trip__created_by=self.request.user).order_by(
-            "-created_at"
-        )
+        else:
+            queryset = LogSheet.objects.filter(
+                trip__created_by=self.request.user
+            ).order_by("-created_at")
+
+        if self.action == "list":
+            return LogSheetSerializer.setup_eager_loading(
+                queryset, include=query_list(self.request, "expand")
+            )
+        if self.action == "retrieve":
+            return LogSheetSerializer.setup_eager_loading(queryset)
+        return queryset
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        # ?status= narrows lists, e.g. to the newest completed sheet
+        log_sheet_status = self.request.query_params.get("status")
+        if self.action == "list" and log_sheet_status:
+            queryset = queryset.filter(status=log_sheet_status)
+        return queryset
+
+    def get_version(self):
+        """Version of the trips whose log sheets a list/retrieve response shows"""
+        trips = Trip.objects.filter(created_by=self.request.user)
+        trip_id = self.kwargs.get("trip_pk")
+        log_sheet_id = self.kwargs.get("pk")
+        if trip_id and trip_id != "all":
+            trips = trips.filter(pk=trip_id)
+        if log_sheet_id:
+            if not str(log_sheet_id).isdigit():
+                return None
+            trips = trips.filter(log_sheets=log_sheet_id)
+        return collection_version(trips)
 
     def perform_create(self, serializer):
         trip = get_object_or_404(
@@ -883,7 +816,7 @@ class LogSheetViewSet(viewsets.ModelViewSet):
         if overlapping_logs:
             raise serializers.ValidationError("This log overlaps with an existing log")
 
-        serializer.save(trip=trip)
+        self._save_log_sheet(serializer, trip=trip)
 
     def perform_update(self, serializer):
         # Ensure user owns the log's trip
@@ -911,7 +844,15 @@ class LogSheetViewSet(viewsets.ModelViewSet):
         if overlapping_logs:
             raise serializers.ValidationError("This log overlaps with an existing log")
 
-        serializer.save()
+        self._save_log_sheet(serializer)
+
+    def _save_log_sheet(self, serializer, **kwargs):
+        # one_active_log_sheet_per_trip rejects a second active sheet
+        try:
+            with transaction.atomic():
+                serializer.save(**kwargs)
+        except IntegrityError:
+            raise serializers.ValidationError("This trip already has an active log")
 
     @action(detail=True, methods=["post"])
     def duty_status_change(self, request, pk=None):
@@ -926,11 +867,108 @@ class LogSheetViewSet(viewsets.ModelViewSet):
         serializer = DutyStatusChangeCreateSerializer(data=request.data)
 
         if serializer.is_valid():
-            duty_status_change = serializer.save(log_sheet=log_sheet)
+            key = serializer.validated_data.get("idempotency_key")
+            existing = key and log_sheet.duty_status_changes.filter(idempotency_key=key).first()
+            if existing:
+                return Response(DutyStatusChangeSerializer(existing).data)
+            try:
+                with transaction.atomic():
+                    duty_status_change = serializer.save(log_sheet=log_sheet)
+            except IntegrityError:
+                # A concurrent request stored the same key after we checked
+                if not key:
+                    raise
+                duty_status_change = log_sheet.duty_status_changes.get(idempotency_key=key)
             return Response(DutyStatusChangeSerializer(duty_status_change).data)
         print(serializer.errors)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=True, methods=["post"])
+    def duty_status_changes(self, request, pk=None):
+        """
+        Batch upload of buffered duty status changes, as a list or under
+        "changes". All items are validated before anything is stored, then
+        inserted in one transaction; items with an idempotency_key already
+        stored on this log sheet are skipped, so retried uploads are safe.
+        """
+        log_sheet = self.get_object()
+        # Ensure user owns the log's trip
+        if log_sheet.trip.created_by != request.user:
+            return Response(
+                {"error": "You can only modify your own logs"},
+                status=status.HTTP_403_FORBIDDEN,
+            )
+
+        items = request.data.get("changes") if isinstance(request.data, dict) else request.data
+        serializer = DutyStatusChangeCreateSerializer(
+            data=items, many=True, allow_empty=False, max_length=MAX_DUTY_STATUS_BATCH
+        )
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            with transaction.atomic():
+                created = serializer.save(log_sheet=log_sheet)
+        except IntegrityError:
+            # Another upload stored one of the keys after we checked
+            return Response(
+                {"error": "Some of these changes were stored concurrently, retry the upload"},
+                status=status.HTTP_409_CONFLICT,
+            )
+
+        if created:
+            # bulk_create sends no signals
+            record_log_sheet(log_sheet.id)
+            invalidate_trip(log_sheet.trip_id)
+        return Response(
+            {
+                "created": DutyStatusChangeSerializer(created, many=True).data,
+                "skipped_keys": serializer.skipped_keys,
+            },
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
+        )
+
+    @action(detail=False, methods=["get"])
+    def summary(self, request, trip_pk=None):
+        """
+        Hours per duty status for every log sheet starting in [from, to),
+        plus the totals, computed with one query over all their changes.
+        """
+        try:
+            bounds = {
+                name: _summary_bound(request.query_params[name], end=(name == "to"))
+                for name in ("from", "to")
+                if request.query_params.get(name)
+            }
+        except ValueError:
+            return Response(
+                {"error": "from and to must be ISO dates or datetimes"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        log_sheets = self.get_queryset().order_by("start_time")
+        if "from" in bounds:
+            log_sheets = log_sheets.filter(start_time__gte=bounds["from"])
+        if "to" in bounds:
+            log_sheets = log_sheets.filter(start_time__lt=bounds["to"])
+        log_sheets = list(
+            log_sheets.values("id", "trip_id", "status", "start_time", "end_time")
+        )
+
+        hours = duty_hours(log_sheet["id"] for log_sheet in log_sheets)
+        return Response(
+            {
+                "from": bounds.get("from"),
+                "to": bounds.get("to"),
+                "count": len(log_sheets),
+                "totals": total_hours(hours),
+                "log_sheets": [
+                    {**log_sheet, "hours": hours[log_sheet["id"]]}
+                    for log_sheet in log_sheets
+                ],
+            }
+        )
+
 
 class StopViewSet(viewsets.ModelViewSet):
     queryset = Stop.objects.all()
@@ -0,0 +1,145 @@
+"""
+Compare trip-creation throughput on the WSGI and ASGI stacks.
+
+Routing is served by the in-process LocalRoutingProvider with a simulated
+upstream latency, so the numbers show how well each stack overlaps routing
+round-trips rather than how fast the public OSRM server is. Every request
+uses distinct coordinates so the route cache never short-circuits a call.
+
+Runs against a throw-away test database:
+
+    python benchmarks/routing_throughput.py --requests 200 --concurrency 100 --latency 0.2
+
+SQLite serializes writers and may report "database table is locked" under
+the threaded WSGI run; point the settings at PostgreSQL for real numbers.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "trip_logger.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.test import AsyncClient, Client  # noqa: E402
+from django.test.utils import get_runner  # noqa: E402
+from django.conf import settings  # noqa: E402
+from rest_framework_simplejwt.tokens import RefreshToken  # noqa: E402
+
+from api.local_routing import LocalRoutingProvider  # noqa: E402
+from api.models import User  # noqa: E402
+from api.routing import route_cache, set_routing_provider  # noqa: E402
+
+
+def trip_payload(index):
+    # Offset every request so each one is a route cache miss
+    offset = index * 0.001
+    return {
+        "current_cycle_hours": 5,
+        "locations": [
+            {"latitude": 40.0 + offset, "longitude": -100.0, "slug": "currentLocation"},
+            {"latitude": 40.5 + offset, "longitude": -98.0, "slug": "pickupLocation"},
+            {"latitude": 41.0 + offset, "longitude": -90.0, "slug": "dropoffLocation"},
+        ],
+    }
+
+
+def run_wsgi(token, total, threads):
+    def send(index):
+        client = Client(headers={"Authorization": f"Bearer {token}"})
+        response = client.post(
+            "/api/trips/", trip_payload(index), content_type="application/json"
+        )
+        return response.status_code
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        statuses = list(pool.map(send, range(total)))
+    return time.perf_counter() - started, statuses
+
+
+async def run_asgi(token, total, concurrency, first_index):
+    limit = asyncio.Semaphore(concurrency)
+    client = AsyncClient()
+
+    async def send(index):
+        async with limit:
+            response = await client.post(
+                "/api/async/trips/",
+                trip_payload(index),
+                content_type="application/json",
+                headers={"Authorization": f"Bearer {token}"},
+            )
+            return response.status_code
+
+    started = time.perf_counter()
+    statuses = await asyncio.gather(
+        *(send(index) for index in range(first_index, first_index + total))
+    )
+    return time.perf_counter() - started, statuses
+
+
+def report(label, elapsed, statuses):
+    ok = sum(1 for code in statuses if code == 201)
+    print(
+        f"{label:<5} {len(statuses):>5} requests  {elapsed:8.2f}s  "
+        f"{len(statuses) / elapsed:8.1f} req/s  ({ok} created)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument(
+        "--wsgi-threads",
+        type=int,
+        default=4,
+        help="request threads for the WSGI run (gunicorn --threads)",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=100,
+        help="in-flight requests for the ASGI run",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.2,
+        help="simulated routing round-trip in seconds",
+    )
+    args = parser.parse_args()
+
+    runner = get_runner(settings)(verbosity=0)
+    old_config = runner.setup_databases()
+    try:
+        set_routing_provider(LocalRoutingProvider(latency=args.latency))
+        user = User.objects.create_user(
+            email="bench@example.com",
+            username="bench",
+            password="bench-password",
+            first_name="Bench",
+            last_name="Driver",
+        )
+        token = str(RefreshToken.for_user(user).access_token)
+
+        elapsed, statuses = run_wsgi(token, args.requests, args.wsgi_threads)
+        report("WSGI", elapsed, statuses)
+
+        route_cache.clear()
+        elapsed, statuses = asyncio.run(
+            run_asgi(token, args.requests, args.concurrency, args.requests)
+        )
+        report("ASGI", elapsed, statuses)
+    finally:
+        runner.teardown_databases(old_config)
+
+
+if __name__ == "__main__":
+    main()
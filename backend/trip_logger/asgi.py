@@ -0,0 +1,12 @@
+import os
+import sys
+from django.core.asgi import get_asgi_application
+
+# Add the project root directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'trip_logger.settings')
+
+# Serve with an ASGI server, e.g.
+#   gunicorn trip_logger.asgi:application -k uvicorn.workers.UvicornWorker
+application = get_asgi_application()
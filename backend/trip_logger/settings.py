@@ -147,6 +147,65 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = True  # In production, you should set this to False and specify allowed origins
 CORS_ALLOW_CREDENTIALS = True
+CORS_EXPOSE_HEADERS = ['ETag']  # Let the frontend read versions for conditional requests
+
+# Caches
+# "trips" holds serialized trip representations, keyed by the trips' data
+# version and invalidated on every write (see api.trip_cache). Entries are
+# never served stale, but a shared backend such as Redis lets several
+# processes reuse each other's entries.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'trip-logger',
+    },
+    'trips': {
+        'BACKEND': os.getenv('TRIP_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('TRIP_CACHE_LOCATION', 'trip-representations'),
+        'TIMEOUT': int(os.getenv('TRIP_CACHE_TIMEOUT', '300')),
+        'OPTIONS': {'MAX_ENTRIES': int(os.getenv('TRIP_CACHE_MAX_ENTRIES', '5000'))},
+    },
+    # Routing responses behind the in-process route cache (see api.routing);
+    # file-based by default so lanes survive restarts and are shared by the
+    # workers of a host
+    'routes': {
+        'BACKEND': os.getenv('ROUTE_CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.getenv('ROUTE_CACHE_LOCATION', os.path.join(BASE_DIR, 'route-cache')),
+        'TIMEOUT': int(os.getenv('OSRM_ROUTE_CACHE_TTL', '86400')),
+        'OPTIONS': {'MAX_ENTRIES': int(os.getenv('ROUTE_CACHE_MAX_ENTRIES', '20000'))},
+    },
+}
+
+# Routing settings
+# 'osrm' talks to OSRM_BASE_URL over HTTP; 'local' uses the in-process
+# great-circle stand-in (no network, for load tests and CI benchmarks)
+ROUTING_PROVIDER = os.getenv('ROUTING_PROVIDER', 'osrm')
+OSRM_BASE_URL = os.getenv('OSRM_BASE_URL', 'http://router.project-osrm.org')
+OSRM_ROUTE_CACHE_TTL = int(os.getenv('OSRM_ROUTE_CACHE_TTL', '86400'))  # seconds
+OSRM_ROUTE_CACHE_MAX_ENTRIES = int(os.getenv('OSRM_ROUTE_CACHE_MAX_ENTRIES', '1024'))
+OSRM_TABLE_MAX_COORDINATES = int(os.getenv('OSRM_TABLE_MAX_COORDINATES', '100'))
+OSRM_POOL_SIZE = int(os.getenv('OSRM_POOL_SIZE', '10'))
+OSRM_ASYNC_POOL_SIZE = int(os.getenv('OSRM_ASYNC_POOL_SIZE', '100'))  # connections per event loop
+OSRM_CONNECT_TIMEOUT = float(os.getenv('OSRM_CONNECT_TIMEOUT', '3.05'))  # seconds
+OSRM_READ_TIMEOUT = float(os.getenv('OSRM_READ_TIMEOUT', '10'))  # seconds
+OSRM_MAX_RETRIES = int(os.getenv('OSRM_MAX_RETRIES', '2'))
+OSRM_RETRY_BACKOFF = float(os.getenv('OSRM_RETRY_BACKOFF', '0.3'))  # seconds, doubled per retry
+OSRM_BREAKER_FAILURE_THRESHOLD = int(os.getenv('OSRM_BREAKER_FAILURE_THRESHOLD', '5'))
+OSRM_BREAKER_RESET_TIMEOUT = float(os.getenv('OSRM_BREAKER_RESET_TIMEOUT', '30'))  # seconds
+
+# Trip planning
+# When TRIP_PLANNING_ASYNC is on, trip creation returns 202 and the plan is
+# built by a per-process pool of TRIP_PLANNING_WORKERS threads (0 = inline).
+TRIP_PLANNING_ASYNC = os.getenv('TRIP_PLANNING_ASYNC', 'False') == 'True'
+TRIP_PLANNING_WORKERS = int(os.getenv('TRIP_PLANNING_WORKERS', '4'))
+# Queued or running jobs without progress for this long are marked failed;
+# they were lost with the process whose pool held them.
+TRIP_PLAN_JOB_TIMEOUT = int(os.getenv('TRIP_PLAN_JOB_TIMEOUT', '600'))  # seconds
+
+# Locations
+# Points logged within this many meters of an existing location reuse its
+# row instead of creating a new one (0 = exact coordinates only).
+LOCATION_MATCH_RADIUS_METERS = float(os.getenv('LOCATION_MATCH_RADIUS_METERS', '25'))
 
 # JWT settings
 SIMPLE_JWT = {
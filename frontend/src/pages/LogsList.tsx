@@ -16,7 +16,7 @@ import { Search, Eye } from "lucide-react";
 import { format, parseISO, isAfter, isBefore, isEqual } from "date-fns";
 import { useNavigate } from "react-router-dom";
 import { LogSheet, DutyStatusChange } from "../types";
-import { fetchLogSheets } from "../store/slices/logSlice";
+import { fetchLogSheets, fetchMoreLogSheets } from "../store/slices/logSlice";
 import DailyLogGrid from "../components/DailyLogGrid";
 
 interface DailyLogSummary {
@@ -36,7 +36,9 @@ export default function LogsList() {
   const {
     logSheets = [],
     loading,
+    loadingMore,
     error,
+    next,
   } = useSelector((state: RootState) => state.logs);
 
   useEffect(() => {
@@ -232,6 +234,17 @@ export default function LogsList() {
           </Table>
         </div>
       )}
+      {next && (
+        <div className="flex justify-center mt-4">
+          <Button
+            variant="outline"
+            disabled={loadingMore}
+            onClick={() => dispatch(fetchMoreLogSheets(next))}
+          >
+            {loadingMore ? "Loading..." : "Load more"}
+          </Button>
+        </div>
+      )}
     </div>
   );
 }
@@ -165,7 +165,9 @@ const TripDetails = () => {
     // First check if there are any active trips
     const checkActiveTrips = async () => {
       try {
-        const response = await fetch("/api/trips/", {
+        // Filtered on the server, so older in-progress trips beyond the
+        // first page are found too
+        const response = await fetch("/api/trips/?status=in_progress&fields=id,status&page_size=1", {
           headers: {
             Authorization: `Bearer ${localStorage.getItem("access_token")}`,
           },
@@ -173,7 +175,8 @@ const TripDetails = () => {
 
         if (!response.ok) throw new Error("Failed to fetch trips");
 
-        const trips = await response.json();
+        const data = await response.json();
+        const trips = Array.isArray(data) ? data : data.results || [];
         const activeTrips = trips.filter(
           (trip: any) => trip.status === "in_progress"
         );
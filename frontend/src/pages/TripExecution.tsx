@@ -754,6 +754,8 @@ const getStopTitle = (stopType: Stop["stop_type"]) => {
       return "Dropoff Location";
     case "rest":
       return "Rest Stop";
+    case "break":
+      return "Break";
     case "fuel":
       return "Fuel Stop";
     default:
@@ -768,6 +770,7 @@ const createStopIcon = (stopType: Stop["stop_type"]) => {
     case "dropoff":
       return <FaBed className="w-5 h-5" />;
     case "rest":
+    case "break":
       return <FaBed className="w-5 h-5" />;
     case "fuel":
       return <FaTruck className="w-5 h-5" />;
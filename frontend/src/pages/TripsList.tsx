@@ -29,11 +29,11 @@ import { Trip } from "../types";
 export default function TripsList() {
   const dispatch = useDispatch<AppDispatch>();
   const navigate = useNavigate();
-  const {trips,loading,error} = useSelector((state: RootState) => state.trips);
+  const {trips,loading,loadingMore,error,pagination} = useSelector((state: RootState) => state.trips);
   const [searchQuery, setSearchQuery] = useState("");
 
   useEffect(() => {
-    dispatch(fetchTrips({ page: 1, sortBy: "id", sortOrder: "desc" }));
+    dispatch(fetchTrips());
     console.log(trips)
   }, [dispatch]);
 
@@ -41,7 +41,7 @@ export default function TripsList() {
     if (window.confirm("Are you sure you want to delete this trip?")) {
       try {
         await dispatch(deleteTrip(tripId)).unwrap();
-        dispatch(fetchTrips({ page: 1, sortBy: "id", sortOrder: "desc" }));
+        dispatch(fetchTrips());
       } catch (error) {
         console.error("Failed to delete trip:", error);
       }
@@ -216,6 +216,17 @@ export default function TripsList() {
           </TableBody>
         </Table>
       </div>
+      {pagination.next && (
+        <div className="flex justify-center mt-4">
+          <Button
+            variant="outline"
+            disabled={loadingMore}
+            onClick={() => dispatch(fetchTrips({ next: pagination.next }))}
+          >
+            {loadingMore ? "Loading..." : "Load more"}
+          </Button>
+        </div>
+      )}
     </div>
   );
 }
@@ -10,22 +10,50 @@ export interface LogState {
   logSheets: LogSheet[];
   currentLogSheet: LogSheet | null;
   loading: boolean;
+  loadingMore: boolean;
   error: string | null;
+  // Cursor of the next page of log sheets, loaded on demand
+  next: string | null;
 }
 
+interface LogSheetPage {
+  results?: LogSheet[];
+  next: string | null;
+  previous: string | null;
+}
+
+// Log sheet lists are cursor-paginated; plain arrays are accepted too
+const logSheetsFrom = (data: LogSheetPage | LogSheet[]) =>
+  Array.isArray(data) ? data : data.results || [];
+
+// One page of a log sheet list, with the cursor of the following page
+const fetchLogSheetPage = async (url: string) => {
+  const response = await apiRequest<LogSheetPage | LogSheet[]>(url);
+  return {
+    logSheets: logSheetsFrom(response.data),
+    next: Array.isArray(response.data) ? null : response.data.next,
+  };
+};
+
 const initialState: LogState = {
   logSheets: [],
   currentLogSheet: null,
   loading: false,
+  loadingMore: false,
   error: null,
+  next: null,
 };
 
-export const fetchLogSheets = createAsyncThunk<LogSheet[], string>(
+export const fetchLogSheets = createAsyncThunk(
   "log/fetchLogSheets",
-  async () => {
-    const response = await apiRequest<LogSheet[]>(`/api/log-sheets/`);
-    return response.data;
-  }
+  async (_tripId: string) =>
+    fetchLogSheetPage(`/api/log-sheets/?expand=duty_status_changes`)
+);
+
+// The page after the last one loaded; pass the `next` URL kept in state
+export const fetchMoreLogSheets = createAsyncThunk(
+  "log/fetchMoreLogSheets",
+  async (next: string) => fetchLogSheetPage(next)
 );
 
 export const createLogSheet = createAsyncThunk(
@@ -65,19 +93,12 @@ export const updateLogSheet = createAsyncThunk(
 );
 export const fetchLatestCycleHours = createAsyncThunk("logs", async () => {
   try {
-    const response = await apiRequest(`${API_BASE_URL}/api/log-sheets`);
-    const logs = (await response.data) as LogSheet[];
-    console.log(logs);
-    if (logs && logs.length > 0) {
-      // Find the most recent completed log
-      const latestCompletedLog = logs
-        .filter((log: any) => log.status === "completed")
-        .sort(
-          (a: any, b: any) =>
-            new Date(b.end_time).getTime() - new Date(a.end_time).getTime()
-        )[0];
-      console.log(latestCompletedLog);
-      return latestCompletedLog.end_cycle_hours;
+    // Lists are newest first, so the first completed sheet is the latest
+    const { logSheets } = await fetchLogSheetPage(
+      `${API_BASE_URL}/api/log-sheets/?status=completed&page_size=1`
+    );
+    if (logSheets.length > 0) {
+      return logSheets[0].end_cycle_hours;
     }
   } catch (error) {
     console.error("Error fetching latest cycle hours:", error);
@@ -100,12 +121,26 @@ const logSlice = createSlice({
       })
       .addCase(fetchLogSheets.fulfilled, (state, action) => {
         state.loading = false;
-        state.logSheets = action.payload;
+        state.logSheets = action.payload.logSheets;
+        state.next = action.payload.next;
       })
       .addCase(fetchLogSheets.rejected, (state, action) => {
         state.loading = false;
         state.error = action.error.message || "Failed to fetch log sheets";
       })
+      .addCase(fetchMoreLogSheets.pending, (state) => {
+        state.loadingMore = true;
+        state.error = null;
+      })
+      .addCase(fetchMoreLogSheets.fulfilled, (state, action) => {
+        state.loadingMore = false;
+        state.logSheets = [...state.logSheets, ...action.payload.logSheets];
+        state.next = action.payload.next;
+      })
+      .addCase(fetchMoreLogSheets.rejected, (state, action) => {
+        state.loadingMore = false;
+        state.error = action.error.message || "Failed to fetch log sheets";
+      })
       .addCase(createLogSheet.pending, (state) => {
         state.loading = true;
         state.error = null;
@@ -1,6 +1,6 @@
 import { createSlice, createAsyncThunk } from "@reduxjs/toolkit";
 import { RootState } from "../../store";
-import { Trip, Location, Stop, LocationInputModel, LogSheet, DutyStatusChange } from "../../types";
+import { Trip, Location, Stop, LocationInputModel, LogSheet, DutyStatusChange, Route, RouteGeometry } from "../../types";
 import { apiRequest } from "../../utils/api";
 
 const API_BASE_URL = import.meta.env.VITE_API_URL || "http://localhost:8000";
@@ -9,6 +9,7 @@ export interface TripState {
   trips: Trip[];
   currentTrip: Trip | null;
   loading: boolean;
+  loadingMore: boolean;
   error: string | null;
   pagination: {
     count: number;
@@ -21,6 +22,7 @@ const initialState: TripState = {
   trips: [],
   currentTrip: null,
   loading: false,
+  loadingMore: false,
   error: null,
   pagination: {
     count: 0,
@@ -42,21 +44,28 @@ interface PlanRouteResponse {
   trip: Trip;
 }
 
+// Response of the trip actions: the trip and its stops, with the route
+// (without its line) sent once at the top level
+interface TripActionResponse {
+  version?: string;
+  trip: Trip;
+  route?: Route;
+  stops: Stop[];
+}
+
 export const fetchTrips = createAsyncThunk(
   "trips/fetchTrips",
-  async ({
-    page = 1,
-    sortBy = "id",
-    sortOrder = "desc",
-  }: { page?: number; sortBy?: string; sortOrder?: "asc" | "desc" } = {}) => {
+  // Trips come newest first, one cursor page at a time; pass the previous
+  // page's `next` URL to load the following page
+  async ({ next }: { next?: string | null } = {}) => {
     try {
       const params = new URLSearchParams({
-        page: page.toString(),
-        ordering: sortOrder === "desc" ? `-${sortBy}` : sortBy,
+        // Lists leave out heavy fields; the table shows leg summaries
+        expand: "route",
       });
 
       const response = await apiRequest<TripResponse | Trip[]>(
-        `${API_BASE_URL}/api/trips/?${params.toString()}`
+        next || `${API_BASE_URL}/api/trips/?${params.toString()}`
       );
 
       // Handle both paginated and non-paginated responses
@@ -86,11 +95,48 @@ export const fetchTrips = createAsyncThunk(
   }
 );
 
+// Route lines are served separately from trips; attach them as GeoJSON
+const attachRouteGeometry = async (
+  tripId: string | number,
+  route?: Route
+): Promise<Route | undefined> => {
+  if (!route?.routes?.length) return route;
+  const response = await apiRequest<{ geometry: RouteGeometry }>(
+    `${API_BASE_URL}/api/trips/${tripId}/geometry/?encoding=geojson`
+  );
+  const [first, ...rest] = route.routes;
+  return {
+    ...route,
+    routes: [{ ...first, geometry: response.data.geometry }, ...rest],
+  };
+};
+
+// Trip from a trip action response. The actions never re-plan the route,
+// so the line already loaded for it is kept while the route is unchanged
+const tripFromResponse = async (
+  tripId: string | number,
+  data: TripActionResponse,
+  current: Trip | null
+): Promise<Trip> => {
+  const loaded = String(current?.id) === String(tripId) ? current?.route?.routes?.[0] : undefined;
+  const [first, ...rest] = data.route?.routes || [];
+  const unchanged =
+    loaded?.geometry &&
+    first &&
+    loaded.distance === first.distance &&
+    loaded.duration === first.duration;
+  const route = unchanged
+    ? { ...data.route!, routes: [{ ...first, geometry: loaded!.geometry }, ...rest] }
+    : await attachRouteGeometry(tripId, data.route);
+  return { ...data.trip, route, stops: data.stops };
+};
+
 export const fetchTrip = createAsyncThunk(
   "trip/fetchTrip",
   async (tripId: string) => {
     const response = await apiRequest(`${API_BASE_URL}/api/trips/${tripId}`);
-    return response.data as Trip;
+    const trip = response.data as Trip;
+    return { ...trip, route: await attachRouteGeometry(trip.id, trip.route) };
   }
 );
 
@@ -135,20 +181,24 @@ export const planRoute = createAsyncThunk(
         }),
       }
     );
-    return response.data;
+    return {
+      ...response.data,
+      route: await attachRouteGeometry(tripId, response.data.route),
+    };
   }
 );
 
 export const startTrip = createAsyncThunk(
   "trip/startTrip",
-  async (tripId: string) => {
-    const response = await apiRequest(
+  async (tripId: string, { getState }) => {
+    const response = await apiRequest<TripActionResponse>(
       `${API_BASE_URL}/api/trips/${tripId}/start_trip/`,
       {
         method: "POST",
       }
     );
-    return response.data as Trip;
+    const state = getState() as RootState;
+    return tripFromResponse(tripId, response.data, state.trips.currentTrip);
   }
 );
 
@@ -162,55 +212,74 @@ export const updateStopStatus = createAsyncThunk(
     tripId: string;
     stopId: string;
     status: string;
-  }) => {
-    const response = await apiRequest(
+  }, { getState }) => {
+    const response = await apiRequest<TripActionResponse>(
       `${API_BASE_URL}/api/trips/${tripId}/update_stop_status/`,
       {
         method: "POST",
         body: JSON.stringify({ stop_id: stopId, status }),
       }
     );
-    return response.data as Trip;
+    const state = getState() as RootState;
+    return tripFromResponse(tripId, response.data, state.trips.currentTrip);
   }
 );
 
 export const createStop = createAsyncThunk(
   "trip/createStop",
-  async ({ tripId, stopData }: { tripId: string; stopData: Partial<Stop> }) => {
-    const response = await apiRequest(
+  async ({ tripId, stopData }: { tripId: string; stopData: Partial<Stop> }, { getState }) => {
+    const response = await apiRequest<TripActionResponse>(
       `${API_BASE_URL}/api/trips/${tripId}/create_stop/`,
       {
         method: "POST",
         body: JSON.stringify(stopData),
       }
     );
-    return response.data as Trip;
+    const state = getState() as RootState;
+    return tripFromResponse(tripId, response.data, state.trips.currentTrip);
   }
 );
 
 export const deleteStop = createAsyncThunk(
   "trip/deleteStop",
-  async ({ tripId, stopId }: { tripId: string; stopId: string }) => {
-    const response = await apiRequest(
+  async ({ tripId, stopId }: { tripId: string; stopId: string }, { getState }) => {
+    const response = await apiRequest<TripActionResponse>(
       `${API_BASE_URL}/api/trips/${tripId}/delete_stop/?stop_id=${stopId}`,
       {
         method: "DELETE",
       }
     );
-    return response.data as Trip;
+    const state = getState() as RootState;
+    return tripFromResponse(tripId, response.data, state.trips.currentTrip);
+  }
+);
+
+export const reorderStops = createAsyncThunk(
+  "trip/reorderStops",
+  async ({ tripId, stopIds }: { tripId: string; stopIds: string[] }, { getState }) => {
+    const response = await apiRequest<TripActionResponse>(
+      `${API_BASE_URL}/api/trips/${tripId}/reorder_stops/`,
+      {
+        method: "POST",
+        body: JSON.stringify({ stop_ids: stopIds }),
+      }
+    );
+    const state = getState() as RootState;
+    return tripFromResponse(tripId, response.data, state.trips.currentTrip);
   }
 );
 
 export const completeTrip = createAsyncThunk(
   "trip/completeTrip",
-  async (tripId: string) => {
-    const response = await apiRequest(
+  async (tripId: string, { getState }) => {
+    const response = await apiRequest<TripActionResponse>(
       `${API_BASE_URL}/api/trips/${tripId}/complete/`,
       {
         method: "POST",
       }
     );
-    return response.data as Trip;
+    const state = getState() as RootState;
+    return tripFromResponse(tripId, response.data, state.trips.currentTrip);
   }
 );
 
@@ -226,15 +295,16 @@ export const deleteTrip = createAsyncThunk(
 
 export const updateLocation = createAsyncThunk(
   "trip/updateLocation",
-  async ({ tripId, location }: { tripId: string; location: Location }) => {
-    const response = await apiRequest(
+  async ({ tripId, location }: { tripId: string; location: Location }, { getState }) => {
+    const response = await apiRequest<TripActionResponse>(
       `${API_BASE_URL}/api/trips/${tripId}/update_location/`,
       {
         method: "POST",
         body: JSON.stringify({ location }),
       }
     );
-    return response.data as Trip;
+    const state = getState() as RootState;
+    return tripFromResponse(tripId, response.data, state.trips.currentTrip);
   }
 );
 
@@ -274,18 +344,26 @@ const tripSlice = createSlice({
   },
   extraReducers: (builder) => {
     builder
-      .addCase(fetchTrips.pending, (state) => {
-        state.loading = true;
+      .addCase(fetchTrips.pending, (state, action) => {
+        if (action.meta.arg?.next) {
+          state.loadingMore = true;
+        } else {
+          state.loading = true;
+        }
         state.error = null;
       })
       .addCase(fetchTrips.fulfilled, (state, action) => {
         state.loading = false;
-        state.trips = action.payload.trips;
+        state.loadingMore = false;
+        state.trips = action.meta.arg?.next
+          ? [...state.trips, ...action.payload.trips]
+          : action.payload.trips;
         state.pagination = action.payload.pagination;
         state.error = null;
       })
       .addCase(fetchTrips.rejected, (state, action) => {
         state.loading = false;
+        state.loadingMore = false;
         state.error = action.error.message || "Failed to fetch trips";
         state.trips = [];
         state.pagination = {
@@ -381,6 +459,20 @@ const tripSlice = createSlice({
         state.loading = false;
         state.error = action.error.message || "Failed to delete stop";
       })
+      .addCase(reorderStops.pending, (state) => {
+        state.loading = true;
+        state.error = null;
+      })
+      .addCase(reorderStops.fulfilled, (state, action) => {
+        state.loading = false;
+        if (state.currentTrip) {
+          state.currentTrip = action.payload;
+        }
+      })
+      .addCase(reorderStops.rejected, (state, action) => {
+        state.loading = false;
+        state.error = action.error.message || "Failed to reorder stops";
+      })
       .addCase(completeTrip.fulfilled, (state, action) => {
         if (state.currentTrip) {
           state.currentTrip = action.payload;
@@ -17,7 +17,7 @@ export interface Stop {
   sequence: number;
   summary: string;
   status: "pending" | "in_progress" | "completed" | "skipped";
-  stop_type: "pickup" | "dropoff" | "rest" | "fuel";
+  stop_type: "pickup" | "dropoff" | "rest" | "break" | "fuel";
   arrival_time: string;
   duration_minutes: number;
   cycle_hours_at_stop: number;
@@ -66,7 +66,8 @@ export interface RouteLeg {
   distance: number;
   duration: number;
   summary: string;
-  steps: any[];
+  // Only present on routes fetched from the router; stored routes drop them
+  steps?: any[];
 }
 
 export interface Route {